@@ -1,23 +1,35 @@
 # app.py
 
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, render_template, request, jsonify, send_from_directory
-from routes.main_routes import MainRoutes
+from routes.main_routes import MainRoutes, StartupTimer
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Time spent importing the app modules (flask, faiss, numpy, routes), reported as the first startup phase
+IMPORT_MS = (time.perf_counter() - _import_started) * 1000
+
 class FlaskApp:
     def __init__(self):
+        # Startup report: duration of each phase in ms (printed once the routes are registered)
+        self.startup = StartupTimer()
+        self.startup.record('imports', IMPORT_MS)
         # Configure the Flask app with static and template folders
-        self.app = Flask(__name__,
-                         static_folder='static',
-                         template_folder='templates')
+        with self.startup.phase('flask'):
+            self.app = Flask(__name__,
+                             static_folder='static',
+                             template_folder='templates')
         # Configure the upload folder
         self.app.config['UPLOAD_FOLDER'] = os.path.join(self.app.root_path, 'uploads')
         self.register_routes()
+        self.app.config['STARTUP_TIMINGS'] = self.startup.phases
+        print(f"[Startup] {self.startup.report()}")
 
     def register_routes(self):
-        main_routes = MainRoutes(self.app)
+        main_routes = MainRoutes(self.app, startup=self.startup)
 
         # Home route
         self.app.add_url_rule('/', 'index', main_routes.index)
@@ -30,14 +42,25 @@ class FlaskApp:
 
         # Ask question route
         self.app.add_url_rule('/ask', 'ask', main_routes.ask, methods=['POST'])
+        # Same question, answer streamed as server-sent events while it is generated
+        self.app.add_url_rule('/ask_stream', 'ask_stream', main_routes.ask_stream, methods=['POST'])
 
         # Advanced Processing Route
         self.app.add_url_rule('/advanced_upload', 'advanced_upload', main_routes.advanced_upload, methods=['POST'])
 
+        # Ingestion job status (uploads return a job id)
+        self.app.add_url_rule('/jobs/<job_id>', 'get_job', main_routes.get_job, methods=['GET'])
+
         # Add processed documents route
         self.app.add_url_rule('/processed_documents', 'processed_documents', main_routes.get_processed_documents, methods=['GET'])
         # Update document display name (for recognizable labels in dropdown)
         self.app.add_url_rule('/update_document', 'update_document', main_routes.update_document, methods=['POST'])
+        # Delete a document (its vectors, chunks and metadata); large deletions trigger background compaction.
+        # path converter: ids are built from PDF titles, which may contain "/"
+        self.app.add_url_rule('/documents/<path:document_id>', 'delete_document', main_routes.delete_document, methods=['DELETE'])
+
+        # Cache hit/miss counters (per worker) for monitoring
+        self.app.add_url_rule('/cache_stats', 'cache_stats', main_routes.get_cache_stats, methods=['GET'])
 
     
     def run(self):
@@ -46,6 +69,7 @@ class FlaskApp:
 if __name__ == '__main__':
     app_instance = FlaskApp()
     app_instance.run()
-else:
-    # This makes it discoverable by `flask run`
+elif __name__ != '__mp_main__':
+    # This makes it discoverable by `flask run` (skipped when a PDF extraction process,
+    # see routes/pdf_extract.py, re-imports `python app.py` as its main module)
     app = FlaskApp().app
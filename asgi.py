@@ -0,0 +1,195 @@
+# asgi.py
+"""
+Async serving mode. The sync deployment (gunicorn app:app) holds one worker thread per request for
+the whole OpenAI round trip, so in-flight /ask calls are capped by the thread count. Here the two
+LLM-bound routes, POST /ask and POST /ask_stream, are native async handlers on the async OpenAI
+client: a request waiting on the API is only a suspended coroutine, so one process can hold
+hundreds of them. Everything else (/upload, which already returns a job id, /jobs, documents, pages)
+is passed to the unchanged Flask app in a worker thread.
+
+    uvicorn asgi:app --workers 4 --port 5000
+"""
+import json
+import sys
+import tempfile
+
+import anyio
+import anyio.from_thread
+import anyio.to_thread
+
+from app import app as flask_app
+
+# Request bodies (uploads) above this size are spooled to a temporary file instead of kept in memory
+ASGI_SPOOL_BYTES = 1024 * 1024
+
+
+class AsgiApp:
+    """ASGI application: async /ask and /ask_stream, every other request served by the Flask app."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # The MainRoutes instance behind the Flask views (shares its caches, vector store and job queue)
+        self.routes = flask_app.view_functions['ask'].__self__
+        self.handlers = {('POST', '/ask'): self.ask, ('POST', '/ask_stream'): self.ask_stream}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            handler = self.handlers.get((scope['method'], scope['path']), self.wsgi)
+            await handler(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        # The Flask app is built at import time; nothing to start or stop
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def ask(self, scope, receive, send):
+        data, error = await read_json(receive)
+        if error:
+            payload, status = {'error': error}, 400
+        else:
+            payload, status = await self.routes.ask_async(data)
+        await send_json(send, payload, status)
+
+    async def ask_stream(self, scope, receive, send):
+        """See MainRoutes.ask_stream for the event format."""
+        data, error = await read_json(receive)
+        if error:
+            await send_json(send, {'error': error}, 400)
+            return
+        try:
+            prepared, error = await self.routes.prepare_answer_async(data)
+        except Exception as e:
+            err_msg = str(e)
+            self.routes._log_ask_failure('/ask_stream', err_msg)
+            await send_json(send, {'error': err_msg}, 500)
+            return
+        if error:
+            await send_json(send, {'error': error[0]}, error[1])
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        async with anyio.create_task_group() as tasks:
+            # Stop generating (and close the OpenAI stream) as soon as the browser goes away
+            async def cancel_on_disconnect():
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+                tasks.cancel_scope.cancel()
+            tasks.start_soon(cancel_on_disconnect)
+
+            async for event in self.routes.ask_stream_events_async(prepared):
+                await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            tasks.cancel_scope.cancel()
+
+    async def wsgi(self, scope, receive, send):
+        """Serves the request with the Flask app in a worker thread, streaming its response back."""
+        body = tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES)
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def emit(chunk, more_body):
+            if 'started' not in response:
+                response['started'] = True
+                anyio.from_thread.run(send, {'type': 'http.response.start', 'status': response['status'],
+                                             'headers': response['headers']})
+            anyio.from_thread.run(send, {'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+        def serve():
+            # One thread for the whole response: Flask's request context is pushed and popped in it
+            result = self.flask_app(wsgi_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        emit(chunk, True)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            emit(b'', False)
+
+        try:
+            await anyio.to_thread.run_sync(serve)
+        finally:
+            body.close()
+
+
+async def read_json(receive):
+    """
+    Reads the request body as a JSON object.
+
+    Returns:
+        Tuple[dict|None, str|None]: (data, None), or (None, error message) for a missing or invalid body.
+    """
+    chunks, more_body = [], True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    try:
+        data = json.loads(b''.join(chunks) or b'null')
+    except ValueError:
+        return None, 'Invalid JSON body'
+    if not isinstance(data, dict):
+        return None, 'Request body must be a JSON object'
+    return data, None
+
+
+async def send_json(send, payload, status):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope; body is the (seekable) request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+# This makes it discoverable by `uvicorn asgi:app`
+app = AsgiApp(flask_app)
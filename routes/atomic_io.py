@@ -0,0 +1,86 @@
+# routes/atomic_io.py
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+def atomic_write(path, write_fn, mode='wb'):
+    """
+    Writes a file atomically: write_fn(f) fills a temp file in the same directory,
+    which is fsynced and then os.replace()d over path. Readers see the old or new file, never half of one.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, mode) as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_many(items):
+    """
+    Commits several files together. Every (path, write_fn) in items is first written and fsynced
+    to a temp file; only when all of them succeeded are they os.replace()d in the given order.
+    A failure while staging leaves every target untouched.
+    """
+    staged = []
+    try:
+        for path, write_fn in items:
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            staged.append((tmp_path, path))
+            with open(tmp_path, 'wb') as f:
+                write_fn(f)
+                f.flush()
+                os.fsync(f.fileno())
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path, _ in staged:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class WriterLock:
+    """
+    Single-writer lock for DATA_DIR, shared by the threads of a worker (threading.RLock) and by
+    all worker processes (fcntl.flock on a lock file). Reentrant within a thread, so a locked
+    operation can call other locked operations. Without fcntl (non-POSIX) only threads are serialised.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+        return False
@@ -0,0 +1,207 @@
+# routes/cache.py
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text):
+    """Cache-key form of user text: trimmed, whitespace collapsed, case-folded."""
+    return re.sub(r'\s+', ' ', text or '').strip().casefold()
+
+
+# How often (seconds) each process deletes expired rows and trims a shared tier to its row cap
+SQLITE_TIER_PURGE_INTERVAL = 60
+
+
+class SqliteTier:
+    """
+    Shared on-disk key/value tier (one SQLite file in DATA_DIR) so every gunicorn worker sees
+    entries written by the others. Values are bytes; expires_at of None never expires.
+    The table is bounded: expired rows are deleted and, past max_rows, the least recently used
+    rows go, at most every SQLITE_TIER_PURGE_INTERVAL seconds per process (on a write).
+    """
+
+    def __init__(self, db_path, table, max_rows=None):
+        self.db_path = db_path
+        self.table = table
+        self.max_rows = max_rows
+        self._next_purge = 0.0
+        with self._connect() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB, expires_at REAL, last_used REAL)')
+            # Files created before the row cap lack last_used; their rows are trimmed first
+            if 'last_used' not in [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN last_used REAL')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, key):
+        """Returns (value, expires_at), or None if missing or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                return None
+            conn.execute(f'UPDATE {self.table} SET last_used = ? WHERE key = ?', (now, key))
+        return row[0], row[1]
+
+    def set(self, key, value, expires_at=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                         (key, value, expires_at, now))
+        if now >= self._next_purge:
+            self._next_purge = now + SQLITE_TIER_PURGE_INTERVAL
+            self.purge()
+
+    def purge(self):
+        """Deletes expired rows, then the least recently used ones beyond max_rows. Returns rows deleted."""
+        with self._connect() as conn:
+            deleted = conn.execute(f'DELETE FROM {self.table} WHERE expires_at < ?', (time.time(),)).rowcount
+            if self.max_rows:
+                deleted += conn.execute(
+                    f'DELETE FROM {self.table} WHERE key IN '
+                    f'(SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_rows,)
+                ).rowcount
+        return deleted
+
+
+class TieredCache:
+    """
+    In-memory LRU (bounded to max_entries, optional TTL in seconds) in front of an optional
+    shared SQLite tier (bounded to max_disk_entries rows). Subclasses define the key and how
+    values are stored as bytes on disk.
+    """
+    table = 'cache'
+
+    def __init__(self, max_entries=1024, db_path=None, ttl=None, max_disk_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.disk = SqliteTier(db_path, self.table, max_rows=max_disk_entries) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _encode(self, value):
+        raise NotImplementedError
+
+    def _decode(self, blob):
+        raise NotImplementedError
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at >= time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except Exception as e:
+                print(f"Error reading {self.table} cache: {e}")
+                row = None
+            if row is not None:
+                value = self._decode(row[0])
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value, row[1])
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._remember(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, self._encode(value), expires_at)
+            except Exception as e:
+                print(f"Error writing {self.table} cache: {e}")
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'shared_tier': self.disk is not None,
+                'max_disk_entries': self.disk.max_rows if self.disk is not None else None,
+            }
+
+
+class EmbeddingCache(TieredCache):
+    """Query-embedding cache in front of the Embeddings API, keyed on model + normalised text."""
+    table = 'embeddings'
+
+    @staticmethod
+    def key(text, model):
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _encode(self, value):
+        return value.tobytes()
+
+    def _decode(self, blob):
+        return np.frombuffer(blob, dtype='float32')
+
+    def get(self, text, model):
+        """Returns the cached float32 vector, or None (counted as a miss)."""
+        return self._get(self.key(text, model))
+
+    def put(self, text, model, embedding):
+        self._put(self.key(text, model), np.asarray(embedding, dtype='float32'))
+
+
+class AnswerCache(TieredCache):
+    """
+    Chat-completion answers keyed on (model, document, the document's chunk ids, the ordered
+    retrieved vector ids, normalised question). Any change to the document's chunks changes the key,
+    so stale answers are never served; ttl bounds how long an answer is reused at all.
+    """
+    table = 'answers'
+
+    @staticmethod
+    def key(model, document_id, document_chunk_ids, retrieved_ids, question):
+        chunk_digest = hashlib.sha256(np.asarray(document_chunk_ids, dtype='int64').tobytes()).hexdigest()
+        payload = json.dumps([model, document_id, chunk_digest, [int(i) for i in retrieved_ids], normalize_text(question)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _encode(self, value):
+        return value.encode('utf-8')
+
+    def _decode(self, blob):
+        return blob.decode('utf-8') if isinstance(blob, bytes) else blob
+
+    def get(self, key):
+        return self._get(key)
+
+    def put(self, key, answer):
+        self._put(key, answer)
@@ -0,0 +1,375 @@
+# routes/chunk_store.py
+
+import json
+import mmap
+import os
+import pickle
+
+import numpy as np
+
+# One fixed-width record per vector id (record i describes vector id i):
+# where its text lives in the blob, how long it is, and which document it belongs to.
+RECORD_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('doc', '<i4')])
+NO_DOCUMENT = -1   # chunk not tied to a document
+MISSING = -2       # no chunk with this vector id (never written, rolled back or deleted)
+
+# The index file starts with MAGIC + the blob generation (uint64). Compaction writes the live texts to
+# the next generation's blob and swaps the index in one rename, so a reader always maps a matching pair.
+# Index files without the header (written before compaction existed) are generation 0.
+MAGIC = b'CHUNKS\x00\x01'
+HEADER = np.dtype([('magic', 'S8'), ('generation', '<u8')])
+
+
+class ChunkStore:
+    """
+    Chunk texts for one index partition, stored as three files in DATA_DIR:
+      chunks{suffix}.bin   append-only UTF-8 text blob (chunks{suffix}.<generation>.bin after compaction)
+      chunks{suffix}.idx   header, then a RECORD_DTYPE array indexed by vector id
+      chunks{suffix}.docs  document table, one JSON-encoded document_id per line (slot = line number)
+    Both data files are opened with mmap, so every worker shares the same pages through the OS cache,
+    lookups by vector id are a slice of the mapping, and appends cost O(chunk) instead of rewriting
+    a whole pickle. Behaves like a read-only {vector_id: text} dict.
+    """
+
+    def __init__(self, data_dir, suffix=''):
+        self.data_dir = data_dir
+        self.suffix = suffix
+        self.idx_path = os.path.join(data_dir, f'chunks{suffix}.idx')
+        self.docs_path = os.path.join(data_dir, f'chunks{suffix}.docs')
+        self.generation = 0
+        self.header_size = 0
+        self.blob_path = self._blob_path(0)
+        self._mapped = (np.zeros(0, dtype=RECORD_DTYPE), None)
+        self.documents = []
+        self._doc_slots = {}
+        self._live = 0
+        self.refresh()
+
+    # ---- loading -------------------------------------------------------------------------------
+
+    def _blob_path(self, generation):
+        name = f'chunks{self.suffix}.bin' if generation == 0 else f'chunks{self.suffix}.{generation}.bin'
+        return os.path.join(self.data_dir, name)
+
+    def refresh(self):
+        """(Re)maps the files so appends (and compactions) made by other workers become visible."""
+        for attempt in range(3):
+            try:
+                return self._map()
+            except FileNotFoundError:
+                # A compaction replaced the index and removed the blob between our two opens; map the new pair
+                if attempt == 2:
+                    raise
+
+    def _map(self):
+        generation, header_size = 0, 0
+        records, blob = np.zeros(0, dtype=RECORD_DTYPE), None
+        # Index before blob: every record we can see has its text already written
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, 'rb') as f:
+                if f.read(len(MAGIC)) == MAGIC:
+                    header_size = HEADER.itemsize
+                    generation = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+                n_records = (os.fstat(f.fileno()).st_size - header_size) // RECORD_DTYPE.itemsize
+                if n_records > 0:
+                    idx_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    records = np.frombuffer(idx_map, dtype=RECORD_DTYPE, count=n_records, offset=header_size)
+        blob_path = self._blob_path(generation)
+        try:
+            with open(blob_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size > 0:
+                    blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            if len(records):
+                raise
+        documents = []
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path, 'r', encoding='utf-8') as f:
+                documents = [json.loads(line) for line in f if line.endswith('\n')]
+        # Publish records and blob together: threads reading concurrently see the old pair or the new one.
+        # Old mappings are not closed; they are released once no reader holds them.
+        self._mapped = (records, blob)
+        self.generation, self.header_size, self.blob_path = generation, header_size, blob_path
+        self.documents = documents
+        self._doc_slots = {document_id: slot for slot, document_id in enumerate(documents)}
+        self._live = int(np.count_nonzero(records['doc'] != MISSING))
+
+    @property
+    def records(self):
+        return self._mapped[0]
+
+    def exists(self):
+        return os.path.exists(self.idx_path)
+
+    # ---- dict-like read API --------------------------------------------------------------------
+
+    @property
+    def next_id(self):
+        """The vector id the next appended chunk will get (ids are never reused)."""
+        return len(self.records)
+
+    def __len__(self):
+        return self._live
+
+    def __bool__(self):
+        return self._live > 0
+
+    def __contains__(self, vector_id):
+        records = self.records
+        return 0 <= vector_id < len(records) and records['doc'][vector_id] != MISSING
+
+    def view(self, vector_id):
+        """Zero-copy memoryview of the chunk's UTF-8 bytes inside the mapped blob."""
+        records, blob = self._mapped
+        if not (0 <= vector_id < len(records)) or records['doc'][vector_id] == MISSING:
+            raise KeyError(vector_id)
+        start, length = int(records['offset'][vector_id]), int(records['length'][vector_id])
+        return memoryview(blob)[start:start + length] if length else memoryview(b'')
+
+    def __getitem__(self, vector_id):
+        return str(self.view(vector_id), 'utf-8')
+
+    def get(self, vector_id, default=None):
+        return self[vector_id] if vector_id in self else default
+
+    def keys(self):
+        return np.flatnonzero(self.records['doc'] != MISSING).tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other)
+
+    def items(self):
+        for vector_id in self.keys():
+            yield vector_id, self[vector_id]
+
+    def document_of(self, vector_id):
+        """document_id the vector belongs to, or None."""
+        if vector_id not in self:
+            return None
+        slot = int(self.records['doc'][vector_id])
+        return self.documents[slot] if slot >= 0 else None
+
+    def document_items(self):
+        """(vector_id, document_id) for every chunk tied to a document."""
+        docs = self.records['doc']
+        for vector_id in np.flatnonzero(docs >= 0).tolist():
+            yield vector_id, self.documents[int(docs[vector_id])]
+
+    # ---- writes --------------------------------------------------------------------------------
+
+    def append(self, texts, document_id=None, first_id=None):
+        """
+        Appends chunks and returns their vector ids (int64 array). The text is written and fsynced
+        before the index records, so a crash never leaves a record pointing at missing text; the
+        index append is the commit point. first_id may skip ahead (gaps are recorded as MISSING).
+
+        The index file's length is the global vector id allocator: ids continue from the record count
+        on disk, never from this worker's view of it. Call under the DATA_DIR writer lock (see
+        routes/atomic_io.WriterLock) so concurrent workers never hand out the same id.
+        """
+        self.refresh()  # append after other workers' appends, into the current blob generation
+        first_id = self.next_id if first_id is None else first_id
+        if first_id < self.next_id:
+            raise ValueError(f"vector id {first_id} already allocated (next is {self.next_id})")
+        slot = self._document_slot(document_id)
+        blob_size = os.path.getsize(self.blob_path) if os.path.exists(self.blob_path) else 0
+        encoded = [text.encode('utf-8') for text in texts]
+        with open(self.blob_path, 'ab') as f:
+            for data in encoded:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        records = np.zeros(first_id - self.next_id + len(encoded), dtype=RECORD_DTYPE)
+        records['doc'][:first_id - self.next_id] = MISSING
+        new = records[first_id - self.next_id:]
+        lengths = np.array([len(data) for data in encoded], dtype='uint64')
+        new['offset'] = blob_size + np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype('uint64')
+        new['length'] = lengths
+        new['doc'] = slot
+        self._append_records(records)
+        self.refresh()
+        return np.arange(first_id, first_id + len(encoded), dtype='int64')
+
+    def _append_records(self, records):
+        with open(self.idx_path, 'ab') as f:
+            size = f.tell()
+            if size == 0:
+                f.write(self._header(self.generation))
+            elif (size - self.header_size) % RECORD_DTYPE.itemsize:
+                # Drop a torn trailing record left by a crash mid-append
+                f.truncate(size - (size - self.header_size) % RECORD_DTYPE.itemsize)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _document_slot(self, document_id):
+        if document_id is None:
+            return NO_DOCUMENT
+        if document_id not in self._doc_slots:
+            with open(self.docs_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(document_id) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._doc_slots[document_id] = len(self.documents)
+            self.documents.append(document_id)
+        return self._doc_slots[document_id]
+
+    def assign_documents(self, assignments):
+        """Ties existing chunks to documents in place ({vector_id: document_id}), e.g. for legacy backfills."""
+        if not assignments:
+            return
+        self.refresh()
+        self._write_doc_fields({vector_id: self._document_slot(document_id) for vector_id, document_id in assignments.items()})
+
+    def discard(self, vector_ids):
+        """
+        Marks chunks MISSING in place (e.g. undo of an append whose index write failed). Records and
+        blob bytes are never truncated, so other workers' mappings stay valid and ids are not reused.
+        """
+        self.refresh()
+        vector_ids = [int(vector_id) for vector_id in vector_ids if 0 <= vector_id < self.next_id]
+        if not vector_ids:
+            return
+        self._write_doc_fields({vector_id: MISSING for vector_id in vector_ids})
+
+    def _write_doc_fields(self, slots):
+        with open(self.idx_path, 'r+b') as f:
+            for vector_id, slot in slots.items():
+                f.seek(self.header_size + vector_id * RECORD_DTYPE.itemsize + RECORD_DTYPE.fields['doc'][1])
+                f.write(np.array([slot], dtype='<i4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.refresh()
+
+    @staticmethod
+    def _header(generation):
+        return np.array([(MAGIC, generation)], dtype=HEADER).tobytes()
+
+    def _replace_index(self, records, generation):
+        """Atomically replaces the index file (header + records) and remaps."""
+        tmp_path = f'{self.idx_path}.tmp.{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header(generation))
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.idx_path)
+        self.refresh()
+
+    def stats(self):
+        """Live vs. allocated records and live vs. total blob bytes (what compaction would reclaim)."""
+        records, blob = self._mapped
+        live = records['doc'] != MISSING
+        return {
+            'records': int(len(records)),
+            'live_records': int(np.count_nonzero(live)),
+            'blob_bytes': len(blob) if blob is not None else 0,
+            'live_bytes': int(records['length'][live].sum()),
+        }
+
+    def compact(self):
+        """
+        Rewrites the blob with only live chunks (next generation file), then swaps in an index with
+        the new offsets in one rename and removes the old blob. Vector ids do not change: dead ids stay
+        as MISSING records (16 bytes each), so FAISS ids, document indexes and next_id remain valid.
+        Workers that still map the old pair keep reading it until they refresh.
+
+        Returns:
+            int: Blob bytes reclaimed.
+        """
+        self.refresh()
+        before = self.stats()['blob_bytes']
+        old_blob_path = self.blob_path
+        generation = self.generation + 1
+        new_blob_path = self._blob_path(generation)
+        records = self.records.copy()
+        live = np.flatnonzero(records['doc'] != MISSING)
+        records['offset'][records['doc'] == MISSING] = 0
+        records['length'][records['doc'] == MISSING] = 0
+        offset = 0
+        with open(new_blob_path, 'wb') as blob:
+            for vector_id in live.tolist():
+                data = self.view(vector_id)
+                blob.write(data)
+                records['offset'][vector_id] = offset
+                offset += len(data)
+                data.release()
+            blob.flush()
+            os.fsync(blob.fileno())
+        self._replace_index(records, generation)
+        if os.path.exists(old_blob_path):
+            os.remove(old_blob_path)
+        return before - offset
+
+    # ---- migration -----------------------------------------------------------------------------
+
+    def import_pickles(self, text_pickle, document_pickle=None):
+        """
+        One-time import of legacy id_to_text / id_to_document_id pickles into an empty store.
+        Blob and document table are written first and the index is renamed into place last,
+        so an interrupted import is simply redone on the next start.
+        """
+        with open(text_pickle, 'rb') as f:
+            id_to_text = pickle.load(f)
+        id_to_document_id = {}
+        if document_pickle and os.path.exists(document_pickle):
+            with open(document_pickle, 'rb') as f:
+                id_to_document_id = pickle.load(f)
+
+        n_records = max(id_to_text) + 1 if id_to_text else 0
+        records = np.zeros(n_records, dtype=RECORD_DTYPE)
+        records['doc'] = MISSING
+        documents, doc_slots, offset = [], {}, 0
+        with open(self.blob_path, 'wb') as blob:
+            for vector_id in sorted(id_to_text):
+                data = (id_to_text[vector_id] or '').encode('utf-8')
+                blob.write(data)
+                document_id = id_to_document_id.get(vector_id)
+                if document_id is not None and document_id not in doc_slots:
+                    doc_slots[document_id] = len(documents)
+                    documents.append(document_id)
+                records[vector_id] = (offset, len(data), doc_slots[document_id] if document_id is not None else NO_DOCUMENT)
+                offset += len(data)
+            blob.flush()
+            os.fsync(blob.fileno())
+        with open(self.docs_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(document_id) + '\n' for document_id in documents)
+            f.flush()
+            os.fsync(f.fileno())
+        self._replace_index(records, 0)
+        print(f"Imported {len(id_to_text)} chunk(s) from {os.path.basename(text_pickle)} into {os.path.basename(self.idx_path)}")
+
+
+class DocumentView:
+    """Read-only {vector_id: document_id} view of a ChunkStore (replaces id_to_document_id*.pkl)."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def items(self):
+        return self.store.document_items()
+
+    def get(self, vector_id, default=None):
+        document_id = self.store.document_of(vector_id)
+        return default if document_id is None else document_id
+
+    def __getitem__(self, vector_id):
+        document_id = self.store.document_of(vector_id)
+        if document_id is None:
+            raise KeyError(vector_id)
+        return document_id
+
+    def __contains__(self, vector_id):
+        return self.store.document_of(vector_id) is not None
+
+    def __len__(self):
+        return int(np.count_nonzero(self.store.records['doc'] >= 0))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other)
@@ -0,0 +1,199 @@
+# routes/document_links.py
+#
+# Offline linking of legacy chunks (stored before chunks carried a document_id) to processed documents,
+# used by scripts/backfill_document_links.py. Every document contributes up to three patterns (its title,
+# the first part of its document_id and its filename stem); one Aho–Corasick pass over each chunk finds
+# all patterns it contains, instead of testing every document against every chunk.
+
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from routes.atomic_io import atomic_write
+from routes.chunk_store import NO_DOCUMENT
+
+try:
+    import ahocorasick  # pyahocorasick: same automaton in C, much faster on large corpora
+except ImportError:
+    ahocorasick = None
+
+# Pattern kinds, strongest first: a chunk goes to the documents matched by the strongest kind it contains.
+PATTERN_KINDS = ('title', 'id_prefix', 'filename')
+# Shorter patterns (single letters, 'a', 'doc') match almost every chunk
+BACKFILL_MIN_PATTERN_LENGTH = int(os.environ.get('BACKFILL_MIN_PATTERN_LENGTH', 3))
+BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 20000))
+
+
+class PatternMatcher:
+    """Aho–Corasick automaton over a fixed set of strings: find(text) returns every one that occurs in text."""
+
+    def __init__(self, patterns):
+        patterns = [pattern for pattern in set(patterns) if pattern]
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for pattern in patterns:
+                self._automaton.add_word(pattern, pattern)
+            if patterns:
+                self._automaton.make_automaton()
+            return
+        self._automaton = None
+        # Trie of patterns: per state, its transitions, failure link and the patterns ending there
+        self._goto, self._fail, self._out = [{}], [0], [[]]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append(pattern)
+        # Breadth-first failure links; each state also inherits the outputs of its failure state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    @property
+    def engine(self):
+        return 'pyahocorasick' if self._automaton is not None else 'python'
+
+    def find(self, text):
+        if self._automaton is not None:
+            if not len(self._automaton):
+                return set()
+            return {pattern for _, pattern in self._automaton.iter(text)}
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+def document_patterns(documents, min_length=BACKFILL_MIN_PATTERN_LENGTH):
+    """
+    {pattern: {document_id: kind rank}} for processed documents (rank indexes PATTERN_KINDS, lower is
+    stronger): the title, the document_id up to its first '-', and the filename without extension.
+    """
+    patterns = {}
+    for doc in documents:
+        document_id = doc.get('id')
+        if not document_id:
+            continue
+        filename = doc.get('filename') or ''
+        candidates = (
+            doc.get('title') or '',
+            document_id.split('-')[0],
+            os.path.splitext(filename)[0] if filename and filename != 'unknown' else '',
+        )
+        for rank, pattern in enumerate(candidates):
+            if len(pattern) < min_length:
+                continue
+            ranks = patterns.setdefault(pattern, {})
+            ranks[document_id] = min(rank, ranks.get(document_id, rank))
+    return patterns
+
+
+def resolve(found, patterns):
+    """
+    Picks the document for a chunk from the patterns found in it. Returns (document_id or None,
+    candidates, kind): candidates are the documents matched by the strongest kind present, and the
+    chunk is linked only if there is exactly one (otherwise it is reported as ambiguous).
+    """
+    best = {}
+    for pattern in found:
+        for document_id, rank in patterns[pattern].items():
+            best[document_id] = min(rank, best.get(document_id, rank))
+    if not best:
+        return None, [], None
+    top = min(best.values())
+    candidates = sorted(document_id for document_id, rank in best.items() if rank == top)
+    return (candidates[0] if len(candidates) == 1 else None), candidates, PATTERN_KINDS[top]
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def backfill_partition(vectors, name, documents, state_path, report_path=None, batch_size=BACKFILL_BATCH_SIZE,
+                       min_length=BACKFILL_MIN_PATTERN_LENGTH, dry_run=False):
+    """
+    Links a partition's unlinked chunks to documents in batches of vector ids. After each batch the
+    links are committed (VectorStore.assign_documents) and the position is saved to state_path, so an
+    interrupted run resumes where it stopped; chunks that already have a document are never touched.
+    Ambiguous matches are appended to report_path as JSON lines.
+
+    Args:
+        vectors (VectorStore): Store holding the partition.
+        name (str): Partition name.
+        documents (Iterable[dict]): processed_documents entries of this partition's processing mode.
+        state_path (str): JSON file recording progress per partition.
+        report_path (str, optional): JSONL file receiving {vector_id, kind, candidates} per ambiguous chunk.
+        batch_size (int): Vector ids per committed batch.
+        min_length (int): Shortest title / prefix / filename pattern used.
+        dry_run (bool): Count links without writing anything.
+
+    Returns:
+        dict: Progress for the partition (next_id, linked, ambiguous, unmatched, done, engine).
+    """
+    state = load_state(state_path)
+    progress = {'next_id': 0, 'linked': 0, 'ambiguous': 0, 'unmatched': 0, 'done': False}
+    if not dry_run:
+        progress.update(state.get(name) or {})
+    patterns = document_patterns(documents, min_length)
+    matcher = PatternMatcher(patterns)
+    progress['engine'] = matcher.engine
+    partition = vectors[name]
+    chunks = partition.chunks
+    end = chunks.next_id
+    if not patterns:
+        print(f"[Backfill] {name}: no document titles, id prefixes or filenames to match.")
+    start = progress['next_id']
+    while start < end:
+        stop = min(start + batch_size, end)
+        doc_field = chunks.records['doc'][start:stop]
+        assignments, ambiguous = {}, []
+        for vector_id in (np.flatnonzero(doc_field == NO_DOCUMENT) + start).tolist():
+            document_id, candidates, kind = resolve(matcher.find(chunks[vector_id]), patterns)
+            if document_id is not None:
+                assignments[vector_id] = document_id
+            elif candidates:
+                ambiguous.append({'vector_id': vector_id, 'kind': kind, 'candidates': candidates})
+            else:
+                progress['unmatched'] += 1
+        progress['linked'] += len(assignments)
+        progress['ambiguous'] += len(ambiguous)
+        progress['next_id'] = stop
+        if not dry_run:
+            if assignments:
+                vectors.assign_documents(name, assignments)
+            if report_path and ambiguous:
+                with open(report_path, 'a', encoding='utf-8') as f:
+                    for entry in ambiguous:
+                        f.write(json.dumps(dict(entry, partition=name)) + '\n')
+            state[name] = progress
+            atomic_write(state_path, lambda f: json.dump(state, f), mode='w')
+        print(f"[Backfill] {name}: ids {start}-{stop - 1} -> {len(assignments)} linked, {len(ambiguous)} ambiguous")
+        start = stop
+    progress['done'] = True
+    if not dry_run:
+        state[name] = progress
+        atomic_write(state_path, lambda f: json.dump(state, f), mode='w')
+    return progress
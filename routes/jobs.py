@@ -0,0 +1,141 @@
+# routes/jobs.py
+
+import json
+import os
+import sqlite3
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Queued/running jobs are reported as failed once the worker process that owns them is gone (crash,
+# restart, OOM kill) or they are older than INGEST_JOB_TIMEOUT seconds, so clients stop polling.
+INGEST_JOB_TIMEOUT = float(os.environ.get('INGEST_JOB_TIMEOUT', 3600))
+
+
+def _process_exists(pid):
+    """Whether a process with this pid is running on this host (jobs.db is shared by local workers only)."""
+    if not pid or os.name == 'nt':  # os.kill(pid, 0) would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to another user
+    return True
+
+
+class JobQueue:
+    """
+    In-process worker pool for ingestion jobs (PDF extraction, summarisation, embedding).
+    Jobs run on this worker's threads, but their status lives in a SQLite file in DATA_DIR,
+    so /jobs/<id> can be answered by any gunicorn worker.
+    """
+
+    def __init__(self, db_path, max_workers=2):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    status TEXT,
+                    phase TEXT,
+                    progress REAL,
+                    result TEXT,
+                    error TEXT,
+                    pid INTEGER,
+                    created REAL,
+                    updated REAL
+                )"""
+            )
+            unfinished = conn.execute("SELECT id, pid, created FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        # Jobs of workers that died before this one started will never finish
+        for job_id, pid, created in unfinished:
+            self._fail_if_stale(job_id, pid, created)
+
+    def _connect(self):
+        # Short-lived connections: safe across threads and processes; WAL lets readers run during writes.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queues fn(*args, progress=callback, **kwargs) and returns the new job id immediately.
+        fn reports progress via callback(phase, fraction) and returns a JSON-serialisable result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, phase, progress, pid, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, 'queued', 'queued', 0.0, os.getpid(), now, now)
+            )
+        self.executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._set(job_id, status='running')
+        try:
+            result = fn(*args, progress=lambda phase, fraction: self.update(job_id, phase, fraction), **kwargs)
+            self._set(job_id, status='done', phase='done', progress=1.0, result=json.dumps(result))
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {e}")
+            traceback.print_exc()
+            self._set(job_id, status='failed', error=str(e))
+
+    def update(self, job_id, phase, progress):
+        """Records the current phase (extract/chunk/summarize/embed/persist) and overall progress (0-1)."""
+        self._set(job_id, phase=phase, progress=round(float(progress), 3))
+
+    def _set(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        try:
+            with self._connect() as conn:
+                conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+        except Exception as e:
+            print(f"Error updating job {job_id}: {e}")
+
+    def _fail_if_stale(self, job_id, pid, created):
+        """
+        Marks an unfinished job failed if its worker process is gone or it passed INGEST_JOB_TIMEOUT.
+        Only a row that is still queued/running is changed, so a job finishing meanwhile keeps its result.
+
+        Returns:
+            str|None: The error recorded, or None if the job is not stale.
+        """
+        if not _process_exists(pid):
+            error = f'The worker processing this job (pid {pid}) exited before it finished; please upload the file again.'
+        elif created and time.time() - created > INGEST_JOB_TIMEOUT:
+            error = f'The job did not finish within {INGEST_JOB_TIMEOUT:g} seconds.'
+        else:
+            return None
+        try:
+            with self._connect() as conn:
+                changed = conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+                    (error, time.time(), job_id)
+                ).rowcount
+        except Exception as e:
+            print(f"Error updating job {job_id}: {e}")
+            return None
+        return error if changed else None
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if the id is unknown."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['status'] in ('queued', 'running'):
+            error = self._fail_if_stale(job_id, job['pid'], job['created'])
+            if error:
+                job.update(status='failed', error=error)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
@@ -1,28 +1,164 @@
 # routes/main_routes.py
 
+import contextlib
 import datetime
-from flask import render_template, request, jsonify
+from flask import Response, render_template, request, jsonify, stream_with_context
 import os
 from werkzeug.utils import secure_filename
-from PyPDF2 import PdfReader
+import anyio.to_thread
 import tiktoken
 import faiss
 import numpy as np
-import pickle
 from dotenv import load_dotenv
 load_dotenv()
-from promptlayer import PromptLayer
-promptlayer_client = PromptLayer()
-OpenAI = promptlayer_client.openai.OpenAI
-client = OpenAI()
 
 import re
 import json
 import sys
+import threading
+import time
 import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from routes.atomic_io import WriterLock, atomic_write
+from routes.cache import AnswerCache, EmbeddingCache
+from routes.jobs import JobQueue
+from routes import openai_client
+from routes.openai_client import async_client, client
+from routes.rate_limit import RateLimiter
+from routes.pdf_extract import PdfReader, iter_page_texts
+from routes.vector_index import build_index
+from routes.vector_store import PARTITIONS, VectorStore, search_index
 
 SAFE_FILENAME_REGEX = re.compile(r'^[\w\-. ]+$')  # Letters, numbers, dash, underscore, dot, space
 
+# Generation manifest in DATA_DIR: one version per artefact so workers only reload what changed.
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_ARTEFACTS = ('documents',) + PARTITIONS
+
+CHAT_MODEL = 'gpt-3.5-turbo'
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+ANSWER_ERROR_MESSAGE = "Sorry, an error occurred while generating the answer."
+# Completion length of every chat call; counted with the prompt against the tokens/min budget
+CHAT_MAX_TOKENS = 500
+
+# Embeddings API batching: max inputs per request and max total tokens per request.
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 100))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get('EMBEDDING_BATCH_MAX_TOKENS', 100000))
+
+# Query embeddings: in-memory LRU entries per worker, plus a SQLite tier shared by all workers
+# (least recently used rows beyond QUERY_EMBEDDING_CACHE_DISK_SIZE are deleted; ~6 KB each).
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 1024))
+QUERY_EMBEDDING_CACHE_SHARED = os.environ.get('QUERY_EMBEDDING_CACHE_SHARED', '1') != '0'
+QUERY_EMBEDDING_CACHE_DISK_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_DISK_SIZE', 20000))
+
+# Answers: reused for ANSWER_CACHE_TTL seconds while the document's chunks and retrieved contexts are unchanged.
+# The shared tier has its own switch and row cap; expired answers are deleted from it.
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', 512))
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_SHARED = os.environ.get('ANSWER_CACHE_SHARED', '1') != '0'
+ANSWER_CACHE_DISK_SIZE = int(os.environ.get('ANSWER_CACHE_DISK_SIZE', 20000))
+
+# Large simple uploads: parallel chat completions in the map phase, per-call timeout (seconds),
+# and the largest input the reduce step sends in one call before summarising hierarchically.
+SUMMARY_CONCURRENCY = int(os.environ.get('SUMMARY_CONCURRENCY', 4))
+SUMMARY_TIMEOUT = float(os.environ.get('SUMMARY_TIMEOUT', 60))
+SUMMARY_REDUCE_MAX_TOKENS = int(os.environ.get('SUMMARY_REDUCE_MAX_TOKENS', 3000))
+
+# Uploads are processed by a background job queue (INGEST_WORKERS threads per web worker) and
+# return a job id immediately. Set INGEST_ASYNC=0 to process inside the request as before.
+INGEST_ASYNC = os.environ.get('INGEST_ASYNC', '1') != '0'
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+
+# After a deletion, a background job compacts the partition once deleted chunks hold this share of its text.
+COMPACTION_DEAD_RATIO = float(os.environ.get('COMPACTION_DEAD_RATIO', 0.25))
+
+
+def sse_event(payload, event=None):
+    """One server-sent event: an optional `event:` line and the JSON payload as its `data:` line."""
+    return (f"event: {event}\n" if event else '') + f"data: {json.dumps(payload)}\n\n"
+
+
+class StartupTimer:
+    """Wall-clock duration (ms) of each startup phase, for the startup report."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def record(self, name, ms):
+        self.phases[name] = round(ms, 1)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def report(self):
+        total = sum(self.phases.values())
+        return ', '.join(f"{name} {ms:.1f} ms" for name, ms in self.phases.items()) + f" (total {total:.1f} ms)"
+
+
+# Tokenisation: one tiktoken encoding (and per-token byte lengths) per process, built on first use.
+_encoding = None
+_token_byte_lengths = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """Returns the shared gpt-3.5-turbo tiktoken encoding, creating it on first use."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+    return _encoding
+
+
+def get_token_byte_lengths():
+    """Returns an int64 array mapping token id -> length in bytes of its UTF-8 text (0 for unused ids)."""
+    global _token_byte_lengths
+    if _token_byte_lengths is None:
+        encoding = get_encoding()
+        with _encoding_lock:
+            if _token_byte_lengths is None:
+                lengths = np.zeros(encoding.n_vocab, dtype='int64')
+                for token in range(encoding.n_vocab):
+                    try:
+                        lengths[token] = len(encoding.decode_single_token_bytes(token))
+                    except KeyError:
+                        pass
+                _token_byte_lengths = lengths
+    return _token_byte_lengths
+
+
+def token_span_offsets(text, tokens, chunk_size):
+    """
+    Character offsets [0, end_1, end_2, ..., len(text)] that cut text into runs of chunk_size tokens.
+    Computed from per-token byte lengths, so chunks are sliced out of the original string
+    instead of being decoded back from tokens. A cut that falls inside a multi-byte character
+    moves to the end of that character.
+    """
+    byte_ends = np.cumsum(get_token_byte_lengths()[np.asarray(tokens, dtype='int64')])
+    cut_bytes = byte_ends[chunk_size - 1::chunk_size].tolist()
+    if not cut_bytes or cut_bytes[-1] != byte_ends[-1]:
+        cut_bytes.append(int(byte_ends[-1]))
+    text_bytes = text.encode('utf-8')
+    if len(text_bytes) == len(text):
+        # ASCII: byte offsets are character offsets
+        return [0] + cut_bytes
+    # Character index of a byte offset = number of character-start bytes before it
+    data = np.frombuffer(text_bytes, dtype='uint8')
+    char_starts = np.concatenate([[0], np.cumsum((data & 0xC0) != 0x80)])
+    return [0] + char_starts[cut_bytes].tolist()
+
+
+class IngestionError(Exception):
+    """A problem with the uploaded document itself (reported to the user as a 400)."""
+
+
 def is_safe_filename(filename):
     # Only allow .pdf extension and safe characters
     if not filename.lower().endswith('.pdf'):
@@ -39,9 +175,30 @@ def is_safe_filename(filename):
         return False
     return True
 
+
+def _partition_attribute(partition, attribute):
+    """Property forwarding a legacy per-mode attribute (faiss_index_advanced, id_to_text, ...) to the VectorStore."""
+    return property(lambda self: getattr(self.vectors[partition], attribute),
+                    lambda self, value: setattr(self.vectors[partition], attribute, value))
+
+
 class MainRoutes:
-    def __init__(self, app):
+    # Shortcuts into self.vectors: index, chunk store (vector id -> text), vector id -> document_id, document_id -> vector ids
+    faiss_index = _partition_attribute('simple', 'index')
+    faiss_index_advanced = _partition_attribute('advanced', 'index')
+    id_to_text = _partition_attribute('simple', 'chunks')
+    id_to_text_advanced = _partition_attribute('advanced', 'chunks')
+    id_to_document_id = _partition_attribute('simple', 'documents')
+    id_to_document_id_advanced = _partition_attribute('advanced', 'documents')
+    document_id_to_ids = _partition_attribute('simple', 'doc_index')
+    document_id_to_ids_advanced = _partition_attribute('advanced', 'doc_index')
+
+
+    def __init__(self, app, startup=None):
         self.app = app
+        # Per-phase startup durations (FlaskApp passes its timer so the report covers the whole boot)
+        self.startup = startup or StartupTimer()
+        phase = self.startup.phase
         # Single data directory so all workers (and deploy) use the same files — no cwd confusion.
         self.data_dir = os.path.abspath(os.environ.get('DATA_DIR', app.root_path))
         os.makedirs(self.data_dir, exist_ok=True)
@@ -50,80 +207,46 @@ class MainRoutes:
             return os.path.join(self.data_dir, name)
 
         self._p = _p
-        self.processed_files = set()
-        self.processed_files_advanced = set()
         self.processed_documents = {}
         self.metadata_file = _p('processed_documents.json')
+        self.manifest_file = _p(MANIFEST_FILE)
+        # "<processing>:<sha256>" -> document_id; lets re-uploads of identical bytes skip all API calls
+        self.file_hashes_file = _p('file_hashes.json')
+        # Single-writer lock for DATA_DIR: held by every read-modify-write of a shared file (indexes,
+        # chunk stores, processed_documents.json, file_hashes.json, manifest.json) in every worker process.
+        self.writer_lock = WriterLock(_p('writer.lock'))
+        # Requests/tokens per minute budget of the OpenAI APIs, shared by all worker processes
+        self.rate_limiter = RateLimiter(_p('rate_limit.json'))
+        openai_client.rate_limiter = self.rate_limiter
+        with phase('jobs'):
+            self.jobs = JobQueue(_p('jobs.db'), max_workers=INGEST_WORKERS)
+        with phase('caches'):
+            self.embedding_cache = EmbeddingCache(
+                max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+                db_path=_p('query_cache.db') if QUERY_EMBEDDING_CACHE_SHARED else None,
+                max_disk_entries=QUERY_EMBEDDING_CACHE_DISK_SIZE
+            )
+            self.answer_cache = AnswerCache(
+                max_entries=ANSWER_CACHE_SIZE,
+                db_path=_p('query_cache.db') if ANSWER_CACHE_SHARED else None,
+                ttl=ANSWER_CACHE_TTL,
+                max_disk_entries=ANSWER_CACHE_DISK_SIZE
+            )
+        # Read the manifest before the artefacts: a write that lands in between is picked up on the next refresh.
+        self._loaded_versions = self._read_manifest()
 
-        # Initialize or load id_to_text mapping FIRST
-        if os.path.exists(_p('id_to_text.pkl')):
-            try:
-                with open(_p('id_to_text.pkl'), 'rb') as f:
-                    self.id_to_text = pickle.load(f)
-            except Exception as e:
-                print('Error loading id_to_text.pkl:', e)
-                self.id_to_text = {}
-        else:
-            self.id_to_text = {}
-
-        if os.path.exists(_p('id_to_text_advanced.pkl')):
-            try:
-                with open(_p('id_to_text_advanced.pkl'), 'rb') as f:
-                    self.id_to_text_advanced = pickle.load(f)
-            except Exception as e:
-                print('Error loading id_to_text_advanced.pkl:', e)
-                self.id_to_text_advanced = {}
-        else:
-            self.id_to_text_advanced = {}
-
-        self.vector_ids = list(self.id_to_text.keys())
-        self.vector_ids_advanced = list(self.id_to_text_advanced.keys())
-
-        # Vector ID -> document_id for contextual retrieval (which chunks belong to which doc)
-        if os.path.exists(_p('id_to_document_id.pkl')):
-            try:
-                with open(_p('id_to_document_id.pkl'), 'rb') as f:
-                    self.id_to_document_id = pickle.load(f)
-            except Exception as e:
-                print('Error loading id_to_document_id.pkl:', e)
-                self.id_to_document_id = {}
-        else:
-            self.id_to_document_id = {}
-        if os.path.exists(_p('id_to_document_id_advanced.pkl')):
-            try:
-                with open(_p('id_to_document_id_advanced.pkl'), 'rb') as f:
-                    self.id_to_document_id_advanced = pickle.load(f)
-            except Exception as e:
-                print('Error loading id_to_document_id_advanced.pkl:', e)
-                self.id_to_document_id_advanced = {}
-        else:
-            self.id_to_document_id_advanced = {}
+        # One VectorStore owns every partition (simple, advanced): FAISS index, memory-mapped chunk store
+        # (vector id -> text / document_id) and document index (document_id -> vector ids).
+        # Partitions are read from disk on first use, not here.
+        self.vectors = VectorStore(self.data_dir, on_change=self._bump_manifest, lock=self.writer_lock)
 
         # Now safe to call load_processed_documents
-        self.load_processed_documents()
-
-        # One-time backfill: tie existing vectors to documents (for already-processed docs)
-        self._backfill_id_to_document_id_if_needed()
-
-        # Initialize or load FAISS index
-        if os.path.exists(_p('faiss_index.index')):
-            try:
-                self.faiss_index = faiss.read_index(_p('faiss_index.index'))
-            except Exception as e:
-                print('Error loading faiss_index.index:', e)
-                self.faiss_index = None
-        else:
-            self.faiss_index = None
+        with phase('documents'):
+            self.load_processed_documents()
 
-        # Advanced embeddings index
-        if os.path.exists(_p('faiss_index_advanced.index')):
-            try:
-                self.faiss_index_advanced = faiss.read_index(_p('faiss_index_advanced.index'))
-            except Exception as e:
-                print(f"Error loading advanced FAISS index: {e}")
-                self.faiss_index_advanced = None
-        else:
-            self.faiss_index_advanced = None
+        # Legacy chunks without documents are linked offline (scripts/backfill_document_links.py)
+        with phase('backfill_check'):
+            self._warn_if_backfill_needed()
 
     def load_processed_documents(self):
         if os.path.exists(self.metadata_file):
@@ -136,104 +259,118 @@ class MainRoutes:
             # Backfill from FAISS mappings
             self.processed_documents = self.backfill_from_mappings()
 
-    def _backfill_id_to_document_id_if_needed(self):
+    def _read_manifest(self):
+        """Returns {artefact: version} from manifest.json ({} if it does not exist yet)."""
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f).get('artefacts', {})
+        except Exception as e:
+            print(f"Error reading {MANIFEST_FILE}: {e}")
+            return {}
+
+    def _bump_manifest(self, *artefacts):
         """
-        One-time backfill for already-processed documents: assign each vector to a document_id
-        using the same heuristic as get_document_chunks, then save. So existing docs get
-        their chunks tied together and context selection works without re-uploading.
-        Only runs when the mapping file does not exist yet (first run after deploy).
-        Runs at startup (batch); watch server logs for "Backfill..." messages.
+        Records a new version for each changed artefact ('documents', 'simple', 'advanced').
+        Called after the artefact itself has been written, so a reader that sees the new
+        version always finds the new data on disk.
         """
-        need_backfill = any(
-            id_to_text and not os.path.exists(self._p(pkl))
-            for _, id_to_text, _, pkl in [
-                (False, self.id_to_text, self.id_to_document_id, 'id_to_document_id.pkl'),
-                (True, self.id_to_text_advanced, self.id_to_document_id_advanced, 'id_to_document_id_advanced.pkl'),
-            ]
-        )
-        if need_backfill:
-            print("[Backfill] Linking existing documents to chunks (one-time, at startup). Please wait...")
-        total_updated = 0
-        for advanced, id_to_text, id_to_doc, pkl_file in [
-            (False, self.id_to_text, self.id_to_document_id, 'id_to_document_id.pkl'),
-            (True, self.id_to_text_advanced, self.id_to_document_id_advanced, 'id_to_document_id_advanced.pkl'),
-        ]:
-            pkl_path = self._p(pkl_file)
-            if not id_to_text or os.path.exists(pkl_path):
-                continue
-            processing = 'advanced' if advanced else 'simple'
-            docs_for_mode = [d for d in self.processed_documents.values() if d.get('processing') == processing]
-            if not docs_for_mode:
+        try:
+            with self.writer_lock:
+                manifest = {'generation': 0, 'artefacts': {}}
+                if os.path.exists(self.manifest_file):
+                    with open(self.manifest_file, 'r') as f:
+                        manifest = json.load(f)
+                generation = manifest.get('generation', 0) + 1
+                versions = manifest.setdefault('artefacts', {})
+                for name in artefacts:
+                    # This worker already holds what it just wrote; only skip the reload if it was current before.
+                    up_to_date = self._loaded_versions.get(name) == versions.get(name)
+                    versions[name] = generation
+                    if up_to_date:
+                        self._loaded_versions[name] = generation
+                manifest['generation'] = generation
+                atomic_write(self.manifest_file, lambda f: json.dump(manifest, f), mode='w')
+        except Exception as e:
+            print(f"Error updating {MANIFEST_FILE}: {e}")
+
+    def _refresh_if_stale(self):
+        """
+        Reloads only the artefacts whose manifest version differs from what this worker loaded.
+        Nothing is read from disk (beyond manifest.json) when the corpus is unchanged.
+        """
+        current = self._read_manifest()
+        stale = [name for name in MANIFEST_ARTEFACTS if current.get(name) != self._loaded_versions.get(name)]
+        if not stale:
+            return
+        if 'documents' in stale:
+            self.load_processed_documents()
+        partitions = [name for name in stale if name != 'documents']
+        if partitions:
+            self.vectors.reload(partitions)
+        for name in stale:
+            self._loaded_versions[name] = current.get(name)
+
+    def _warn_if_backfill_needed(self):
+        """
+        Legacy corpora (chunks stored before they carried a document_id) are linked to their documents
+        offline by scripts/backfill_document_links.py; the web process only points that out. Checked
+        on file sizes, so startup loads no partition.
+        """
+        for partition in self.vectors:
+            if not partition.may_have_unlinked_chunks():
                 continue
-            updated = 0
-            for doc in docs_for_mode:
-                document_id = doc.get('id')
-                title = doc.get('title') or ''
-                filename = doc.get('filename') or ''
-                filename_stem = os.path.splitext(filename)[0] if filename and filename != 'unknown' else ''
-                title_prefix = (document_id or '').split('-')[0]
-                for idx, text in id_to_text.items():
-                    if not text:
-                        continue
-                    if title and title in text:
-                        id_to_doc[idx] = document_id
-                        updated += 1
-                    elif title_prefix and title_prefix in text:
-                        id_to_doc[idx] = document_id
-                        updated += 1
-                    elif filename_stem and filename_stem in text:
-                        id_to_doc[idx] = document_id
-                        updated += 1
-            if updated:
-                try:
-                    with open(pkl_path, 'wb') as f:
-                        pickle.dump(id_to_doc, f)
-                        f.flush()
-                        os.fsync(f.fileno())
-                    print(f"[Backfill] {processing}: linked {updated} chunk(s) to documents -> {pkl_file}")
-                    total_updated += updated
-                except Exception as e:
-                    print(f"[Backfill] Error saving {pkl_file}: {e}")
-        if need_backfill:
-            print(f"[Backfill] Done. Total links: {total_updated}. You can use the app now.")
+            if any(doc.get('processing') == partition.name for doc in self.processed_documents.values()):
+                print(f"[Backfill] {partition.name} chunks are not linked to documents yet; "
+                      f"run `python scripts/backfill_document_links.py --partition {partition.name}`.")
 
     def save_processed_documents(self):
         try:
-            with open(self.metadata_file, 'w') as f:
-                json.dump(self.processed_documents, f)
-                f.flush()
-                os.fsync(f.fileno())
+            atomic_write(self.metadata_file, lambda f: json.dump(self.processed_documents, f), mode='w')
+            self._bump_manifest('documents')
         except Exception as e:
             print(f"Error saving processed_documents.json: {e}")
 
+    def update_processed_documents(self, change):
+        """
+        Read-modify-write of processed_documents.json under the writer lock: reloads the file,
+        applies change(processed_documents) and saves, so edits made concurrently by other
+        workers are merged rather than overwritten.
+
+        Args:
+            change (Callable[[dict], Any]): Mutates the {document_id: metadata} dict in place.
+
+        Returns:
+            Any: Whatever change returned.
+        """
+        with self.writer_lock:
+            # Reloading now makes this worker current, so the manifest bump below does not trigger another reload
+            self._loaded_versions['documents'] = self._read_manifest().get('documents')
+            if os.path.exists(self.metadata_file):
+                # (Without the file, keep what startup loaded: backfilling now would turn other workers'
+                # freshly added chunks into legacy documents)
+                self.load_processed_documents()
+            result = change(self.processed_documents)
+            self.save_processed_documents()
+            return result
+
     def backfill_from_mappings(self):
         docs = {}
-        # Simple
-        for idx, text in self.id_to_text.items():
-            title = text[:40] if text else "unknown"
-            date_str = "unknown"
-            processing = "simple"
-            doc_id = f"{title}-{processing}-{date_str}"
-            docs[doc_id] = {
-                "id": doc_id,
-                "title": title,
-                "date": date_str,
-                "processing": processing,
-                "filename": "unknown"
-            }
-        # Advanced
-        for idx, text in self.id_to_text_advanced.items():
-            title = text[:40] if text else "unknown"
-            date_str = "unknown"
-            processing = "advanced"
-            doc_id = f"{title}-{processing}-{date_str}"
-            docs[doc_id] = {
-                "id": doc_id,
-                "title": title,
-                "date": date_str,
-                "processing": processing,
-                "filename": "unknown"
-            }
+        # One entry per chunk, per partition (simple, advanced)
+        for partition in self.vectors:
+            for idx, text in partition.chunks.items():
+                title = text[:40] if text else "unknown"
+                date_str = "unknown"
+                processing = partition.name
+                doc_id = f"{title}-{processing}-{date_str}"
+                docs[doc_id] = {
+                    "id": doc_id,
+                    "title": title,
+                    "date": date_str,
+                    "processing": processing,
+                    "filename": "unknown"
+                }
         return docs
 
     def index(self):
@@ -253,47 +390,28 @@ class MainRoutes:
         if not self.allowed_file(file.filename) or not is_safe_filename(file.filename):
             return jsonify({'error': 'Invalid or unsafe file name'}), 400
         filename = secure_filename(file.filename)
-        upload_folder = self.app.config['UPLOAD_FOLDER']
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
+        file_path, file_hash = self.save_upload(file)
+        processing = "simple"
+        # Identical bytes already processed (by any worker, before any restart): no extraction or API calls
+        existing_id = self.find_processed_file(file_hash, processing)
+        if existing_id:
+            return jsonify({'message': 'File already processed', 'document_id': existing_id}), 200
+        # Parse the PDF once; the reader is reused for the title and for text extraction
+        reader = self.open_pdf(file_path)
         # Extract title (from filename or PDF)
-        title = self.extract_title(file_path, filename)
+        title = self.extract_title(file_path, filename, reader=reader)
         date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        processing = "simple"
         document_id = f"{title}-{processing}-{date_str}"
-        # Save metadata
-        self.processed_documents[document_id] = {
+        doc_meta = {
             "id": document_id,
             "title": title,
             "date": date_str,
             "processing": processing,
-            "filename": filename
+            "filename": filename,
+            "file_hash": file_hash
         }
-        self.save_processed_documents()
         # Process the file (e.g., extract text, generate embeddings)
-        summary = self.summarize_document(file_path, is_pdf=True)
-        self.summary = summary  # Store the summary
-
-        # Check if file was already processed
-        if summary == "File already processed":
-            return jsonify({'message': 'File already processed'}), 200
-
-        # Check summary before embedding
-        if not summary or not summary.strip():
-            return jsonify({'error': 'Could not extract text from PDF. Please upload a valid PDF with selectable text.'}), 400
-
-        # Generate embedding for the summary
-        try:
-            embedding = self.get_embedding(summary)
-            print('Embedding genenerated')
-            self.save_embedding(embedding, summary, document_id=document_id)
-            print('Embedding saved')
-        except Exception as e:
-            print(f"Error during embedding or saving: {e}")
-            return jsonify({'error': f'Internal server error: {str(e)}'}), 500
-        return jsonify({'message': 'File successfully uploaded and processed'}), 200
+        return self._start_ingestion(file_path, doc_meta, reader=reader)
 
     def advanced_upload(self):
         if 'file' not in request.files:
@@ -305,131 +423,351 @@ class MainRoutes:
         if not self.allowed_file(file.filename) or not is_safe_filename(file.filename):
             return jsonify({'error': 'Invalid or unsafe file name'}), 400
         filename = secure_filename(file.filename)
-        upload_folder = self.app.config['UPLOAD_FOLDER']
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
+        file_path, file_hash = self.save_upload(file)
+        processing = "advanced"
+        # Identical bytes already processed (by any worker, before any restart): no extraction or API calls
+        existing_id = self.find_processed_file(file_hash, processing)
+        if existing_id:
+            return jsonify({'message': 'File already processed', 'document_id': existing_id}), 200
+        # Parse the PDF once; the reader is reused for the title and for text extraction
+        reader = self.open_pdf(file_path)
         # Extract title (from filename or PDF)
-        title = self.extract_title(file_path, filename)
+        title = self.extract_title(file_path, filename, reader=reader)
         date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        processing = "advanced"
         document_id = f"{title}-{processing}-{date_str}"
-        # Save metadata
-        self.processed_documents[document_id] = {
+        doc_meta = {
             "id": document_id,
             "title": title,
             "date": date_str,
             "processing": processing,
-            "filename": filename
+            "filename": filename,
+            "file_hash": file_hash
         }
-        self.save_processed_documents()
         # Process the document using advanced processing
-        self.summarize_document(file_path, is_pdf=True, advanced=True, document_id=document_id)
-        return jsonify({'message': 'File successfully uploaded and processed with advanced processing'}), 200
+        return self._start_ingestion(file_path, doc_meta, reader=reader)
 
-    def ask(self):
+    def save_upload(self, file):
+        """
+        Saves an uploaded file as UPLOAD_FOLDER/<sha256>.pdf. The bytes are written to a uniquely named
+        temporary file and renamed into place, so a later upload with the same file name cannot
+        overwrite a file a queued ingestion job has yet to read (the same name means the same bytes).
+
+        Args:
+            file (FileStorage): The uploaded file.
+
+        Returns:
+            tuple: (file_path, file_hash); file_hash is '' if the file could not be hashed.
+        """
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        temp_path = os.path.join(upload_folder, f".upload-{uuid.uuid4().hex}.tmp")
+        file.save(temp_path)
+        file_hash = self.get_file_hash(temp_path)
+        file_path = os.path.join(upload_folder, f"{file_hash or uuid.uuid4().hex}.pdf")
+        os.replace(temp_path, file_path)
+        return file_path, file_hash
+
+    def _start_ingestion(self, file_path, doc_meta, reader=None):
+        """Queues ingest_document (202 + job id), or runs it inline when INGEST_ASYNC is off."""
+        if INGEST_ASYNC:
+            job_id = self.jobs.submit(doc_meta['processing'], self.ingest_document, file_path, doc_meta, reader=reader)
+            return jsonify({
+                'message': 'File accepted for processing',
+                'job_id': job_id,
+                'status_url': f'/jobs/{job_id}'
+            }), 202
         try:
-            data = request.get_json()
-            document_id = data.get('document_id')
-            question = data.get('question', '')
-            processing_mode = data.get('processing_mode', 'simple')
-            print('Now asking...')
+            result = self.ingest_document(file_path, doc_meta, reader=reader)
+        except IngestionError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error during embedding or saving: {e}")
+            return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return jsonify(result), 200
 
-            if not question:
-                return jsonify({'error': 'No question provided'}), 400
-            if not (document_id and str(document_id).strip()):
-                return jsonify({'error': 'Please select a document (context) for your question.'}), 400
+    def ingest_document(self, file_path, doc_meta, progress=None, reader=None):
+        """
+        Extracts, chunks/summarises, embeds and persists an uploaded PDF, then publishes its metadata
+        so it appears in the document list only once it can be queried.
+        Args:
+            file_path (str): Path to the uploaded PDF.
+            doc_meta (dict): Metadata for processed_documents.json (id, title, date, processing, filename).
+            progress (callable, optional): progress(phase, fraction) for job status reporting.
+            reader (PdfReader, optional): Reader already opened by the upload handler.
+        Returns:
+            dict: {'message': ..., 'document_id': ...}
+        Raises:
+            IngestionError: If no usable text could be extracted.
+        """
+        report = progress or (lambda phase, fraction: None)
+        document_id = doc_meta['id']
+        advanced = doc_meta['processing'] == 'advanced'
+        if advanced:
+            self.summarize_document(file_path, is_pdf=True, advanced=True, document_id=document_id,
+                                             progress=report, reader=reader)
+            if not self.get_document_chunks(document_id, 'advanced'):
+                raise IngestionError('Could not extract text from PDF. Please upload a valid PDF with selectable text.')
+            message = 'File successfully uploaded and processed with advanced processing'
+        else:
+            summary = self.summarize_document(file_path, is_pdf=True, progress=report, reader=reader)
+            self.summary = summary  # Store the summary
 
-            # Reload from disk so this worker has latest docs and chunks (multi-worker safe).
-            self.load_processed_documents()
-            self._reload_faiss_and_mappings()
+            # Check summary before embedding
+            if not summary or not summary.strip():
+                raise IngestionError('Could not extract text from PDF. Please upload a valid PDF with selectable text.')
 
-            # Document and answering method must match (safety check if frontend is bypassed)
-            doc_meta = self.processed_documents.get(document_id)
-            if doc_meta and doc_meta.get('processing') != processing_mode:
-                return jsonify({
-                    'error': f"This document was processed with {doc_meta['processing'].title()}. "
-                             f"Use the {doc_meta['processing'].title()} answering method (it is set automatically when you select the document)."
-                }), 400
-
-            # Generate embedding for the question
-            question_embedding = self.get_embedding(question)
-            print('Question Embedding Generated')
-
-            # Select the appropriate index and mappings
-            if processing_mode == 'advanced':
-                index = self.faiss_index_advanced
-                id_to_text = self.id_to_text_advanced
-                print('Advanced Question')
-                if index is None or index.ntotal == 0:
-                    index = self.load_faiss_index('faiss_index_advanced.index')
-                    self.faiss_index_advanced = index
-                    id_to_text = self.load_id_to_text('id_to_text_advanced.pkl')
-                    self.id_to_text_advanced = id_to_text
-                print({index.ntotal})
-            else:
-                index = self.faiss_index
-                id_to_text = self.id_to_text
-                print('Simple Question')
-                print({index.ntotal})
-
-            # Check if the index has embeddings
-            if index is None or index.ntotal == 0:
-                return jsonify({'error': 'The knowledge base is empty for the selected processing mode. Please upload and process a document first.'}), 400
-            print('Similar Embedding Found')
-
-            # Get chunk IDs and texts for the selected document only
-            chunk_pairs = self.get_document_chunks(document_id, processing_mode)
-            chunk_ids = [idx for idx, _ in chunk_pairs]
-            if not chunk_ids:
-                return jsonify({'error': 'No chunks found for the selected document.'}), 400
-
-            chunk_id_set = set(chunk_ids)
-            top_k_retrieve = 5
-            # Search more candidates then filter to this document's chunks (FAISS has no "search in subset")
-            search_k = min(100, index.ntotal)
-            D, I = index.search(np.array([question_embedding], dtype='float32'), search_k)
-            # Keep only results that belong to the selected document
-            I_filtered = [idx for idx in I[0] if idx != -1 and idx in chunk_id_set]
-            # Take top 5 by similarity (already ordered by D)
-            if I_filtered:
-                contexts = [id_to_text[idx] for idx in I_filtered[:top_k_retrieve]]
-            else:
-                # No hits in top search_k from this doc (rare); use doc's chunks in order
-                contexts = [text for _, text in chunk_pairs[:top_k_retrieve]]
-            print('Similar Embedding Searching (context filtered to selected document)')
+            # Generate embedding for the summary
+            report('embed', 0.8)
+            embedding = self.get_embedding(summary)
+            if embedding is None:
+                raise RuntimeError('Could not generate an embedding for the document summary')
+            print('Embedding genenerated')
+            report('persist', 0.9)
+            self.save_embedding(embedding, summary, document_id=document_id)
+            print('Embedding saved')
+            message = 'File successfully uploaded and processed'
+
+        # Save metadata (merge with what other workers wrote meanwhile)
+        self.update_processed_documents(lambda documents: documents.update({document_id: doc_meta}))
+        if doc_meta.get('file_hash'):
+            self.register_file_hash(doc_meta['file_hash'], doc_meta['processing'], document_id)
+        return {'message': message, 'document_id': document_id}
+
+    def get_job(self, job_id):
+        """Status of an ingestion job: status, phase (extract/chunk/summarize/embed/persist), progress 0-1."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job), 200
+
+    def _prepare_answer(self, data):
+        """
+        Validation and retrieval shared by /ask and /ask_stream: checks the request, embeds the
+        question, searches the selected document's chunks and builds the prompt.
 
-            # Construct the prompt
-            prompt = self.construct_prompt(question, contexts)
+        Args:
+            data (dict): Request JSON (question, document_id, processing_mode).
+
+        Returns:
+            Tuple[dict|None, Tuple[str, int]|None]: ({'prompt', 'cache_key', 'answer'}, None), where
+            answer is the cached answer or None, or (None, (error message, HTTP status)).
+        """
+        error = self._check_question(data)
+        if error:
+            return None, error
+        # Generate embedding for the question (cached: repeated questions skip the API)
+        question_embedding = self.get_query_embedding(data.get('question', ''))
+        print('Question Embedding Generated')
+        return self._retrieve_answer_context(data, question_embedding)
+
+    def _check_question(self, data):
+        """Request checks of _prepare_answer; returns (error message, HTTP status) or None."""
+        document_id = data.get('document_id')
+        question = data.get('question', '')
+        processing_mode = data.get('processing_mode', 'simple')
+        print('Now asking...')
+
+        if not question:
+            return 'No question provided', 400
+        if not (document_id and str(document_id).strip()):
+            return 'Please select a document (context) for your question.', 400
+
+        # Pick up docs and chunks written by other workers; no-op when the manifest is unchanged.
+        self._refresh_if_stale()
+
+        # Document and answering method must match (safety check if frontend is bypassed)
+        doc_meta = self.processed_documents.get(document_id)
+        if doc_meta and doc_meta.get('processing') != processing_mode:
+            return (f"This document was processed with {doc_meta['processing'].title()}. "
+                    f"Use the {doc_meta['processing'].title()} answering method (it is set automatically when you select the document).", 400)
+        return None
+
+    def _retrieve_answer_context(self, data, question_embedding):
+        """Retrieval half of _prepare_answer, for a checked request and its question embedding."""
+        document_id = data.get('document_id')
+        question = data.get('question', '')
+        processing_mode = data.get('processing_mode', 'simple')
+
+        # Select the partition (index and chunk store) for the processing mode
+        partition = self.vectors.partition_for(processing_mode)
+        print(f'{partition.name.title()} Question')
+        if partition.index is None or partition.index.ntotal == 0:
+            # Another worker may have created it since this one loaded
+            self.vectors.load([partition.name])
+        index = partition.index
+        id_to_text = partition.chunks
+        print({index.ntotal if index is not None else 0})
+
+        # Check if the index has embeddings
+        if index is None or index.ntotal == 0:
+            return None, ('The knowledge base is empty for the selected processing mode. Please upload and process a document first.', 400)
+        print('Similar Embedding Found')
+
+        # Get chunk IDs and texts for the selected document only
+        chunk_pairs = self.get_document_chunks(document_id, processing_mode)
+        chunk_ids = [idx for idx, _ in chunk_pairs]
+        if not chunk_ids:
+            return None, ('No chunks found for the selected document.', 400)
+
+        top_k_retrieve = 5
+        # Search only this document's vectors: true top-k within the document, no over-fetch
+        hits = self.search_document(index, question_embedding, chunk_ids, top_k_retrieve)
+        if hits:
+            context_pairs = [(idx, id_to_text[idx]) for idx in hits if idx in id_to_text]
+        else:
+            # Document's vectors are missing from the index (e.g. legacy data); use its chunks in order
+            context_pairs = chunk_pairs[:top_k_retrieve]
+        contexts = [text for _, text in context_pairs]
+        print('Similar Embedding Searching (restricted to selected document)')
+
+        # Same document chunks + same retrieved contexts + same question -> reuse the answer
+        cache_key = AnswerCache.key(CHAT_MODEL, document_id, chunk_ids, [idx for idx, _ in context_pairs], question)
+        answer = self.answer_cache.get(cache_key)
+        if answer is not None:
+            print('Answer Found (cached)')
+        return {'prompt': self.construct_prompt(question, contexts), 'cache_key': cache_key, 'answer': answer}, None
+
+    def _log_ask_failure(self, route, err_msg):
+        tb = traceback.format_exc()
+        # Unmissable log block so you see the real error in the terminal
+        print("\n" + "=" * 60, file=sys.stderr)
+        print(f"POST {route} FAILED (500)", file=sys.stderr)
+        print("=" * 60, file=sys.stderr)
+        print(f"Error: {err_msg}", file=sys.stderr)
+        print("\nFull traceback:", file=sys.stderr)
+        print(tb, file=sys.stderr)
+        print("=" * 60 + "\n", file=sys.stderr)
+
+    def ask(self):
+        try:
+            prepared, error = self._prepare_answer(request.get_json())
+            if error:
+                return jsonify({'error': error[0]}), error[1]
+            if prepared['answer'] is not None:
+                return jsonify({'answer': prepared['answer']}), 200
 
             # Generate the answer
-            answer = self.generate_answer_from_prompt(prompt)
+            answer = self.generate_answer_from_prompt(prepared['prompt'])
             print('Answer Found')
+            if answer != ANSWER_ERROR_MESSAGE:
+                self.answer_cache.put(prepared['cache_key'], answer)
 
             # Return as JSON for consistency
             return jsonify({'answer': answer}), 200
 
         except Exception as e:
             err_msg = str(e)
-            tb = traceback.format_exc()
-            # Unmissable log block so you see the real error in the terminal
-            print("\n" + "=" * 60, file=sys.stderr)
-            print("POST /ask FAILED (500)", file=sys.stderr)
-            print("=" * 60, file=sys.stderr)
-            print(f"Error: {err_msg}", file=sys.stderr)
-            print("\nFull traceback:", file=sys.stderr)
-            print(tb, file=sys.stderr)
-            print("=" * 60 + "\n", file=sys.stderr)
+            self._log_ask_failure('/ask', err_msg)
             return jsonify({'error': err_msg}), 500
 
+    def ask_stream(self):
+        """
+        POST /ask_stream: same request and checks as /ask, but the answer is sent as server-sent events
+        while the model generates it, so the first words show after retrieval + first-token latency
+        instead of after the whole completion. Events (each a JSON `data:` line):
+          (default)     {"token": "..."}  next piece of the answer
+          event: done   {"answer": "...", "cached": bool}  full answer; the stream ends
+          event: error  {"error": "..."}  generation failed midway; the stream ends
+        Validation and retrieval errors are returned before streaming, as JSON with a 4xx/500 status.
+        """
+        try:
+            prepared, error = self._prepare_answer(request.get_json())
+            if error:
+                return jsonify({'error': error[0]}), error[1]
+        except Exception as e:
+            err_msg = str(e)
+            self._log_ask_failure('/ask_stream', err_msg)
+            return jsonify({'error': err_msg}), 500
+
+        def events():
+            if prepared['answer'] is not None:
+                yield sse_event({'token': prepared['answer']})
+                yield sse_event({'answer': prepared['answer'], 'cached': True}, 'done')
+                return
+            parts = []
+            try:
+                for token in self.stream_answer_from_prompt(prepared['prompt']):
+                    parts.append(token)
+                    yield sse_event({'token': token})
+            except Exception as e:
+                print(f"Error streaming answer: {e}")
+                yield sse_event({'error': ANSWER_ERROR_MESSAGE}, 'error')
+                return
+            answer = ''.join(parts).strip()
+            print('Answer Found (streamed)')
+            # An empty stream is not an answer worth replaying to every later asker
+            if answer:
+                self.answer_cache.put(prepared['cache_key'], answer)
+            yield sse_event({'answer': answer, 'cached': False}, 'done')
+
+        # No buffering anywhere between the model and the browser (X-Accel-Buffering: nginx)
+        return Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    async def ask_async(self, data):
+        """
+        /ask for the ASGI serving mode (asgi.py): same checks, caching and response as ask(), with
+        the OpenAI calls awaited on the async client.
+
+        Args:
+            data (dict): Request JSON (question, document_id, processing_mode).
+
+        Returns:
+            Tuple[dict, int]: JSON payload and HTTP status.
+        """
+        try:
+            prepared, error = await self.prepare_answer_async(data)
+            if error:
+                return {'error': error[0]}, error[1]
+            if prepared['answer'] is not None:
+                return {'answer': prepared['answer']}, 200
+
+            answer = await self.generate_answer_async(prepared['prompt'])
+            print('Answer Found')
+            if answer != ANSWER_ERROR_MESSAGE:
+                await anyio.to_thread.run_sync(self.answer_cache.put, prepared['cache_key'], answer)
+            return {'answer': answer}, 200
+
+        except Exception as e:
+            err_msg = str(e)
+            self._log_ask_failure('/ask', err_msg)
+            return {'error': err_msg}, 500
+
+    async def ask_stream_events_async(self, prepared):
+        """
+        The /ask_stream event stream (see ask_stream) for the ASGI serving mode.
+
+        Args:
+            prepared (dict): Result of prepare_answer_async.
+
+        Yields:
+            str: Server-sent events.
+        """
+        if prepared['answer'] is not None:
+            yield sse_event({'token': prepared['answer']})
+            yield sse_event({'answer': prepared['answer'], 'cached': True}, 'done')
+            return
+        parts = []
+        try:
+            async for token in self.stream_answer_async(prepared['prompt']):
+                parts.append(token)
+                yield sse_event({'token': token})
+        except Exception as e:
+            print(f"Error streaming answer: {e}")
+            yield sse_event({'error': ANSWER_ERROR_MESSAGE}, 'error')
+            return
+        answer = ''.join(parts).strip()
+        print('Answer Found (streamed)')
+        if answer:
+            await anyio.to_thread.run_sync(self.answer_cache.put, prepared['cache_key'], answer)
+        yield sse_event({'answer': answer, 'cached': False}, 'done')
 
     def allowed_file(self, filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
     # Utility Functions
 
-    def summarize_document(self, file_path, is_pdf=False, advanced=False, document_id=None):
+    def summarize_document(self, file_path, is_pdf=False, advanced=False, document_id=None, progress=None, reader=None):
         """
         Generates a summary of a text or PDF document.
         Args:
@@ -437,25 +775,42 @@ class MainRoutes:
             is_pdf (bool, optional): Flag to indicate if the document is a PDF. Defaults to False.
             advanced (bool): If True, chunk and embed full text; else summarize and embed summary.
             document_id (str|None): Document ID to tie chunks/summary to (for context retrieval).
+            progress (callable, optional): progress(phase, fraction) callback for job status.
+            reader (PdfReader, optional): Already-parsed PDF to reuse.
         Returns:
             str: Summary of the document.
         """
-        if is_pdf:
-            content = self.pdf_to_text(file_path)
-        else:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-        
+        report = progress or (lambda phase, fraction: None)
+        report('extract', 0.05)
         if advanced:
-            # Advanced processing: Generate embeddings from full text
-            chunks = self.split_text_into_chunks(content)
-            for chunk in chunks:
-                embedding = self.get_embedding(chunk)
-                self.save_embedding(embedding, chunk, advanced=True, document_id=document_id)
-                print('Advanced Save Just Happened')
+            # Advanced processing: stream page text straight into the chunker, then embed the full text
+            if is_pdf:
+                texts = self.iter_pdf_pages(file_path, reader=reader)
+            else:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    texts = [file.read()]
+            chunks, token_counts = [], []
+            for chunk, n_tokens in self.iter_text_chunks(texts):
+                chunks.append(chunk)
+                token_counts.append(n_tokens)
+            report('chunk', 0.3)
+            report('embed', 0.4)
+            embeddings = self.get_embeddings(chunks, token_counts=token_counts)
+            if embeddings is None:
+                # The API failed, not the document: a server error rather than "no text in this PDF"
+                raise RuntimeError('Could not generate embeddings for the document text')
+            report('persist', 0.9)
+            self.save_embeddings(embeddings, chunks, document_id=document_id, advanced=True)
+            print(f'Advanced Save Just Happened ({len(chunks)} chunks)')
         
         else:
             # Simple processing: Generate summary and embeddings
+            if is_pdf:
+                content = self.pdf_to_text(file_path, reader=reader)
+            else:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+            report('summarize', 0.3)
             if len(content) > 4000:
                 summary = self.summarize_large_content(content)
                 print('Simple Large Save Just Happened')
@@ -464,30 +819,51 @@ class MainRoutes:
                 print('Simple Small Save Just Happened')
     
             print('Document Summary:\n', summary)
-        
-        # Generate a unique identifier for the file
-        file_hash = self.get_file_hash(file_path)
 
-        # Check if the file has already been processed
-        if advanced:
-            if file_hash in self.processed_files_advanced:
-                print("File already processed with advanced processing.")
-                return "File already processed"
-        else:
-            if file_hash in self.processed_files:
-                print("File already processed with simple processing.")
-                return "File already processed"
-        # You can store the summary for later use
+            self.summary = summary  # Storing the summary in an instance variable
+            return summary
 
-            # Add to processed files
-        if advanced:
-            self.processed_files_advanced.add(file_hash)
-        else:
-            self.processed_files.add(file_hash)
+    def _load_file_hashes(self):
+        if not os.path.exists(self.file_hashes_file):
+            return {}
+        try:
+            with open(self.file_hashes_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading file_hashes.json: {e}")
+            return {}
 
+    def find_processed_file(self, file_hash, processing):
+        """Returns the document_id previously created from these exact bytes in this mode, or None."""
+        if not file_hash:
+            return None
+        document_id = self._load_file_hashes().get(f"{processing}:{file_hash}")
+        if not document_id:
+            return None
+        # Only trust the registry while the document itself still exists
+        self._refresh_if_stale()
+        return document_id if document_id in self.processed_documents else None
 
-            self.summary = summary  # Storing the summary in an instance variable
-            return summary
+    def register_file_hash(self, file_hash, processing, document_id):
+        """Records file_hash -> document_id in file_hashes.json (atomic rewrite)."""
+        try:
+            with self.writer_lock:
+                hashes = self._load_file_hashes()
+                hashes[f"{processing}:{file_hash}"] = document_id
+                atomic_write(self.file_hashes_file, lambda f: json.dump(hashes, f), mode='w')
+        except Exception as e:
+            print(f"Error saving file_hashes.json: {e}")
+
+    def unregister_file_hashes(self, document_id):
+        """Drops every file_hashes.json entry pointing at document_id, so a re-upload is processed again."""
+        try:
+            with self.writer_lock:
+                hashes = self._load_file_hashes()
+                kept = {key: doc for key, doc in hashes.items() if doc != document_id}
+                if len(kept) != len(hashes):
+                    atomic_write(self.file_hashes_file, lambda f: json.dump(kept, f), mode='w')
+        except Exception as e:
+            print(f"Error saving file_hashes.json: {e}")
 
     def get_file_hash(self, file_path):
         try:
@@ -505,70 +881,155 @@ class MainRoutes:
             print(f"Error generating file hash: {e}")
             return ""
 
-    def pdf_to_text(self, pdf_path):
+    def open_pdf(self, pdf_path):
+        """Parses a PDF once so callers can share the reader; returns None if it cannot be read."""
+        try:
+            return PdfReader(pdf_path)
+        except Exception as e:
+            print(f"Error reading PDF: {e}")
+            return None
+
+    def iter_pdf_pages(self, pdf_path, reader=None):
+        """
+        Yields the text of each page as it is extracted (process pool for large files),
+        so peak memory stays at a few pages rather than the whole document.
+        Args:
+            pdf_path (str): Path to the PDF file.
+            reader (PdfReader, optional): Already-parsed reader to reuse.
+        Yields:
+            str: Page text with newlines flattened.
+        Raises:
+            Exception: Whatever extraction raised, after the pages before it; the caller's ingestion
+                job fails rather than indexing a silently truncated document.
+        """
+        try:
+            yield from iter_page_texts(pdf_path, reader=reader)
+        except Exception as e:
+            print(f"Error extracting text from PDF: {e}")
+            raise
+
+    def pdf_to_text(self, pdf_path, reader=None):
         try:
             """
             Converts a PDF file to text.
             Args:
                 pdf_path (str): Path to the PDF file.
+                reader (PdfReader, optional): Already-parsed reader to reuse.
             Returns:
                 str: Extracted text from the PDF file.
             """
-            reader = PdfReader(pdf_path)
-            extracted_texts = [page.extract_text() for page in reader.pages]
-            return ' '.join(extracted_texts).replace('\n', ' ')
+            return ' '.join(self.iter_pdf_pages(pdf_path, reader=reader))
         except Exception as e:
             print(f"Error extracting text from PDF: {e}")
             return ""
 
     def summarize_large_content(self, content):
         """
-        Generates a summary for large content.
+        Generates a summary for large content (map-reduce).
+        Chunks are summarised concurrently; if the combined summaries are still larger than
+        SUMMARY_REDUCE_MAX_TOKENS they are chunked and summarised again until they fit.
         Args:
             content (str): Large content to be summarized.
         Returns:
             str: Summary of the large content.
         """
         chunks = self.split_text_into_chunks(content)
-        chunk_summaries = [self.generate_summary(chunk) for chunk in chunks]
-        combined_text = ' '.join(chunk_summaries)
-        return self.generate_summary(combined_text)
+        combined_text = ' '.join(filter(None, self.summarize_chunks(chunks)))
+        while len(self.encode_text(combined_text)) > SUMMARY_REDUCE_MAX_TOKENS:
+            parts = self.split_text_into_chunks(combined_text, chunk_size=SUMMARY_REDUCE_MAX_TOKENS)
+            if len(parts) < 2:
+                break
+            combined_text = ' '.join(filter(None, self.summarize_chunks(parts)))
+        return self.generate_summary(combined_text, timeout=SUMMARY_TIMEOUT)
+
+    def summarize_chunks(self, chunks):
+        """
+        Summarises chunks with up to SUMMARY_CONCURRENCY chat completions in flight,
+        each bounded by SUMMARY_TIMEOUT.
+        Args:
+            chunks (List[str]): Texts to summarise.
+        Returns:
+            List[str]: One summary per chunk, in chunk order ("" for a failed call).
+        """
+        if len(chunks) < 2:
+            return [self.generate_summary(chunk, timeout=SUMMARY_TIMEOUT) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=min(SUMMARY_CONCURRENCY, len(chunks))) as executor:
+            return list(executor.map(lambda chunk: self.generate_summary(chunk, timeout=SUMMARY_TIMEOUT), chunks))
 
-    def split_text_into_chunks(self, text, chunk_size=3000):
+    def split_text_into_chunks(self, text, chunk_size=3000, return_token_counts=False):
         try:
             """
-            Splits text into smaller chunks.
+            Splits text into smaller chunks of chunk_size tokens. The text is encoded once and
+            chunks are sliced from the original string by token span offsets (no re-decoding).
             Args:
                 text (str): Text to be split.
                 chunk_size (int, optional): Size of each chunk. Defaults to 3000.
+                return_token_counts (bool): Also return each chunk's token count, so callers
+                    (e.g. embedding batching) don't have to encode the chunks again.
             Returns:
-                list[str]: List of text chunks.
+                list[str]: List of text chunks (and list[int] of token counts if requested).
             """
             tokens = self.encode_text(text)
-            chunks = []
-            for i in range(0, len(tokens), chunk_size):
-                chunk = self.decode_tokens(tokens[i:i + chunk_size])
-                chunks.append(chunk)
-            return chunks
+            chunks, token_counts = [], []
+            if tokens:
+                offsets = token_span_offsets(text, tokens, chunk_size)
+                for i, (start, end) in enumerate(zip(offsets, offsets[1:])):
+                    if end > start:
+                        chunks.append(text[start:end])
+                        token_counts.append(min(chunk_size, len(tokens) - i * chunk_size))
+            return (chunks, token_counts) if return_token_counts else chunks
         except Exception as e:
             print(f"Error splitting text into chunks: {e}")
-            return []
+            return ([], []) if return_token_counts else []
 
-    def generate_summary(self, text):
+    def iter_text_chunks(self, texts, chunk_size=3000):
+        """
+        Incremental version of split_text_into_chunks for streamed text (e.g. PDF pages).
+        Pieces are joined with spaces; each time the buffer holds a full chunk it is emitted,
+        so only the unfinished tail is ever kept.
+        Args:
+            texts (Iterable[str]): Text pieces in document order.
+            chunk_size (int, optional): Tokens per chunk. Defaults to 3000.
+        Yields:
+            Tuple[str, int]: (chunk text, token count).
+        """
+        buffer = ''
+        for text in texts:
+            buffer = f"{buffer} {text}" if buffer else text
+            tokens = self.encode_text(buffer)
+            if len(tokens) <= chunk_size:
+                continue
+            # Emit every full chunk; the remainder stays in the buffer to be extended by the next piece
+            offsets = token_span_offsets(buffer, tokens, chunk_size)
+            n_full = len(tokens) // chunk_size
+            for start, end in zip(offsets[:n_full], offsets[1:n_full + 1]):
+                if end > start:
+                    yield buffer[start:end], chunk_size
+            buffer = buffer[offsets[n_full]:]
+        if buffer:
+            chunks, token_counts = self.split_text_into_chunks(buffer, chunk_size, return_token_counts=True)
+            yield from zip(chunks, token_counts)
+
+    def generate_summary(self, text, timeout=None):
         try:
             """
             Generates a summary of the provided text using the OpenAI GPT-3.5 Turbo model.
             Args:
                 text (str): Text to be summarized.
+                timeout (float, optional): Request timeout in seconds. Defaults to the client's.
             Returns:
                 str: Summary of the text.
             """
             prompt = f"Summarize the following text:\n\n{text}\n\nSummary:"
-            response = client.chat.completions.create(
-                model='gpt-3.5-turbo',
+            kwargs = {'timeout': timeout} if timeout is not None else {}
+            response = openai_client.call(
+                'summary', client.chat.completions.create,
+                budget_tokens=self.chat_budget(prompt),
+                model=CHAT_MODEL,
                 messages=[{'role': 'user', 'content': prompt}],
-                max_tokens=500,
-                temperature=0.5
+                max_tokens=CHAT_MAX_TOKENS,
+                temperature=0.5,
+                **kwargs
             )
             summary = response.choices[0].message.content.strip()
             return summary
@@ -592,17 +1053,19 @@ class MainRoutes:
                 return context
 
             prompt = f"Answer the following question based on the provided context.\n\nContext:\n{context}\n\nQuestion:\n{question}\n\nAnswer:"
-            response = client.chat.completions.create(
-                model='gpt-3.5-turbo',
+            response = openai_client.call(
+                'answer', client.chat.completions.create,
+                budget_tokens=self.chat_budget(prompt),
+                model=CHAT_MODEL,
                 messages=[{'role': 'user', 'content': prompt}],
-                max_tokens=500,
+                max_tokens=CHAT_MAX_TOKENS,
                 temperature=0.5
             )
             answer = response.choices[0].message.content.strip()
             return answer
         except Exception as e:
             print(f"Error generating answer: {e}")
-            return "Sorry, an error occurred while generating the answer."
+            return ANSWER_ERROR_MESSAGE
     
     def get_embedding(self, text):
         try:
@@ -615,9 +1078,11 @@ class MainRoutes:
             Returns:
                 np.ndarray: The embedding vector as a NumPy array.
             """
-            response = client.embeddings.create(
+            response = openai_client.call(
+                'embedding', client.embeddings.create,
+                budget_tokens=len(self.encode_text(text)),
                 input=text,
-                model='text-embedding-ada-002'  # Latest embedding model as of 2023
+                model=EMBEDDING_MODEL
             )
 
             embedding = response.data[0].embedding
@@ -625,110 +1090,197 @@ class MainRoutes:
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return None
-    
+
+    def get_query_embedding(self, question):
+        """
+        get_embedding for user questions, behind the query-embedding cache (normalised text key).
+        Returns:
+            np.ndarray: The embedding vector (shared with the cache; do not modify in place).
+        """
+        embedding = self.embedding_cache.get(question, EMBEDDING_MODEL)
+        if embedding is None:
+            # A user is waiting for this one: it goes ahead of ingestion in the rate limiter
+            with openai_client.interactive():
+                embedding = self.get_embedding(question)
+            if embedding is not None:
+                self.embedding_cache.put(question, EMBEDDING_MODEL, embedding)
+        return embedding
+
+    async def get_query_embedding_async(self, question):
+        """get_query_embedding for the async handlers: the cache is consulted in a thread, the API awaited."""
+        embedding = await anyio.to_thread.run_sync(self.embedding_cache.get, question, EMBEDDING_MODEL)
+        if embedding is None:
+            try:
+                with openai_client.interactive():
+                    response = await openai_client.acall('embedding', async_client.embeddings.create,
+                                                         budget_tokens=len(self.encode_text(question)),
+                                                         input=question, model=EMBEDDING_MODEL)
+                embedding = np.array(response.data[0].embedding, dtype='float32')
+            except Exception as e:
+                print(f"Error generating embedding: {e}")
+                return None
+            await anyio.to_thread.run_sync(self.embedding_cache.put, question, EMBEDDING_MODEL, embedding)
+        return embedding
+
+    async def prepare_answer_async(self, data):
+        """
+        _prepare_answer for the async handlers: the embedding call is awaited, while the checks and the
+        FAISS search (CPU and disk) run in a worker thread so they never block the event loop.
+        """
+        error = await anyio.to_thread.run_sync(self._check_question, data)
+        if error:
+            return None, error
+        question_embedding = await self.get_query_embedding_async(data.get('question', ''))
+        print('Question Embedding Generated')
+        return await anyio.to_thread.run_sync(self._retrieve_answer_context, data, question_embedding)
+
+    def get_cache_stats(self):
+        """Hit/miss counters of this worker's caches and its rate-limit waits, for monitoring."""
+        return jsonify({
+            'query_embeddings': self.embedding_cache.stats(),
+            'answers': self.answer_cache.stats(),
+            'rate_limit': self.rate_limiter.stats()
+        }), 200
+
+    def get_embeddings(self, texts, batch_size=None, max_batch_tokens=None, token_counts=None):
+        try:
+            """
+            Generates embeddings for many texts with as few Embeddings API calls as possible.
+            Texts are sent in batches of at most batch_size inputs and max_batch_tokens tokens.
+
+            Args:
+                texts (List[str]): The texts to embed.
+                batch_size (int, optional): Max inputs per request. Defaults to EMBEDDING_BATCH_SIZE.
+                max_batch_tokens (int, optional): Max tokens per request. Defaults to EMBEDDING_BATCH_MAX_TOKENS.
+                token_counts (List[int], optional): Known token count of each text (skips re-encoding).
+
+            Returns:
+                np.ndarray: 2D float32 array with one row per text, in input order.
+            """
+            batch_size = batch_size or EMBEDDING_BATCH_SIZE
+            max_batch_tokens = max_batch_tokens or EMBEDDING_BATCH_MAX_TOKENS
+            batches, batches_tokens = [], []
+            batch, batch_tokens = [], 0
+            if token_counts is None:
+                token_counts = [len(self.encode_text(text)) for text in texts]
+            for text, n_tokens in zip(texts, token_counts):
+                if batch and (len(batch) >= batch_size or batch_tokens + n_tokens > max_batch_tokens):
+                    batches.append(batch)
+                    batches_tokens.append(batch_tokens)
+                    batch, batch_tokens = [], 0
+                batch.append(text)
+                batch_tokens += n_tokens
+            if batch:
+                batches.append(batch)
+                batches_tokens.append(batch_tokens)
+
+            rows = []
+            for batch, batch_tokens in zip(batches, batches_tokens):
+                response = openai_client.call(
+                    'embedding', client.embeddings.create,
+                    budget_tokens=batch_tokens,
+                    input=batch,
+                    model=EMBEDDING_MODEL
+                )
+                rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+            return np.array(rows, dtype='float32')
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            return None
+
     def create_faiss_index(self, embeddings, ids):
         """
-        Creates a FAISS index from the provided embeddings.
+        Creates a FAISS index from the provided embeddings (exact, FAISS_METRIC similarity).
         
         Args:
             embeddings (np.ndarray): A 2D NumPy array of embeddings.
             ids (List[int]): A list of IDs corresponding to each embedding.
         
         Returns:
-            faiss.IndexFlatL2: The FAISS index.
+            faiss.IndexIDMap: The FAISS index.
         """
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add_with_ids(embeddings, np.array(ids))
-        return index
+        return build_index('flat', embeddings, np.asarray(ids, dtype='int64'))
     
+    def search_document(self, index, query_embedding, chunk_ids, top_k=5):
+        """
+        Nearest-neighbour search restricted to one document's vectors (see vector_store.search_index).
+
+        Args:
+            index (faiss.Index): The index to search.
+            query_embedding (np.ndarray): The query vector.
+            chunk_ids (List[int]): Vector ids belonging to the document.
+            top_k (int): Number of neighbours to return.
+
+        Returns:
+            List[int]: Vector ids ordered by similarity (closest first).
+        """
+        return search_index(index, query_embedding, chunk_ids, top_k)
+
     def save_embedding(self, embedding, text, advanced=False, document_id=None):
-        try:
-            """
-            Saves the embedding and associated text into the FAISS index.
-            Optionally ties this vector to a document_id for contextual retrieval.
+        """
+        Saves one embedding and its text. Thin wrapper over save_embeddings for single vectors
+        (e.g. the summary of a simple upload).
 
-            Args:
-                embedding (np.ndarray): The embedding vector.
-                text (str): The text corresponding to the embedding.
-                advanced (bool): Use advanced index/mappings.
-                document_id (str|None): Document this chunk/summary belongs to (for context filtering).
-            """
-            if advanced:
-                # Use separate index and mappings for advanced processing
-                if self.faiss_index_advanced is None:
-                    print("Initializing advanced FAISS index.")
-                    dimension = embedding.shape[0]
-                    self.faiss_index_advanced = faiss.IndexFlatL2(dimension)
-                    self.faiss_index_advanced = faiss.IndexIDMap(self.faiss_index_advanced)
-                    self.vector_ids_advanced = []
-                    self.id_to_text_advanced = {}
-                index = self.faiss_index_advanced
-                vector_ids = self.vector_ids_advanced
-                id_to_text = self.id_to_text_advanced
-                id_to_doc = self.id_to_document_id_advanced
-                index_file = 'faiss_index_advanced.index'
-                mapping_file = 'id_to_text_advanced.pkl'
-                doc_mapping_file = 'id_to_document_id_advanced.pkl'
-            else:
-                if self.faiss_index is None:
-                    # Initialize the index if it doesn't exist
-                    dimension = embedding.shape[0]
-                    self.faiss_index = faiss.IndexFlatL2(dimension)
-                    self.faiss_index = faiss.IndexIDMap(self.faiss_index)
-                    self.vector_ids = []
-                    self.id_to_text = {}
-                index = self.faiss_index
-                vector_ids = self.vector_ids
-                id_to_text = self.id_to_text
-                id_to_doc = self.id_to_document_id
-                index_file = 'faiss_index.index'
-                mapping_file = 'id_to_text.pkl'
-                doc_mapping_file = 'id_to_document_id.pkl'
-
-            # Generate a unique ID for the embedding
-            vector_id = len(vector_ids)
-            vector_ids.append(vector_id)
-
-            # Add the embedding to the index
-            embedding = np.array([embedding], dtype='float32')
-            index.add_with_ids(embedding, np.array([vector_id], dtype='int64'))
-
-            # Store the text with the corresponding ID
-            id_to_text[vector_id] = text
-
-            # Tie this vector to the document for context filtering
-            if document_id is not None:
-                id_to_doc[vector_id] = document_id
-
-            # Save the index and mappings (use data_dir so all workers share the same files)
-            index_path = self._p(index_file)
-            mapping_path = self._p(mapping_file)
-            doc_mapping_path = self._p(doc_mapping_file)
-            faiss.write_index(index, index_path)
-            try:
-                with open(index_path, 'r+b') as f:
-                    os.fsync(f.fileno())
-            except Exception:
-                pass
-            with open(mapping_path, 'wb') as f:
-                pickle.dump(id_to_text, f)
-                f.flush()
-                os.fsync(f.fileno())
-            if document_id is not None:
-                with open(doc_mapping_path, 'wb') as f:
-                    pickle.dump(id_to_doc, f)
-                    f.flush()
-                    os.fsync(f.fileno())
-            print(f"Added embedding with ID {vector_id} to {'advanced' if advanced else 'simple'} FAISS index."
-                  + (f" document_id={document_id}" if document_id else ""))
+        Args:
+            embedding (np.ndarray): The embedding vector.
+            text (str): The text corresponding to the embedding.
+            advanced (bool): Use advanced index/mappings.
+            document_id (str|None): Document this chunk/summary belongs to (for context filtering).
+
+        Returns:
+            np.ndarray: The new vector id (one-element int64 array).
+        """
+        return self.save_embeddings(np.array([embedding], dtype='float32'), [text], document_id=document_id,
+                                    advanced=advanced)
+
+    def save_embeddings(self, matrix, texts, document_id=None, advanced=False):
+        """
+        Saves a document's embeddings and texts into the simple or advanced partition in one go
+        (VectorStore.add: one chunk-store append, one add_with_ids, one transaction-like commit).
+        Optionally ties the vectors to a document_id for contextual retrieval. On failure nothing
+        is persisted and the error is raised, so ingestion fails instead of publishing a document
+        without vectors.
+
+        Args:
+            matrix (np.ndarray): 2D array with one embedding per row.
+            texts (List[str]): The text for each row of matrix.
+            document_id (str|None): Document these chunks belong to (for context filtering).
+            advanced (bool): Use advanced index/mappings.
+
+        Returns:
+            np.ndarray: The new vector ids (int64).
+        """
+        try:
+            return self.vectors.add('advanced' if advanced else 'simple', matrix, texts, document_id=document_id)
         except Exception as e:
-            print(f"Error saving embedding or index: {e}")
+            print(f"Error saving embeddings or index: {e}")
+            raise
+
+    def rebuild_index(self, advanced=False, kind='flat', nlist=None, pq_m=None, accept=None):
+        """
+        Rebuilds a partition's FAISS index as another kind, keeping every vector id and the metric.
+
+        Args:
+            advanced (bool): Rebuild the advanced partition instead of the simple one.
+            kind (str): 'flat', 'ivf_flat', 'ivf_pq' or 'hnsw'.
+            nlist (int, optional): IVF list count.
+            pq_m (int, optional): PQ sub-quantizers.
+            accept (callable, optional): accept(vectors, ids, candidate) -> bool, checked before installing.
+
+        Returns:
+            faiss.Index: The new index (None if the partition is empty or the candidate was rejected).
+        """
+        return self.vectors.rebuild_index('advanced' if advanced else 'simple', kind, nlist=nlist, pq_m=pq_m,
+                                          accept=accept)
+
+    def install_index(self, index, advanced=False):
+        """Persists index as the partition's FAISS index and bumps the manifest so all workers reload it."""
+        return self.vectors.install_index('advanced' if advanced else 'simple', index)
 
     def get_processed_documents(self):
-        # Reload from disk so all workers (e.g. gunicorn -w 4) return the latest list.
+        # Refresh from disk so all workers (e.g. gunicorn -w 4) return the latest list.
         # Otherwise the upload worker updates the file but other workers still have stale in-memory data.
-        self.load_processed_documents()
+        self._refresh_if_stale()
         out = []
         for doc in self.processed_documents.values():
             d = dict(doc)
@@ -739,21 +1291,60 @@ class MainRoutes:
     def update_document(self):
         """Update display_name (or title) for a document so users can set a recognizable label."""
         try:
-            self.load_processed_documents()
             data = request.get_json() or {}
             document_id = data.get('document_id')
             display_name = data.get('display_name', '').strip() or None
             if not document_id:
                 return jsonify({'error': 'document_id required'}), 400
-            if document_id not in self.processed_documents:
+
+            def rename(documents):
+                if document_id not in documents:
+                    return None
+                documents[document_id]['display_name'] = display_name
+                return documents[document_id]
+
+            doc = self.update_processed_documents(rename)
+            if doc is None:
                 return jsonify({'error': 'Document not found'}), 404
-            self.processed_documents[document_id]['display_name'] = display_name
-            self.save_processed_documents()
-            return jsonify(self.processed_documents[document_id]), 200
+            return jsonify(doc), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    
+    def delete_document(self, document_id):
+        """
+        DELETE /documents/<document_id>: removes the document's vectors (tombstoned in the chunk store,
+        remove_ids on the index), its metadata and its upload hash. When enough of the partition is dead,
+        a background compaction job rewrites the chunk store and index without the dead entries.
+        """
+        try:
+            self._refresh_if_stale()
+            doc_meta = self.processed_documents.get(document_id)
+            if not doc_meta:
+                return jsonify({'error': 'Document not found'}), 404
+            partition = self.vectors.partition_for(doc_meta.get('processing'))
+            removed = self.vectors.delete_document(partition.name, document_id)
+            self.update_processed_documents(lambda documents: documents.pop(document_id, None))
+            self.unregister_file_hashes(document_id)
+
+            compaction_job = None
+            if self.vectors.dead_fraction(partition.name) >= COMPACTION_DEAD_RATIO:
+                compaction_job = self.jobs.submit('compact', self.compact_partition, partition.name)
+            return jsonify({
+                'deleted': document_id,
+                'vectors_removed': removed,
+                'compaction_job_id': compaction_job,
+                'compaction_status_url': f'/jobs/{compaction_job}' if compaction_job else None
+            }), 200
+        except Exception as e:
+            print(f"Error deleting document {document_id}: {e}")
+            return jsonify({'error': str(e)}), 500
+
+    def compact_partition(self, name, progress=None):
+        """Job body: compacts one partition (see VectorStore.compact)."""
+        if progress:
+            progress('compact', 0.0)
+        return self.vectors.compact(name)
+
     def construct_prompt(self, question, contexts):
         """
         Constructs a prompt for the language model using the question and retrieved contexts.
@@ -788,67 +1379,94 @@ class MainRoutes:
             Returns:
                 str: The generated answer.
             """
-            response = client.chat.completions.create(
-                model='gpt-3.5-turbo',
+            response = openai_client.call(
+                'answer', client.chat.completions.create,
+                budget_tokens=self.chat_budget(prompt),
+                model=CHAT_MODEL,
                 messages=[{'role': 'user', 'content': prompt}],
-                max_tokens=500,
+                max_tokens=CHAT_MAX_TOKENS,
                 temperature=0.5
             )
             answer = response.choices[0].message.content.strip()
             return answer
         except Exception as e:
             print(f"Error generating answer from prompt: {e}")
-            return "Sorry, an error occurred while generating the answer."
+            return ANSWER_ERROR_MESSAGE
     
     
 
+    async def generate_answer_async(self, prompt):
+        """generate_answer_from_prompt with the async client (ASGI mode): the worker holds no thread while waiting."""
+        try:
+            response = await openai_client.acall(
+                'answer', async_client.chat.completions.create,
+                budget_tokens=self.chat_budget(prompt),
+                model=CHAT_MODEL,
+                messages=[{'role': 'user', 'content': prompt}],
+                max_tokens=CHAT_MAX_TOKENS,
+                temperature=0.5
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error generating answer from prompt: {e}")
+            return ANSWER_ERROR_MESSAGE
+
+    async def stream_answer_async(self, prompt):
+        """stream_answer_from_prompt with the async client: an async generator of answer pieces."""
+        chunks = openai_client.astream(
+            'answer', async_client.chat.completions.create,
+            budget_tokens=self.chat_budget(prompt),
+            model=CHAT_MODEL,
+            messages=[{'role': 'user', 'content': prompt}],
+            max_tokens=CHAT_MAX_TOKENS,
+            temperature=0.5
+        )
+        async for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    def stream_answer_from_prompt(self, prompt):
+        """
+        Streaming variant of generate_answer_from_prompt: yields the answer's text pieces as the
+        model produces them (stream=True). Errors are raised to the caller, which may already
+        have sent part of the answer.
+
+        Args:
+            prompt (str): The prompt to send to the API.
+
+        Yields:
+            str: The next piece of the answer.
+        """
+        chunks = openai_client.stream(
+            'answer', client.chat.completions.create,
+            budget_tokens=self.chat_budget(prompt),
+            model=CHAT_MODEL,
+            messages=[{'role': 'user', 'content': prompt}],
+            max_tokens=CHAT_MAX_TOKENS,
+            temperature=0.5
+        )
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
     # Helper methods to handle tokens
     def encode_text(self, text):
-        encoding = tiktoken.encoding_for_model('gpt-3.5-turbo')
-        return encoding.encode(text)
+        return get_encoding().encode(text)
+
+    def chat_budget(self, prompt):
+        """Tokens a chat call counts against the rate limiter: the prompt plus the completion allowance."""
+        return len(self.encode_text(prompt)) + CHAT_MAX_TOKENS
 
     def decode_tokens(self, tokens):
-        encoding = tiktoken.encoding_for_model('gpt-3.5-turbo')
-        return encoding.decode(tokens)
+        return get_encoding().decode(tokens)
     
-    def _reload_faiss_and_mappings(self):
-        """Reload FAISS indices and id_to_text / id_to_document_id from disk.
+    def _reload_faiss_and_mappings(self, partitions=PARTITIONS):
+        """Reload FAISS indices, chunk stores and document indexes from disk for the given partitions.
         Ensures any gunicorn worker has the latest chunks so newly uploaded docs are queryable without restart.
         """
-        if os.path.exists(self._p('id_to_text.pkl')):
-            try:
-                with open(self._p('id_to_text.pkl'), 'rb') as f:
-                    self.id_to_text = pickle.load(f)
-            except Exception as e:
-                print(f"Error reloading id_to_text.pkl: {e}")
-        if os.path.exists(self._p('id_to_text_advanced.pkl')):
-            try:
-                with open(self._p('id_to_text_advanced.pkl'), 'rb') as f:
-                    self.id_to_text_advanced = pickle.load(f)
-            except Exception as e:
-                print(f"Error reloading id_to_text_advanced.pkl: {e}")
-        if os.path.exists(self._p('id_to_document_id.pkl')):
-            try:
-                with open(self._p('id_to_document_id.pkl'), 'rb') as f:
-                    self.id_to_document_id = pickle.load(f)
-            except Exception as e:
-                print(f"Error reloading id_to_document_id.pkl: {e}")
-        if os.path.exists(self._p('id_to_document_id_advanced.pkl')):
-            try:
-                with open(self._p('id_to_document_id_advanced.pkl'), 'rb') as f:
-                    self.id_to_document_id_advanced = pickle.load(f)
-            except Exception as e:
-                print(f"Error reloading id_to_document_id_advanced.pkl: {e}")
-        if os.path.exists(self._p('faiss_index.index')):
-            try:
-                self.faiss_index = faiss.read_index(self._p('faiss_index.index'))
-            except Exception as e:
-                print(f"Error reloading faiss_index.index: {e}")
-        if os.path.exists(self._p('faiss_index_advanced.index')):
-            try:
-                self.faiss_index_advanced = faiss.read_index(self._p('faiss_index_advanced.index'))
-            except Exception as e:
-                print(f"Error reloading faiss_index_advanced.index: {e}")
+        self.vectors.load(partitions)
 
     def load_faiss_index(self, index_file):
         path = self._p(index_file) if not os.path.isabs(index_file) else index_file
@@ -864,25 +1482,10 @@ class MainRoutes:
             print(f"FAISS index file {index_file} does not exist.")
             return None
 
-    def load_id_to_text(self, mapping_file):
-        path = self._p(mapping_file) if not os.path.isabs(mapping_file) else mapping_file
-        if os.path.exists(path):
-            try:
-                with open(path, 'rb') as f:
-                    id_to_text = pickle.load(f)
-                print(f"Loaded id_to_text mapping from {mapping_file}.")
-                return id_to_text
-            except Exception as e:
-                print(f"Error loading id_to_text mapping from {mapping_file}: {e}")
-                return {}
-        else:
-            print(f"id_to_text mapping file {mapping_file} does not exist.")
-            return {}
-        
-    def extract_title(self, file_path, filename):
-        # Try to extract from PDF, fallback to filename (without extension)
+    def extract_title(self, file_path, filename, reader=None):
+        # Try to extract from PDF (reusing an already-parsed reader), fallback to filename (without extension)
         try:
-            reader = PdfReader(file_path)
+            reader = reader if reader is not None else PdfReader(file_path)
             first_page = reader.pages[0]
             text = first_page.extract_text()
             if text:
@@ -898,21 +1501,18 @@ class MainRoutes:
     def get_document_chunks(self, document_id, processing_mode):
         """
         Retrieve all chunk IDs and texts for a given document_id and processing mode.
-        Uses stored id_to_document_id when available; falls back to title heuristic for legacy data.
+        Uses the document_id -> vector ids index when available (O(chunks in doc));
+        falls back to title heuristic for legacy data.
         Returns a list of (chunk_id, chunk_text).
         """
-        if processing_mode == "advanced":
-            id_to_text = self.id_to_text_advanced
-            id_to_doc = self.id_to_document_id_advanced
-        else:
-            id_to_text = self.id_to_text
-            id_to_doc = self.id_to_document_id
-
-        # Prefer explicit vector -> document_id mapping (set for new uploads)
-        if id_to_doc:
-            chunk_ids = [idx for idx, doc_id in id_to_doc.items() if doc_id == document_id]
-            if chunk_ids:
-                return [(idx, id_to_text[idx]) for idx in chunk_ids if idx in id_to_text]
+        partition = self.vectors.partition_for(processing_mode)
+        id_to_text = partition.chunks
+        doc_index = partition.doc_index
+
+        # Prefer the document -> vector ids index (kept in sync with id_to_document_id for new uploads)
+        chunk_ids = doc_index.get(document_id)
+        if chunk_ids is not None and len(chunk_ids):
+            return [(idx, id_to_text[idx]) for idx in chunk_ids.tolist() if idx in id_to_text]
         # Fallback: heuristic for legacy data (no id_to_document_id or doc not in mapping)
         doc_meta = self.processed_documents.get(document_id)
         if not doc_meta:
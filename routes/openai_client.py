@@ -0,0 +1,248 @@
+"""
+OpenAI client layer shared by every API call the routes make: the lazily created PromptLayer-wrapped
+clients (sync, and async for asgi.py) with a pooled HTTP connection per process, and call()/stream()
+(acall()/astream() for coroutines) which add per-operation timeouts, the shared rate limiter
+(routes/rate_limit.py), a concurrency limit per API and jittered exponential backoff on 429/5xx.
+
+    response = call('answer', client.chat.completions.create, budget_tokens=n, model=..., messages=...)
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+
+# Per-operation request timeouts (seconds) and the connect timeout of every request. Summaries of large
+# uploads keep using SUMMARY_TIMEOUT (also applied per call by the map-reduce summariser).
+OPENAI_EMBEDDING_TIMEOUT = float(os.environ.get('OPENAI_EMBEDDING_TIMEOUT', 30))
+OPENAI_ANSWER_TIMEOUT = float(os.environ.get('OPENAI_ANSWER_TIMEOUT', 60))
+OPENAI_SUMMARY_TIMEOUT = float(os.environ.get('SUMMARY_TIMEOUT', 60))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+
+# Retries of 408/409/429/5xx and connection failures: full-jitter exponential backoff, base * 2^attempt
+# seconds capped at OPENAI_BACKOFF_MAX (a longer Retry-After from the server is honoured up to the cap).
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 4))
+OPENAI_BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE', 0.5))
+OPENAI_BACKOFF_MAX = float(os.environ.get('OPENAI_BACKOFF_MAX', 20))
+
+# Calls in flight per API and process. Threads (sync workers, ingest and summary pools) share the first
+# two; each event loop of the async serving mode gets OPENAI_ASYNC_CONCURRENCY per API.
+OPENAI_CHAT_CONCURRENCY = int(os.environ.get('OPENAI_CHAT_CONCURRENCY', 16))
+OPENAI_EMBEDDING_CONCURRENCY = int(os.environ.get('OPENAI_EMBEDDING_CONCURRENCY', 16))
+OPENAI_ASYNC_CONCURRENCY = int(os.environ.get('OPENAI_ASYNC_CONCURRENCY', 256))
+
+# operation -> (API whose rate and concurrency limits it uses, default timeout, default priority)
+OPERATIONS = {
+    'embedding': ('embeddings', OPENAI_EMBEDDING_TIMEOUT, 'background'),
+    'answer': ('chat', OPENAI_ANSWER_TIMEOUT, 'interactive'),
+    'summary': ('chat', OPENAI_SUMMARY_TIMEOUT, 'background'),
+}
+
+# Shared requests/tokens budget (a routes.rate_limit.RateLimiter, installed by MainRoutes); None = unlimited
+rate_limiter = None
+# Set by interactive() for calls made on behalf of a user request (e.g. embedding an /ask question)
+_interactive = contextvars.ContextVar('openai_interactive', default=False)
+
+_semaphores = {
+    'chat': threading.BoundedSemaphore(OPENAI_CHAT_CONCURRENCY),
+    'embeddings': threading.BoundedSemaphore(OPENAI_EMBEDDING_CONCURRENCY),
+}
+# asyncio semaphores belong to one event loop: {loop: {api: Semaphore}}
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+class LazyOpenAIClient:
+    """
+    The PromptLayer-wrapped OpenAI client, created on first use. Importing promptlayer and openai
+    is most of the app's import time, and requests that never call the API (/, /processed_documents,
+    cached answers) should not pay for it. Attribute access is forwarded to the real client.
+    class_name selects the client class: 'OpenAI', or 'AsyncOpenAI' for the ASGI serving mode.
+    The client keeps a pool of keep-alive connections sized to the concurrency limits; retries are
+    done by call()/stream(), so the SDK's own are disabled.
+    """
+
+    def __init__(self, class_name='OpenAI'):
+        self.class_name = class_name
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from promptlayer import PromptLayer
+                    asynchronous = self.class_name == 'AsyncOpenAI'
+                    connections = (2 * OPENAI_ASYNC_CONCURRENCY if asynchronous
+                                   else OPENAI_CHAT_CONCURRENCY + OPENAI_EMBEDDING_CONCURRENCY)
+                    http_client = (httpx.AsyncClient if asynchronous else httpx.Client)(
+                        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                        timeout=httpx.Timeout(OPENAI_ANSWER_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT))
+                    promptlayer_client = PromptLayer()
+                    OpenAI = getattr(promptlayer_client.openai, self.class_name)
+                    self._client = OpenAI(http_client=http_client, max_retries=0)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+client = LazyOpenAIClient()
+# Awaitable client for the async handlers (asgi.py): in-flight calls hold no thread
+async_client = LazyOpenAIClient('AsyncOpenAI')
+
+
+def retry_delay(error, attempt):
+    """
+    How long to wait before retrying a failed call.
+
+    Args:
+        error (Exception): What the call raised.
+        attempt (int): Retries already made.
+
+    Returns:
+        float|None: Seconds to sleep, or None when the error is final (not retryable, or out of retries).
+    """
+    import openai
+    status = getattr(error, 'status_code', None)
+    if isinstance(error, openai.APIStatusError):
+        retryable = status in (408, 409, 429) or status >= 500
+    else:
+        # A timed-out call has already used its whole budget; connection failures are retried
+        retryable = isinstance(error, openai.APIConnectionError) and not isinstance(error, openai.APITimeoutError)
+    if not retryable or attempt >= OPENAI_MAX_RETRIES:
+        return None
+    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    try:
+        retry_after = float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        retry_after = 0
+    return max(delay, min(retry_after, OPENAI_BACKOFF_MAX))
+
+
+@contextlib.contextmanager
+def interactive():
+    """Calls made inside this block get interactive priority from the rate limiter."""
+    token = _interactive.set(True)
+    try:
+        yield
+    finally:
+        _interactive.reset(token)
+
+
+def _prepare(operation, kwargs):
+    api, timeout, priority = OPERATIONS[operation]
+    kwargs.setdefault('timeout', timeout)
+    return api, 'interactive' if _interactive.get() else priority
+
+
+def call(operation, create, budget_tokens=0, **kwargs):
+    """
+    Makes one API call: waits for the shared rate limiter's budget, then runs it under the operation's
+    timeout and its API's concurrency limit, retrying with backoff.
+
+    Args:
+        operation (str): Key of OPERATIONS ('embedding', 'answer' or 'summary').
+        create (callable): The client method, e.g. client.embeddings.create.
+        budget_tokens (int): Tokens the call counts against the tokens/min limit.
+        **kwargs: Arguments for create; an explicit timeout overrides the operation's.
+
+    Returns:
+        The API response.
+    """
+    api, priority = _prepare(operation, kwargs)
+    attempt = 0
+    while True:
+        # Every attempt, retries included, takes its own request from the budget
+        if rate_limiter is not None:
+            rate_limiter.acquire(api, budget_tokens, priority)
+        try:
+            with _semaphores[api]:
+                return create(**kwargs)
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            print(f"OpenAI {operation} call failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def stream(operation, create, budget_tokens=0, **kwargs):
+    """
+    call() with stream=True, yielding the response chunks. Only opening the stream is retried, and the
+    concurrency slot is held until the stream is exhausted or closed.
+    """
+    api, priority = _prepare(operation, kwargs)
+    kwargs['stream'] = True
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire(api, budget_tokens, priority)
+        with _semaphores[api]:
+            try:
+                chunks = create(**kwargs)
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"OpenAI {operation} call failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+            else:
+                yield from chunks
+                return
+        time.sleep(delay)
+        attempt += 1
+
+
+def _async_semaphore(api):
+    semaphores = _async_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if api not in semaphores:
+        semaphores[api] = asyncio.Semaphore(OPENAI_ASYNC_CONCURRENCY)
+    return semaphores[api]
+
+
+async def acall(operation, create, budget_tokens=0, **kwargs):
+    """call() for the async client."""
+    api, priority = _prepare(operation, kwargs)
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            await rate_limiter.acquire_async(api, budget_tokens, priority)
+        try:
+            async with _async_semaphore(api):
+                return await create(**kwargs)
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            print(f"OpenAI {operation} call failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def astream(operation, create, budget_tokens=0, **kwargs):
+    """stream() for the async client: an async generator of response chunks."""
+    api, priority = _prepare(operation, kwargs)
+    kwargs['stream'] = True
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            await rate_limiter.acquire_async(api, budget_tokens, priority)
+        async with _async_semaphore(api):
+            try:
+                chunks = await create(**kwargs)
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"OpenAI {operation} call failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+            else:
+                async for chunk in chunks:
+                    yield chunk
+                return
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,74 @@
+# routes/pdf_extract.py
+#
+# Streaming PDF text extraction, kept separate from the app modules so the worker processes
+# only ever run PyPDF2 code.
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Large PDFs (>= PDF_PARALLEL_MIN_PAGES pages) are extracted by a process pool in ranges of
+# PDF_PAGES_PER_TASK pages; at most one range per process is in flight, which bounds memory.
+PDF_EXTRACT_PROCESSES = int(os.environ.get('PDF_EXTRACT_PROCESSES', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 64))
+PDF_PAGES_PER_TASK = int(os.environ.get('PDF_PAGES_PER_TASK', 8))
+
+
+def PdfReader(stream, *args, **kwargs):
+    """PyPDF2.PdfReader, imported on first use: only uploads parse PDFs, so app startup skips PyPDF2."""
+    from PyPDF2 import PdfReader as reader_class
+    return reader_class(stream, *args, **kwargs)
+
+
+def page_text(page):
+    """Text of one PdfReader page with newlines flattened ('' if the page has no text layer)."""
+    return (page.extract_text() or '').replace('\n', ' ')
+
+
+def extract_page_range(pdf_path, start, stop):
+    """Runs in a worker process: returns the text of pages [start, stop)."""
+    reader = PdfReader(pdf_path)
+    return [page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def _pool_context():
+    """
+    Start method of the extraction processes. This runs on ingestion job threads, and forking a
+    process that has other threads (job pool, FAISS/BLAS, HTTP clients) can copy a held lock into
+    the child, so workers are forked from a clean forkserver that only preloads this module (spawn
+    where there is no forkserver). Children still import the main script, which is guarded
+    against that in app.py.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def iter_page_texts(pdf_path, reader=None):
+    """
+    Yields the text of each page of a PDF, in order, as soon as it is extracted.
+    Small files are read page by page from reader (opened here if not given); large files
+    are split into page ranges extracted in parallel by worker processes.
+    Args:
+        pdf_path (str): Path to the PDF file.
+        reader (PdfReader, optional): Already-parsed reader to reuse.
+    Yields:
+        str: Page text.
+    """
+    reader = reader if reader is not None else PdfReader(pdf_path)
+    n_pages = len(reader.pages)
+    if n_pages < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_PROCESSES < 2:
+        for page in reader.pages:
+            yield page_text(page)
+        return
+
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, n_pages)) for start in range(0, n_pages, PDF_PAGES_PER_TASK))
+    with ProcessPoolExecutor(max_workers=PDF_EXTRACT_PROCESSES, mp_context=_pool_context()) as executor:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < PDF_EXTRACT_PROCESSES:
+                in_flight.append(executor.submit(extract_page_range, pdf_path, *ranges.popleft()))
+            yield from in_flight.popleft().result()
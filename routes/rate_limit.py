@@ -0,0 +1,135 @@
+# routes/rate_limit.py
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import anyio.to_thread
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# Upstream limits per API: requests and tokens per minute (0 disables that limit). Tokens are the
+# prompt/input tokens (tiktoken count) plus max_tokens for completions, as the provider counts them.
+OPENAI_CHAT_RPM = int(os.environ.get('OPENAI_CHAT_RPM', 3500))
+OPENAI_CHAT_TPM = int(os.environ.get('OPENAI_CHAT_TPM', 90000))
+OPENAI_EMBEDDING_RPM = int(os.environ.get('OPENAI_EMBEDDING_RPM', 3000))
+OPENAI_EMBEDDING_TPM = int(os.environ.get('OPENAI_EMBEDDING_TPM', 1000000))
+# Share of each bucket that background (ingestion) calls leave for interactive /ask calls.
+RATE_LIMIT_INTERACTIVE_RESERVE = float(os.environ.get('RATE_LIMIT_INTERACTIVE_RESERVE', 0.2))
+
+PRIORITIES = ('interactive', 'background')
+
+
+def default_limits():
+    return {
+        'chat': (OPENAI_CHAT_RPM, OPENAI_CHAT_TPM),
+        'embeddings': (OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM),
+    }
+
+
+class RateLimiter:
+    """
+    Token buckets per API (one for requests, one for tokens, each holding a minute of budget and
+    refilling continuously) kept in one small JSON file in DATA_DIR. Every take is a read-modify-write
+    of that file under fcntl.flock, so all worker processes and threads draw from the same budget.
+    Background calls may not take the last RATE_LIMIT_INTERACTIVE_RESERVE of a bucket, so while
+    ingestion saturates the API an /ask call still goes through (or waits least).
+    Without fcntl (non-POSIX) the budget is only shared by the threads of one process.
+    """
+
+    def __init__(self, path, limits=None, interactive_reserve=None, clock=time.time):
+        self.path = path
+        self.limits = limits if limits is not None else default_limits()
+        self.interactive_reserve = (RATE_LIMIT_INTERACTIVE_RESERVE if interactive_reserve is None
+                                    else interactive_reserve)
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Seconds this process spent waiting for budget, per priority (for monitoring)
+        self.waited = dict.fromkeys(PRIORITIES, 0.0)
+
+    def try_take(self, api, tokens=0, priority='background'):
+        """
+        Takes one request and `tokens` tokens from the API's buckets if they hold enough.
+
+        Args:
+            api (str): 'chat' or 'embeddings'.
+            tokens (int): Tokens the call will use.
+            priority (str): 'interactive' or 'background'.
+
+        Returns:
+            float: 0 if the budget was taken, else the seconds until it could be.
+        """
+        rpm, tpm = self.limits.get(api, (0, 0))
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+        floor = self.interactive_reserve if priority == 'background' else 0.0
+        with self._lock, open(self.path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}  # torn write from a killed process: start from full buckets
+            now = self.clock()
+            bucket = state.get(api) or {'requests': rpm, 'tokens': tpm, 'updated': now}
+            elapsed = max(0.0, now - bucket['updated'])
+            wait = 0.0
+            levels = {}
+            for key, limit, amount in (('requests', rpm, 1), ('tokens', tpm, tokens)):
+                if limit <= 0:
+                    continue
+                level = min(limit, bucket[key] + elapsed * limit / 60)
+                # A call larger than the bucket could never run: let it through once the bucket is full
+                need = min(amount, limit * (1 - floor)) + floor * limit
+                levels[key] = (level, min(amount, level))
+                if level < need:
+                    wait = max(wait, (need - level) * 60 / limit)
+            bucket['updated'] = now
+            for key, (level, amount) in levels.items():
+                bucket[key] = level - amount if wait == 0 else level
+            state[api] = bucket
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+        return wait
+
+    def acquire(self, api, tokens=0, priority='background'):
+        """Blocks until try_take succeeds; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            wait = self.try_take(api, tokens, priority)
+            if wait == 0:
+                break
+            # Jitter so processes woken together do not all retry at the same instant
+            pause = min(wait, 1.0) * random.uniform(1.0, 1.1)
+            time.sleep(pause)
+            waited += pause
+        self.waited[priority] += waited
+        return waited
+
+    async def acquire_async(self, api, tokens=0, priority='background'):
+        """
+        acquire() for coroutines: try_take (file open, flock, rewrite) runs in a worker thread, since
+        flock can block while other processes hold the file, and waits use asyncio.sleep.
+        """
+        waited = 0.0
+        while True:
+            wait = await anyio.to_thread.run_sync(self.try_take, api, tokens, priority)
+            if wait == 0:
+                break
+            pause = min(wait, 1.0) * random.uniform(1.0, 1.1)
+            await asyncio.sleep(pause)
+            waited += pause
+        self.waited[priority] += waited
+        return waited
+
+    def stats(self):
+        return {'waited_seconds': {priority: round(seconds, 3) for priority, seconds in self.waited.items()}}
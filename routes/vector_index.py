@@ -0,0 +1,265 @@
+# routes/vector_index.py
+#
+# FAISS index construction, loading and search parameters. Partitions start as an exact 'flat' index;
+# scripts/build_ann_index.py promotes them to an approximate index (IVF-Flat, IVF-PQ or HNSW) once they
+# pass FAISS_ANN_THRESHOLD vectors. Every kind is wrapped in IndexIDMap, so vector ids never change.
+
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+METRICS = {'l2': faiss.METRIC_L2, 'ip': faiss.METRIC_INNER_PRODUCT}
+
+# Similarity for new partitions: 'ip' stores L2-normalised vectors in an inner-product index (cosine
+# similarity, what ada-002 is built for); 'l2' is raw Euclidean distance. Existing indexes keep the
+# metric they were built with until scripts/migrate_index_metric.py converts them.
+FAISS_METRIC = os.environ.get('FAISS_METRIC', 'ip')
+
+# Kind the offline trainer promotes to, and the partition size (ntotal) at which it does so.
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'ivf_flat')
+FAISS_ANN_THRESHOLD = int(os.environ.get('FAISS_ANN_THRESHOLD', 50000))
+# IVF: number of lists (0 = about 4 * sqrt(ntotal)) and lists probed per query.
+FAISS_IVF_NLIST = int(os.environ.get('FAISS_IVF_NLIST', 0))
+FAISS_IVF_NPROBE = int(os.environ.get('FAISS_IVF_NPROBE', 16))
+# IVF-PQ: sub-quantizers (must divide the dimension) and bits per code.
+FAISS_PQ_M = int(os.environ.get('FAISS_PQ_M', 64))
+FAISS_PQ_NBITS = int(os.environ.get('FAISS_PQ_NBITS', 8))
+# HNSW: neighbours per node, build-time and query-time beam widths.
+FAISS_HNSW_M = int(os.environ.get('FAISS_HNSW_M', 32))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.environ.get('FAISS_HNSW_EF_CONSTRUCTION', 200))
+FAISS_HNSW_EF_SEARCH = int(os.environ.get('FAISS_HNSW_EF_SEARCH', 64))
+# Load indexes with IO_FLAG_MMAP: the vectors of IVF-layout indexes (flat, IVF-Flat, IVF-PQ) stay in the
+# OS page cache, shared by every worker, instead of one private copy per worker. faiss cannot map HNSW
+# graphs or legacy IndexFlat files; those are read into memory as before.
+FAISS_MMAP = os.environ.get('FAISS_MMAP', '1') != '0'
+
+
+def _exact_index(dimension, metric):
+    """
+    Exact search stored as an IVF-Flat index with a single inverted list: every vector lands in that
+    list and every search scans it, so results equal IndexFlat's, but the file uses the inverted-list
+    layout that faiss can memory-map. Nothing to train, so the first upload can add to it.
+    """
+    quantizer = faiss.IndexFlatIP(dimension) if metric == 'ip' else faiss.IndexFlatL2(dimension)
+    quantizer.add(np.zeros((1, dimension), dtype='float32'))
+    inner = faiss.IndexIVFFlat(quantizer, dimension, 1, METRICS[metric])
+    inner.is_trained = True
+    return inner
+
+
+def new_index(dimension, metric=None):
+    """Exact index used for new partitions."""
+    return faiss.IndexIDMap(_exact_index(dimension, metric or FAISS_METRIC))
+
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+
+
+def _inverted_lists(index):
+    inner = _inner(index)
+    return faiss.downcast_InvertedLists(inner.invlists) if isinstance(inner, faiss.IndexIVF) else None
+
+
+def read_index(path):
+    """Reads an index file, memory-mapping its inverted lists (read-only) when FAISS_MMAP is on."""
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP) if FAISS_MMAP else faiss.read_index(path)
+
+
+def is_mapped(index):
+    """True if index's vectors are a read-only mapping of its file: adding or removing would abort the process."""
+    return isinstance(_inverted_lists(index), faiss.OnDiskInvertedLists)
+
+
+def is_mappable(index):
+    """True if index, once written, can be loaded memory-mapped by read_index."""
+    return FAISS_MMAP and isinstance(_inverted_lists(index), faiss.ArrayInvertedLists)
+
+
+def index_metric(index):
+    """'ip' or 'l2' for an index (the metric lives in the index file, not in the config)."""
+    return 'ip' if index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2'
+
+
+def prepare_vectors(index, vectors):
+    """
+    float32 copy of vectors ready for index: L2-normalised (so inner product is cosine similarity)
+    when the index uses the inner-product metric, unchanged otherwise. Used at insert and query time.
+    """
+    vectors = np.array(vectors, dtype='float32', ndmin=2, order='C')
+    if index_metric(index) == 'ip':
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_kind(index):
+    """One of INDEX_TYPES for an IndexIDMap built by this module (a single-list IVF-Flat is 'flat')."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'flat' if inner.nlist == 1 else 'ivf_flat'
+    return 'flat'
+
+
+def _ivf_labels(inner, list_no):
+    """Writable view of the labels (positions in the IndexIDMap's id_map) stored in one inverted list."""
+    invlists = inner.invlists
+    return faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no))
+
+
+def extract_vectors(index):
+    """
+    Returns (vectors, ids) stored in an IndexIDMap, in insertion order.
+    Exact for flat, IVF-Flat and HNSW; IVF-PQ returns the PQ reconstructions.
+    IVF indexes are read list by list: a direct map needs sequential labels (which removals break)
+    and building one would change the live index.
+    """
+    id_map = faiss.vector_to_array(index.id_map).astype('int64')
+    inner = faiss.downcast_index(index.index)
+    if not isinstance(inner, faiss.IndexIVF):
+        return np.ascontiguousarray(inner.reconstruct_n(0, inner.ntotal), dtype='float32'), id_map
+    labels, vectors = [], []
+    for list_no in range(inner.nlist):
+        size = inner.invlists.list_size(list_no)
+        if not size:
+            continue
+        labels.append(_ivf_labels(inner, list_no).copy())
+        if isinstance(inner, faiss.IndexIVFFlat):
+            codes = faiss.rev_swig_ptr(inner.invlists.get_codes(list_no), size * inner.code_size)
+            vectors.append(codes.view('float32').reshape(size, inner.d).copy())
+        else:
+            decoded = np.empty((size, inner.d), dtype='float32')
+            for offset in range(size):
+                inner.reconstruct_from_offset(list_no, offset, faiss.swig_ptr(decoded[offset]))
+            vectors.append(decoded)
+    if not labels:
+        return np.zeros((0, inner.d), dtype='float32'), id_map
+    labels = np.concatenate(labels)
+    if len(labels) != len(id_map) or labels.min() < 0 or labels.max() >= len(id_map):
+        raise ValueError(f"Index labels do not match its {len(id_map)} ids; rebuild it from the chunk store's embeddings")
+    order = np.argsort(labels, kind='stable')
+    return np.ascontiguousarray(np.concatenate(vectors)[order], dtype='float32'), id_map[labels[order]]
+
+
+def remove_ids(index, ids):
+    """
+    index.remove_ids(ids) that keeps an IndexIDMap over an IVF index consistent: the IndexIDMap
+    compacts its id_map, but the IVF lists keep each survivor's old position as its label, so search
+    would return the wrong ids. Survivors are relabelled to their new positions.
+
+    Returns:
+        int: Vectors removed. Raises RuntimeError for kinds that cannot remove (HNSW).
+    """
+    ids = np.ascontiguousarray(ids, dtype='int64')
+    inner = faiss.downcast_index(index.index)
+    if not isinstance(inner, faiss.IndexIVF):
+        return index.remove_ids(ids)
+    removed_positions = np.flatnonzero(np.isin(faiss.vector_to_array(index.id_map), ids))
+    removed = index.remove_ids(ids)
+    for list_no in range(inner.nlist):
+        if inner.invlists.list_size(list_no):
+            labels = _ivf_labels(inner, list_no)
+            labels -= np.searchsorted(removed_positions, labels)
+    return removed
+
+
+def build_index(kind, vectors, ids, nlist=None, pq_m=None, metric=None):
+    """
+    Trains and fills a new IndexIDMap of the given kind with (vectors, ids).
+    Vectors are normalised first when metric is 'ip'.
+
+    Args:
+        kind (str): One of INDEX_TYPES.
+        vectors (np.ndarray): 2D float32 array, one vector per row.
+        ids (np.ndarray): int64 vector ids, one per row (preserved as-is).
+        nlist (int, optional): IVF list count; defaults to FAISS_IVF_NLIST or ~4*sqrt(n).
+        pq_m (int, optional): PQ sub-quantizers; defaults to FAISS_PQ_M.
+        metric (str, optional): 'ip' or 'l2'; defaults to FAISS_METRIC.
+
+    Returns:
+        faiss.IndexIDMap: The populated index.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {', '.join(INDEX_TYPES)}")
+    metric = metric or FAISS_METRIC
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+    vectors = np.array(vectors, dtype='float32', order='C')
+    if metric == 'ip':
+        faiss.normalize_L2(vectors)
+    dimension = vectors.shape[1]
+    if kind == 'flat':
+        inner = _exact_index(dimension, metric)
+    elif kind == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dimension, FAISS_HNSW_M, METRICS[metric])
+        inner.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    else:
+        nlist = nlist or FAISS_IVF_NLIST or max(1, int(4 * math.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))  # k-means needs at least one point per list
+        quantizer = faiss.IndexFlatIP(dimension) if metric == 'ip' else faiss.IndexFlatL2(dimension)
+        if kind == 'ivf_flat':
+            inner = faiss.IndexIVFFlat(quantizer, dimension, nlist, METRICS[metric])
+        else:
+            pq_m = pq_m or FAISS_PQ_M
+            if dimension % pq_m:
+                raise ValueError(f"FAISS_PQ_M={pq_m} must divide the embedding dimension {dimension}")
+            inner = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, FAISS_PQ_NBITS, METRICS[metric])
+        inner.train(vectors)
+        inner.nprobe = FAISS_IVF_NPROBE
+    index = faiss.IndexIDMap(inner)
+    index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype='int64'))
+    return index
+
+
+def convert_metric(index, metric):
+    """Rebuilds index (same kind, same ids) under another metric; used by scripts/migrate_index_metric.py."""
+    vectors, ids = extract_vectors(index)
+    nlist = faiss.extract_index_ivf(index.index).nlist if index_kind(index) in ('ivf_flat', 'ivf_pq') else None
+    pq_m = faiss.downcast_index(index.index).pq.M if index_kind(index) == 'ivf_pq' else None
+    return build_index(index_kind(index), vectors, ids, nlist=nlist, pq_m=pq_m, metric=metric)
+
+
+def search_parameters(index, selector=None, widen=False):
+    """
+    SearchParameters for the index kind carrying selector. widen=True probes every IVF list /
+    uses a much larger HNSW beam, which makes a search restricted to a few ids effectively exact.
+    """
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        ef = max(FAISS_HNSW_EF_SEARCH * 8, 512) if widen else FAISS_HNSW_EF_SEARCH
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef)
+    if isinstance(inner, faiss.IndexIVF):
+        # (the exact single-list layout always probes its one list)
+        nprobe = inner.nlist if widen else min(FAISS_IVF_NPROBE, inner.nlist)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def recall_at_k(exact_index, ann_index, queries, k=5):
+    """
+    Fraction of the exact top-k ids the ANN index also returns, averaged over queries, plus the
+    mean per-query latency (ms) of each index. Used to pick a FAISS_INDEX_TYPE and its parameters.
+    """
+    queries = prepare_vectors(exact_index, queries)
+    started = time.perf_counter()
+    _, expected = exact_index.search(queries, k)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    started = time.perf_counter()
+    _, found = ann_index.search(queries, k, params=search_parameters(ann_index))
+    ann_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    hits = sum(len(set(e[e != -1]) & set(f[f != -1])) for e, f in zip(expected, found))
+    total = int((expected != -1).sum())
+    return {
+        'k': k,
+        'queries': len(queries),
+        'recall': round(hits / total, 4) if total else 1.0,
+        'exact_ms_per_query': round(exact_ms, 3),
+        'ann_ms_per_query': round(ann_ms, 3),
+    }
@@ -0,0 +1,454 @@
+# routes/vector_store.py
+
+import functools
+import os
+import pickle
+import threading
+
+import faiss
+import numpy as np
+
+from routes.atomic_io import atomic_write, atomic_write_many
+from routes.chunk_store import HEADER, ChunkStore, DocumentView
+from routes.vector_index import (FAISS_ANN_THRESHOLD, build_index, convert_metric, extract_vectors, index_kind,
+                                 index_metric, is_mappable, is_mapped, new_index, prepare_vectors, read_index, remove_ids,
+                                 search_parameters)
+
+# Processing modes with their own index. 'simple' keeps the original unsuffixed file names.
+PARTITIONS = ('simple', 'advanced')
+
+
+def build_document_index(id_to_document_id):
+    """Inverts {vector_id: document_id} into {document_id: int64 array of vector ids, ascending}."""
+    grouped = {}
+    for vector_id, document_id in id_to_document_id.items():
+        grouped.setdefault(document_id, []).append(vector_id)
+    return {document_id: np.array(sorted(ids), dtype='int64') for document_id, ids in grouped.items()}
+
+
+def search_index(index, query_embedding, chunk_ids, top_k=5):
+    """
+    Nearest-neighbour search restricted to the given vector ids (one document's chunks).
+    An IDSelectorBatch makes FAISS skip distance computations for every other vector,
+    so the result is the exact top-k within the document. On an approximate (IVF/HNSW)
+    index the search is retried with every list / a wide beam if it found fewer than k.
+
+    Args:
+        index (faiss.Index): The index to search.
+        query_embedding (np.ndarray): The query vector.
+        chunk_ids (List[int]): Vector ids to search among.
+        top_k (int): Number of neighbours to return.
+
+    Returns:
+        List[int]: Vector ids ordered by similarity (closest first).
+    """
+    ids = np.asarray(chunk_ids, dtype='int64')
+    k = min(top_k, len(ids))
+    if k == 0:
+        return []
+    selector = faiss.IDSelectorBatch(ids)
+    query = prepare_vectors(index, query_embedding)
+    _, I = index.search(query, k, params=search_parameters(index, selector))
+    hits = [int(idx) for idx in I[0] if idx != -1]
+    if len(hits) < k and index_kind(index) != 'flat':
+        _, I = index.search(query, k, params=search_parameters(index, selector, widen=True))
+        hits = [int(idx) for idx in I[0] if idx != -1]
+    return hits
+
+
+def _writer(method):
+    """
+    Runs a VectorStore method that changes a partition's files under the store's write lock, after
+    reloading the partition if another worker committed to it since this one last read it, so the
+    method starts from the latest ids, document index and FAISS index instead of overwriting them.
+    """
+    @functools.wraps(method)
+    def locked(self, name, *args, **kwargs):
+        with self.lock:
+            partition = self.partitions[name]
+            if partition.is_stale():
+                partition.load()
+            return method(self, name, *args, **kwargs)
+    return locked
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _loaded_on_access(attribute):
+    """Partition attribute that reads the partition from disk the first time it is used."""
+    def get(self):
+        self.ensure_loaded()
+        return getattr(self, attribute)
+
+    def set(self, value):
+        self.ensure_loaded()
+        setattr(self, attribute, value)
+    return property(get, set)
+
+
+class Partition:
+    """
+    Everything stored for one processing mode: the FAISS index, the chunk store (vector id -> text and
+    document_id) and the document index (document_id -> vector ids), with their files in DATA_DIR.
+    Nothing is read until one of them is first used, so app startup does not pay for partitions.
+    """
+
+    index = _loaded_on_access('_index')
+    chunks = _loaded_on_access('_chunks')
+    documents = _loaded_on_access('_documents')
+    doc_index = _loaded_on_access('_doc_index')
+
+    def __init__(self, name, data_dir):
+        self.name = name
+        self.data_dir = data_dir
+        self.suffix = '' if name == 'simple' else f'_{name}'
+        self.index_path = self._p(f'faiss_index{self.suffix}.index')
+        self.doc_index_path = self._p(f'document_id_to_ids{self.suffix}.pkl')
+        self.loaded = False
+        self._load_lock = threading.RLock()
+        self._index = None
+        self._chunks = None
+        self._documents = None
+        self._doc_index = {}
+        self._signature = None
+
+    def _p(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def load(self):
+        """(Re)loads the partition from disk. Chunk stores are append-only, so reloading only remaps them."""
+        with self._load_lock:
+            # Taken before reading: a commit racing the reads leaves the partition marked stale, never fresh
+            self._signature = self.file_signature()
+            if self._chunks is None:
+                self._chunks = self._open_chunk_store()
+                self._documents = DocumentView(self._chunks)
+            else:
+                try:
+                    self._chunks.refresh()
+                except Exception as e:
+                    print(f"Error reloading {self.name} chunk store: {e}")
+            self._doc_index = self._load_document_index()
+            if os.path.exists(self.index_path):
+                try:
+                    self._index = read_index(self.index_path)
+                except Exception as e:
+                    print(f"Error loading {os.path.basename(self.index_path)}: {e}")
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+
+    def may_have_unlinked_chunks(self):
+        """
+        False when the files show the partition has no chunks, or has a document table, i.e. nothing for
+        scripts/backfill_document_links.py to link. Answered from file sizes, without loading the partition.
+        """
+        idx_path = self._p(f'chunks{self.suffix}.idx')
+        if not os.path.exists(idx_path):
+            # Legacy pickles are imported into a chunk store on first load
+            return os.path.exists(self._p(f'id_to_text{self.suffix}.pkl'))
+        docs_path = self._p(f'chunks{self.suffix}.docs')
+        return os.path.getsize(idx_path) > HEADER.itemsize and not (os.path.exists(docs_path) and os.path.getsize(docs_path))
+
+    def file_signature(self):
+        """(inode, mtime, size) of the index and document index files; os.replace changes the inode."""
+        return _file_signature(self.index_path), _file_signature(self.doc_index_path)
+
+    def is_stale(self):
+        """True if the partition's files were replaced (by another worker) since this object loaded or wrote them."""
+        return self.file_signature() != self._signature
+
+    def mark_synced(self):
+        """Records the files just written by this worker as the loaded state."""
+        self._signature = self.file_signature()
+
+    def _open_chunk_store(self):
+        """Opens the ChunkStore, importing the legacy id_to_text / id_to_document_id pickles if it does not exist yet."""
+        store = ChunkStore(self.data_dir, self.suffix)
+        legacy_pkl = self._p(f'id_to_text{self.suffix}.pkl')
+        if not store.exists() and os.path.exists(legacy_pkl):
+            try:
+                store.import_pickles(legacy_pkl, self._p(f'id_to_document_id{self.suffix}.pkl'))
+            except Exception as e:
+                print(f"Error importing id_to_text{self.suffix}.pkl: {e}")
+        return store
+
+    def _load_document_index(self):
+        """
+        Loads the document_id -> vector ids index. Rebuilt from the chunk store (one pass)
+        when the file is missing, e.g. for data written before the index existed.
+        """
+        if os.path.exists(self.doc_index_path):
+            try:
+                with open(self.doc_index_path, 'rb') as f:
+                    return pickle.load(f)
+            except Exception as e:
+                print(f"Error loading {os.path.basename(self.doc_index_path)}: {e}")
+        return build_document_index(self._documents)
+
+    def writable_index(self):
+        """
+        A private copy of the index for a writer to modify: searches keep using self.index, unchanged,
+        until the writer commits and swaps the copy in (commit_index). A memory-mapped index is
+        read-only (faiss aborts on add/remove), so the copy is read from its file.
+        """
+        if self.index is None:
+            return None
+        if is_mapped(self.index):
+            return faiss.read_index(self.index_path)
+        return faiss.clone_index(self.index)
+
+    def commit_index(self, index, doc_index=None):
+        """After the files were written: swaps in the writer's index (and document index) for searches."""
+        self.index = index
+        if doc_index is not None:
+            self.doc_index = doc_index
+        self.mark_synced()
+        self.map_index()
+
+    def map_index(self):
+        """After a commit: replaces the in-memory index by a mapping of the file just written (shared pages)."""
+        if self.index is not None and is_mappable(self.index) and os.path.exists(self.index_path):
+            self.index = read_index(self.index_path)
+
+
+class VectorStore:
+    """
+    Named partitions (one per processing mode) behind one load / add / search / reload API, so every
+    worker loads each partition once. on_change(name) is called after a partition's files were
+    committed (MainRoutes bumps the manifest there so other workers reload it).
+
+    Writers follow a single-writer protocol: every method that changes files holds lock (MainRoutes
+    passes the DATA_DIR WriterLock, which also excludes other processes), reloads the partition if it
+    is stale, and commits with write-to-temp + os.replace. Vector ids come from the chunk store's
+    on-disk record count, so they stay unique and monotonic across every worker.
+    """
+
+    def __init__(self, data_dir, partitions=PARTITIONS, on_change=None, lock=None):
+        self.partitions = {name: Partition(name, data_dir) for name in partitions}
+        self.on_change = on_change or (lambda name: None)
+        # Serialises writers (request threads, ingestion and compaction jobs; other processes with a WriterLock)
+        self.lock = lock or threading.RLock()
+
+    def __getitem__(self, name):
+        return self.partitions[name]
+
+    def __iter__(self):
+        return iter(self.partitions.values())
+
+    def partition_for(self, processing_mode):
+        """Partition serving a processing mode (unknown modes fall back to simple, as before)."""
+        return self.partitions.get(processing_mode) or self.partitions['simple']
+
+    def load(self, names=None):
+        for name in names or self.partitions:
+            self.partitions[name].load()
+
+    def reload(self, names=None):
+        """Reloads partitions already in memory; the others read the current files on first use anyway."""
+        for name in names or self.partitions:
+            if self.partitions[name].loaded:
+                self.partitions[name].load()
+
+    @_writer
+    def add(self, name, matrix, texts, document_id=None):
+        """
+        Adds a document's embeddings and texts to a partition in one go: the texts are appended to
+        the chunk store (O(chunks), nothing rewritten), then a single add_with_ids call, then the index
+        and document index are persisted once. Optionally ties the vectors to a document_id.
+
+        The commit is transaction-like: texts are appended before the index is written (so the
+        index never references unknown text), index files are staged to temp files first, and
+        on_change (the manifest bump) is the commit point other workers observe. If anything fails
+        the appended chunks are discarded, the in-memory state is rolled back, nothing on disk is
+        half-written, and the error is raised.
+
+        Args:
+            name (str): Partition name.
+            matrix (np.ndarray): 2D array with one embedding per row.
+            texts (List[str]): The text for each row of matrix.
+            document_id (str|None): Document these chunks belong to (for context filtering).
+
+        Returns:
+            np.ndarray: The new vector ids (int64).
+        """
+        partition = self.partitions[name]
+        matrix = np.ascontiguousarray(matrix, dtype='float32')
+        if len(matrix) != len(texts):
+            raise ValueError(f"{len(matrix)} embeddings for {len(texts)} texts")
+        if not len(texts):
+            return np.zeros(0, dtype='int64')
+        if partition.index is None:
+            print(f"Initializing {name} FAISS index.")
+            index = new_index(matrix.shape[1])
+        else:
+            index = partition.writable_index()
+        # Searches keep reading partition.index / partition.doc_index until the commit below
+        doc_index = dict(partition.doc_index)
+
+        # Cosine (inner-product) indexes store unit vectors
+        matrix = prepare_vectors(index, matrix)
+
+        # Append the texts (tied to the document) to the chunk store; it hands out the new vector ids
+        ids = partition.chunks.append(texts, document_id)
+
+        try:
+            index.add_with_ids(matrix, ids)
+            if document_id is not None:
+                previous_doc_ids = doc_index.get(document_id)
+                doc_index[document_id] = ids if previous_doc_ids is None else np.concatenate([previous_doc_ids, ids])
+
+            staged = []
+            if document_id is not None:
+                staged.append((partition.doc_index_path, lambda f: pickle.dump(doc_index, f)))
+            staged.append((partition.index_path, lambda f: f.write(faiss.serialize_index(index).tobytes())))
+            atomic_write_many(staged)
+        except Exception:
+            # Nothing was swapped in; only the appended chunks need undoing
+            partition.chunks.discard(ids)
+            raise
+        partition.commit_index(index, doc_index)
+        self.on_change(name)
+        print(f"Added {len(ids)} embedding(s) with IDs {ids[0]}-{ids[-1]} to {name} FAISS index."
+              + (f" document_id={document_id}" if document_id else ""))
+        if index.ntotal >= FAISS_ANN_THRESHOLD and index_kind(index) == 'flat':
+            print(f"{name} FAISS index has {index.ntotal} vectors; run scripts/build_ann_index.py to promote it to an ANN index.")
+        return ids
+
+    @_writer
+    def assign_documents(self, name, assignments):
+        """Ties existing chunks to documents ({vector_id: document_id}) and rebuilds the document index."""
+        partition = self.partitions[name]
+        partition.chunks.assign_documents(assignments)
+        doc_index = build_document_index(partition.documents)
+        atomic_write(partition.doc_index_path, lambda f: pickle.dump(doc_index, f))
+        partition.doc_index = doc_index
+        partition.mark_synced()
+        self.on_change(name)
+
+    @_writer
+    def delete_document(self, name, document_id):
+        """
+        Removes a document's vectors from a partition: remove_ids on the FAISS index, tombstones in the
+        chunk store, and the document index entry, committed together like add(). Index kinds that
+        cannot remove vectors (HNSW) keep them until compact(); they are unreachable meanwhile because
+        searches are restricted to the document index. Returns the number of vectors removed.
+        """
+        partition = self.partitions[name]
+        ids = partition.doc_index.get(document_id)
+        if ids is None:
+            ids = np.array([vid for vid, doc in partition.documents.items() if doc == document_id], dtype='int64')
+        ids = np.asarray(ids, dtype='int64')
+        if not len(ids):
+            return 0
+        index = partition.writable_index()
+        if index is not None:
+            try:
+                remove_ids(index, ids)
+            except RuntimeError:
+                print(f"{name} FAISS index ({index_kind(index)}) cannot remove ids; they are dropped at the next compaction.")
+        doc_index = dict(partition.doc_index)
+        doc_index.pop(document_id, None)
+        staged = [(partition.doc_index_path, lambda f: pickle.dump(doc_index, f))]
+        if index is not None:
+            staged.append((partition.index_path, lambda f: f.write(faiss.serialize_index(index).tobytes())))
+        atomic_write_many(staged)
+        partition.commit_index(partition.index if index is None else index, doc_index)
+        partition.chunks.discard(ids)
+        self.on_change(name)
+        print(f"Deleted {len(ids)} vector(s) of document_id={document_id} from {name} partition.")
+        return len(ids)
+
+    def dead_fraction(self, name):
+        """Share of the chunk blob (bytes) held by deleted chunks; compaction is worth it when this is large."""
+        stats = self.partitions[name].chunks.stats()
+        return 1 - stats['live_bytes'] / stats['blob_bytes'] if stats['blob_bytes'] else 0.0
+
+    @_writer
+    def compact(self, name):
+        """
+        Rewrites a partition without dead entries: the chunk store blob (vector ids are kept) and,
+        if it still holds vectors of deleted chunks, the FAISS index (rebuilt from the live vectors
+        with the same kind and metric). Returns a summary dict.
+        """
+        partition = self.partitions[name]
+        # Everything that can fail (reading the vectors, rebuilding) runs before any file is rewritten
+        rebuilt = None
+        dead_vectors = 0
+        index = partition.index
+        if index is not None and index.ntotal:
+            vectors, ids = extract_vectors(index)
+            dead = ~np.isin(ids, np.asarray(partition.chunks.keys(), dtype='int64'))
+            dead_vectors = int(dead.sum())
+            if dead_vectors:
+                kind = index_kind(index)
+                ivf = faiss.extract_index_ivf(index.index) if kind in ('ivf_flat', 'ivf_pq') else None
+                rebuilt = build_index(kind, vectors[~dead], ids[~dead], nlist=ivf.nlist if ivf else None,
+                                      pq_m=faiss.downcast_index(index.index).pq.M if kind == 'ivf_pq' else None,
+                                      metric=index_metric(index))
+        reclaimed = partition.chunks.compact()
+        if rebuilt is not None:
+            atomic_write(partition.index_path, lambda f: f.write(faiss.serialize_index(rebuilt).tobytes()))
+            partition.index = rebuilt
+            partition.mark_synced()
+            partition.map_index()
+        self.on_change(name)
+        summary = {'partition': name, 'blob_bytes_reclaimed': reclaimed, 'dead_vectors_dropped': dead_vectors,
+                   'vectors': partition.index.ntotal if partition.index is not None else 0}
+        print(f"Compacted {name} partition: {summary}")
+        return summary
+
+    @_writer
+    def install_index(self, name, index):
+        """Persists index as the partition's FAISS index and notifies on_change."""
+        partition = self.partitions[name]
+        atomic_write(partition.index_path, lambda f: f.write(faiss.serialize_index(index).tobytes()))
+        partition.index = index
+        partition.mark_synced()
+        partition.map_index()
+        self.on_change(name)
+        print(f"Installed {index_kind(index)}/{index_metric(index)} {name} FAISS index ({index.ntotal} vectors).")
+        return index
+
+    @_writer
+    def rebuild_index(self, name, kind='flat', nlist=None, pq_m=None, accept=None):
+        """
+        Rebuilds a partition's FAISS index as another kind (see routes/vector_index.py), keeping every
+        vector id and the metric, then installs it. Training runs on a copy; searches keep using the
+        current index until the swap. The write lock is held from extraction to install, so uploads
+        wait rather than land in the old index and be lost with it.
+        accept(vectors, ids, candidate), if given, decides (still under the lock) whether to install.
+        Returns the new index (None if the partition is empty or the candidate was not accepted).
+        """
+        current = self.partitions[name].index
+        if current is None or current.ntotal == 0:
+            print(f"{name} FAISS index is empty; nothing to rebuild.")
+            return None
+        vectors, ids = extract_vectors(current)
+        rebuilt = build_index(kind, vectors, ids, nlist=nlist, pq_m=pq_m, metric=index_metric(current))
+        if accept is not None and not accept(vectors, ids, rebuilt):
+            return None
+        return self.install_index(name, rebuilt)
+
+    @_writer
+    def convert_metric(self, name, metric):
+        """
+        Rebuilds a partition's FAISS index under another metric (same kind, same ids; see
+        scripts/migrate_index_metric.py) and installs it, holding the write lock throughout so no
+        upload lands in the old index meanwhile. Returns the new index, or None if the partition
+        is empty or already uses metric.
+        """
+        current = self.partitions[name].index
+        if current is None or current.ntotal == 0 or index_metric(current) == metric:
+            return None
+        return self.install_index(name, convert_metric(current, metric))
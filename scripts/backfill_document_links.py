@@ -0,0 +1,65 @@
+"""
+Links chunks stored before chunks carried a document_id (legacy corpora) to their processed documents,
+offline: one Aho–Corasick pass over the chunk texts finds each document's title, document_id prefix
+and filename stem, and a chunk is linked to the document matched by the strongest of those (title >
+id prefix > filename). Chunks matching several documents equally well are left unlinked and listed in
+the report; chunks that already have a document are never changed.
+
+    python scripts/backfill_document_links.py [--partition simple|advanced|both] [--batch-size 20000]
+        [--min-length 3] [--report backfill_ambiguous.jsonl] [--restart] [--dry-run]
+
+Progress is committed every --batch-size vector ids and recorded in DATA_DIR/backfill_state.json, so an
+interrupted run continues where it stopped (--restart starts over). Web workers pick up the links
+through the manifest. Install pyahocorasick to run the automaton in C on large corpora.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+from routes.document_links import BACKFILL_BATCH_SIZE, BACKFILL_MIN_PATTERN_LENGTH, backfill_partition
+from routes.main_routes import MainRoutes
+
+STATE_FILE = 'backfill_state.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partition', choices=('simple', 'advanced', 'both'), default='both')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument('--min-length', type=int, default=BACKFILL_MIN_PATTERN_LENGTH,
+                        help='ignore titles / prefixes / filenames shorter than this')
+    parser.add_argument('--report', default=None, help='JSONL file for ambiguous chunks (default DATA_DIR/backfill_ambiguous.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='ignore saved progress')
+    parser.add_argument('--dry-run', action='store_true', help='count links without writing')
+    args = parser.parse_args()
+
+    routes = MainRoutes(Flask(__name__, root_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))))
+    state_path = routes._p(STATE_FILE)
+    report_path = args.report or routes._p('backfill_ambiguous.jsonl')
+    if args.restart and not args.dry_run:
+        for path in (state_path, report_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    names = ('simple', 'advanced') if args.partition == 'both' else (args.partition,)
+    summary = {}
+    for name in names:
+        documents = [doc for doc in routes.processed_documents.values() if doc.get('processing') == name]
+        started = time.perf_counter()
+        progress = backfill_partition(routes.vectors, name, documents, state_path, report_path=report_path,
+                                      batch_size=args.batch_size, min_length=args.min_length, dry_run=args.dry_run)
+        progress['seconds'] = round(time.perf_counter() - started, 2)
+        summary[name] = progress
+    print(json.dumps(summary, indent=2))
+    if any(progress['ambiguous'] for progress in summary.values()):
+        print(f"Ambiguous chunks were left unlinked; see {report_path}")
+
+
+if __name__ == '__main__':
+    main()
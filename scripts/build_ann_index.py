@@ -0,0 +1,88 @@
+"""
+Offline trainer: promotes a partition's exact FAISS index to an approximate one (IVF-Flat, IVF-PQ
+or HNSW) once it holds FAISS_ANN_THRESHOLD vectors, keeping every vector id. Before installing, it
+reports recall@k of the candidate against the exact index, so the trade-off can be chosen per corpus.
+
+    python scripts/build_ann_index.py [--partition simple|advanced|both] [--type ivf_flat]
+                                      [--nlist N] [--pq-m M] [--k 5] [--queries 200]
+                                      [--min-recall 0.9] [--force] [--dry-run]
+
+Run it from cron or after bulk uploads; it is a no-op for partitions below the threshold or already
+promoted. Workers pick up the new index through the manifest on their next request.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from flask import Flask
+
+from routes.main_routes import MainRoutes
+from routes.vector_index import (FAISS_ANN_THRESHOLD, FAISS_INDEX_TYPE, INDEX_TYPES, build_index, index_kind,
+                                 index_metric, recall_at_k)
+
+
+def sample_queries(vectors, n_queries, seed=0):
+    """Stored vectors plus a little noise: near-duplicates of real chunks, like real questions about them."""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    scale = float(np.std(vectors)) * 0.5
+    return (picks + rng.normal(0, scale, picks.shape)).astype('float32')
+
+
+def promote(routes, advanced, args):
+    partition = 'advanced' if advanced else 'simple'
+    current = routes.faiss_index_advanced if advanced else routes.faiss_index
+    if current is None or current.ntotal == 0:
+        return {'partition': partition, 'action': 'skipped', 'reason': 'empty'}
+    if index_kind(current) != 'flat' and not args.force:
+        return {'partition': partition, 'action': 'skipped', 'reason': f'already {index_kind(current)}'}
+    if current.ntotal < args.threshold and not args.force:
+        return {'partition': partition, 'action': 'skipped', 'reason': f'{current.ntotal} < threshold {args.threshold}'}
+
+    # Extract, train and install in one step under the writer lock: an upload committed while the
+    # candidate trains would otherwise be missing from it and dropped by the install
+    report = {}
+
+    def evaluate(vectors, ids, candidate):
+        metric = index_metric(candidate)
+        exact = build_index('flat', vectors, ids, metric=metric)
+        report.update(recall_at_k(exact, candidate, sample_queries(vectors, args.queries), k=args.k))
+        report.update(partition=partition, type=args.type, metric=metric, ntotal=len(ids))
+        if args.dry_run:
+            report['action'] = 'dry-run'
+        elif args.min_recall is not None and report['recall'] < args.min_recall:
+            report['action'] = f"rejected (recall < {args.min_recall})"
+        else:
+            report['action'] = 'installed'
+        return report['action'] == 'installed'
+
+    routes.rebuild_index(advanced=advanced, kind=args.type, nlist=args.nlist, pq_m=args.pq_m, accept=evaluate)
+    return report or {'partition': partition, 'action': 'skipped', 'reason': 'empty'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partition', choices=('simple', 'advanced', 'both'), default='both')
+    parser.add_argument('--type', choices=INDEX_TYPES, default=FAISS_INDEX_TYPE)
+    parser.add_argument('--threshold', type=int, default=FAISS_ANN_THRESHOLD)
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--pq-m', type=int, default=None)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--min-recall', type=float, default=None)
+    parser.add_argument('--force', action='store_true', help='Rebuild even below the threshold or if already promoted')
+    parser.add_argument('--dry-run', action='store_true', help='Report recall only; do not install')
+    args = parser.parse_args()
+
+    routes = MainRoutes(Flask(__name__, root_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))))
+    partitions = {'simple': [False], 'advanced': [True], 'both': [False, True]}[args.partition]
+    for advanced in partitions:
+        print(json.dumps(promote(routes, advanced, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Converts existing faiss_index*.index files in DATA_DIR to another similarity metric, in place:
+'ip' (L2-normalised vectors in an inner-product index, i.e. cosine similarity) or 'l2'.
+The index kind (flat/IVF/HNSW) and every vector id are kept; chunk stores are untouched.
+
+    python scripts/migrate_index_metric.py [--metric ip|l2] [--partition simple|advanced|both]
+
+Workers pick up the converted index through the manifest on their next request and normalise
+queries from then on. Set FAISS_METRIC to the same value so new partitions match.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+from routes.main_routes import MainRoutes
+from routes.vector_index import METRICS, index_metric
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--metric', choices=tuple(METRICS), default='ip')
+    parser.add_argument('--partition', choices=('simple', 'advanced', 'both'), default='both')
+    args = parser.parse_args()
+
+    routes = MainRoutes(Flask(__name__, root_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))))
+    partitions = {'simple': [False], 'advanced': [True], 'both': [False, True]}[args.partition]
+    for advanced in partitions:
+        partition = 'advanced' if advanced else 'simple'
+        index = routes.faiss_index_advanced if advanced else routes.faiss_index
+        if index is None or index.ntotal == 0:
+            print(f"{partition}: empty, skipped")
+        elif index_metric(index) == args.metric:
+            print(f"{partition}: already {args.metric}, skipped")
+        else:
+            # Converted and installed under the writer lock, so uploads made meanwhile are not lost
+            converted = routes.vectors.convert_metric(partition, args.metric)
+            if converted is not None:
+                print(f"{partition}: converted {converted.ntotal} vectors from {index_metric(index)} to {args.metric}")
+
+
+if __name__ == '__main__':
+    main()
@@ -278,6 +278,14 @@ function handleFileUpload(endpoint) {
         };
 
         xhr.onload = function() {
+            if (xhr.status === 202) {
+                // Accepted: processing continues in the background; follow the job
+                const response = JSON.parse(xhr.responseText);
+                progressBarFill.style.width = '0%';
+                pollIngestionJob(response.status_url);
+                return;
+            }
+
             // Reset progress bar
             progressBarFill.style.width = '0%';
             progressBar.style.display = 'none';
@@ -311,6 +319,39 @@ function handleFileUpload(endpoint) {
     }
 }
 
+// Poll an ingestion job until it finishes; the progress bar shows processing progress.
+// Gives up after MAX_JOB_POLLS polls (one per second, about 30 minutes).
+const MAX_JOB_POLLS = 1800;
+function pollIngestionJob(statusUrl, polls) {
+    polls = polls || 0;
+    fetch(statusUrl)
+        .then(function(r) { return r.json(); })
+        .then(function(job) {
+            if (job.status === 'done') {
+                progressBarFill.style.width = '0%';
+                progressBar.style.display = 'none';
+                alert((job.result && job.result.message) || 'File successfully uploaded and processed');
+                refreshDocumentDropdown(); // so new document appears in context dropdown
+            } else if (job.status === 'failed' || job.error) {
+                progressBarFill.style.width = '0%';
+                progressBar.style.display = 'none';
+                alert(job.error || 'An error occurred while processing the file.');
+            } else if (polls + 1 >= MAX_JOB_POLLS) {
+                progressBarFill.style.width = '0%';
+                progressBar.style.display = 'none';
+                alert('The file is taking longer than expected to process. Refresh the document list later.');
+            } else {
+                progressBarFill.style.width = Math.round((job.progress || 0) * 100) + '%';
+                setTimeout(function() { pollIngestionJob(statusUrl, polls + 1); }, 1000);
+            }
+        })
+        .catch(function() {
+            progressBarFill.style.width = '0%';
+            progressBar.style.display = 'none';
+            alert('Lost track of the upload. Refresh the document list in a moment.');
+        });
+}
+
 // Handle question submission and display answer. onComplete() runs when typewriter finishes.
 function displayAnswer(answerText, onComplete) {
     const answerDiv = document.getElementById('answer');
@@ -343,21 +384,88 @@ document.getElementById('question-form').addEventListener('submit', function(e)
     var documentId = document.getElementById('document-select').value;
 
     setAskBusy(true);
+    var body = JSON.stringify({ question, processing_mode: processingMode, document_id: documentId });
+
+    // Browsers without streaming fetch get the whole answer from /ask
+    if (!window.ReadableStream || !window.TextDecoder) {
+        fetch('/ask', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: body })
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+            var text = data.answer || data.error || 'No answer received.';
+            displayAnswer(text, function() { setAskBusy(false); });
+        })
+        .catch(function(error) {
+            displayAnswer('Error: ' + error, function() { setAskBusy(false); });
+        });
+        return;
+    }
 
-    fetch('/ask', {
+    streamAnswer(body);
+});
+
+// Ask via /ask_stream (server-sent events) and render the answer as its tokens arrive.
+function streamAnswer(body) {
+    var answerDiv = document.getElementById('answer');
+    answerDiv.textContent = '';
+    var received = false;
+
+    function handleEvent(frame) {
+        var event = 'message';
+        var data = '';
+        frame.split('\n').forEach(function(line) {
+            if (line.indexOf('event:') === 0) event = line.slice(6).trim();
+            else if (line.indexOf('data:') === 0) data += line.slice(5).trim();
+        });
+        if (!data) return;
+        var payload = JSON.parse(data);
+        if (event === 'error') {
+            answerDiv.textContent += (received ? '\n\n' : '') + (payload.error || 'An error occurred.');
+        } else if (event === 'done') {
+            if (!received) answerDiv.textContent = payload.answer || 'No answer received.';
+        } else if (payload.token) {
+            // Leading whitespace of the first token is dropped, like the trimmed /ask answer
+            answerDiv.textContent += received ? payload.token : payload.token.replace(/^\s+/, '');
+            received = true;
+        }
+    }
+
+    fetch('/ask_stream', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ question, processing_mode: processingMode, document_id: documentId })
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: body
     })
-    .then(function(response) { return response.json(); })
-    .then(function(data) {
-        var text = data.answer || data.error || 'No answer received.';
-        displayAnswer(text, function() { setAskBusy(false); });
+    .then(function(response) {
+        var type = response.headers.get('Content-Type') || '';
+        if (type.indexOf('text/event-stream') !== 0) {
+            // Validation / retrieval errors come back as plain JSON
+            return response.json().then(function(data) {
+                displayAnswer(data.answer || data.error || 'No answer received.', function() { setAskBusy(false); });
+            });
+        }
+        var reader = response.body.getReader();
+        var decoder = new TextDecoder();
+        var buffer = '';
+        function pump() {
+            return reader.read().then(function(result) {
+                buffer += decoder.decode(result.value || new Uint8Array(), { stream: !result.done });
+                var frames = buffer.split('\n\n');
+                buffer = frames.pop();
+                frames.forEach(handleEvent);
+                if (result.done) {
+                    if (buffer.trim()) handleEvent(buffer);
+                    setAskBusy(false);
+                    return;
+                }
+                return pump();
+            });
+        }
+        return pump();
     })
     .catch(function(error) {
-        displayAnswer('Error: ' + error, function() { setAskBusy(false); });
+        answerDiv.textContent = 'Error: ' + error;
+        setAskBusy(false);
     });
-});
+}
 
 // Theme toggle: dark (default) / light, persisted in localStorage
 (function() {
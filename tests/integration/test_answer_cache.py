@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from app import FlaskApp
+import routes.main_routes as main_routes
+from routes.cache import AnswerCache
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    app = FlaskApp().app
+    return app
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main_routes.MainRoutes, 'get_embedding', lambda self, text: np.ones(4, dtype='float32'))
+    monkeypatch.setattr(main_routes.MainRoutes, 'generate_answer_from_prompt',
+                        lambda self, prompt: calls.append(prompt) or f"answer {len(calls)}")
+    return calls
+
+
+def routes_of(app):
+    return app.view_functions['ask'].__self__
+
+
+def add_document(routes, document_id, texts):
+    routes.save_embeddings(np.ones((len(texts), 4), dtype='float32'), texts, document_id=document_id)
+    routes.processed_documents[document_id] = {'id': document_id, 'processing': 'simple'}
+    routes.save_processed_documents()
+
+
+def ask(client, question, document_id='doc'):
+    return client.post('/ask', json={'question': question, 'document_id': document_id}).get_json()['answer']
+
+
+def test_repeated_question_is_answered_from_cache(app, answers):
+    add_document(routes_of(app), 'doc', ['AI is artificial intelligence.'])
+    with app.test_client() as client:
+        assert ask(client, 'What is AI?') == 'answer 1'
+        assert ask(client, '  what is AI? ') == 'answer 1'
+        assert ask(client, 'What is ML?') == 'answer 2'
+    assert len(answers) == 2
+    assert client.get('/cache_stats').get_json()['answers']['hits'] == 1
+
+
+def test_new_chunks_invalidate_cached_answers(app, answers):
+    routes = routes_of(app)
+    add_document(routes, 'doc', ['AI is artificial intelligence.'])
+    with app.test_client() as client:
+        assert ask(client, 'What is AI?') == 'answer 1'
+        add_document(routes, 'doc', ['More about AI.'])
+        assert ask(client, 'What is AI?') == 'answer 2'
+
+
+def test_expired_answers_are_not_served():
+    cache = AnswerCache(ttl=-1)
+    key = AnswerCache.key('m', 'doc', [0, 1], [1], 'q')
+    cache.put(key, 'stale')
+    assert cache.get(key) is None
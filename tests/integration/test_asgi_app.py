@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import anyio
+import httpx
+import numpy as np
+import pytest
+from app import FlaskApp
+from asgi import AsgiApp
+import routes.main_routes as main_routes
+import routes.openai_client as openai_client
+
+
+class FakeAsyncOpenAI:
+    """Stands in for the async OpenAI client: completions wait on `release`, so tests can count calls in flight."""
+
+    def __init__(self, words=('AI', ' is', ' smart.')):
+        self.words = words
+        self.in_flight = self.peak = 0
+        self.release = anyio.Event()
+        self.embeddings = SimpleNamespace(create=self.embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.complete))
+
+    async def embed(self, input, model, **kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[1.0] * 4)])
+
+    async def complete(self, stream=False, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await self.release.wait()
+        self.in_flight -= 1
+        if stream:
+            return self.chunks()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=''.join(self.words)))])
+
+    async def chunks(self):
+        for word in self.words:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    fake = FakeAsyncOpenAI()
+    monkeypatch.setattr(main_routes, 'async_client', fake)
+    return fake
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    flask_app = FlaskApp().app
+    # Measure concurrency alone: 200 answers exceed the default chat tokens/min budget
+    monkeypatch.setattr(openai_client, 'rate_limiter', None)
+    routes = flask_app.view_functions['ask'].__self__
+    routes.save_embeddings(np.ones((1, 4), dtype='float32'), ['AI is artificial intelligence.'], document_id='doc')
+    routes.update_processed_documents(lambda documents: documents.update({'doc': {'id': 'doc', 'processing': 'simple'}}))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=AsgiApp(flask_app)), base_url='http://test')
+
+
+@pytest.mark.anyio
+async def test_one_process_holds_hundreds_of_llm_calls(client, openai):
+    results = []
+
+    async def ask(n):
+        response = await client.post('/ask', json={'question': f'What is AI? ({n})', 'document_id': 'doc'})
+        results.append((response.status_code, response.json()))
+
+    with anyio.fail_after(30):
+        async with anyio.create_task_group() as tasks:
+            for n in range(200):
+                tasks.start_soon(ask, n)
+            while openai.in_flight < 200:
+                await anyio.sleep(0.01)
+            openai.release.set()
+    assert openai.peak == 200
+    assert results == [(200, {'answer': 'AI is smart.'})] * 200
+
+
+@pytest.mark.anyio
+async def test_ask_stream_events_and_answer_cache(client, openai):
+    openai.release.set()
+    body = {'question': 'What is AI?', 'document_id': 'doc'}
+    response = await client.post('/ask_stream', json=body)
+    assert response.headers['content-type'].startswith('text/event-stream')
+    frames = [dict(line.split(': ', 1) for line in frame.split('\n')) for frame in response.text.strip().split('\n\n')]
+    assert [json.loads(frame['data']) for frame in frames] == [{'token': 'AI'}, {'token': ' is'}, {'token': ' smart.'},
+                                                               {'answer': 'AI is smart.', 'cached': False}]
+    assert frames[-1]['event'] == 'done'
+
+    openai.words = ('Different.',)
+    assert (await client.post('/ask', json=body)).json() == {'answer': 'AI is smart.'}
+
+
+@pytest.mark.anyio
+async def test_empty_streamed_answer_is_not_cached(client, openai):
+    openai.release.set()
+    openai.words = ()
+    body = {'question': 'What is AI?', 'document_id': 'doc'}
+    assert (await client.post('/ask_stream', json=body)).text.strip().endswith('"cached": false}')
+    openai.words = ('Fine.',)
+    assert (await client.post('/ask', json=body)).json() == {'answer': 'Fine.'}
+
+
+@pytest.mark.anyio
+async def test_validation_errors_match_the_sync_routes(client, openai):
+    response = await client.post('/ask', json={'question': '', 'document_id': 'doc'})
+    assert response.status_code == 400 and response.json() == {'error': 'No question provided'}
+    response = await client.post('/ask_stream', json={'question': 'What is AI?', 'document_id': 'doc', 'processing_mode': 'advanced'})
+    assert response.status_code == 400 and 'processed with Simple' in response.json()['error']
+    response = await client.post('/ask', content=b'not json')
+    assert response.status_code == 400 and response.json() == {'error': 'Invalid JSON body'}
+
+
+@pytest.mark.anyio
+async def test_other_routes_are_served_by_flask(client):
+    response = await client.get('/processed_documents')
+    assert response.status_code == 200 and 'doc' in json.dumps(response.json())
+    response = await client.post('/upload', files={'file': ('notes.txt', b'hello', 'text/plain')})
+    assert response.status_code == 400 and response.json() == {'error': 'Invalid or unsafe file name'}
+    assert (await client.get('/missing')).status_code == 404
@@ -0,0 +1,101 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from app import FlaskApp
+import routes.main_routes as main_routes
+
+
+class StreamingChat:
+    """Stands in for client.chat.completions: streams the answer word by word and records what was sent."""
+
+    def __init__(self, words, fail_after=None):
+        self.words = words
+        self.fail_after = fail_after
+        self.sent = []
+
+    def create(self, **kwargs):
+        assert kwargs['stream'] is True
+        for n, word in enumerate(self.words):
+            if n == self.fail_after:
+                raise RuntimeError('connection reset')
+            self.sent.append(word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))])
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(main_routes.MainRoutes, 'get_embedding', lambda self, text: np.ones(4, dtype='float32'))
+    app = FlaskApp().app
+    routes = app.view_functions['ask_stream'].__self__
+    routes.save_embeddings(np.ones((1, 4), dtype='float32'), ['AI is artificial intelligence.'], document_id='doc')
+    routes.update_processed_documents(lambda documents: documents.update({'doc': {'id': 'doc', 'processing': 'simple'}}))
+    return app
+
+
+def use_chat(monkeypatch, chat):
+    monkeypatch.setattr(main_routes, 'client', SimpleNamespace(chat=SimpleNamespace(completions=chat)))
+
+
+def events(response):
+    """Parses a text/event-stream body into [(event, payload)]."""
+    parsed = []
+    for frame in response.get_data(as_text=True).strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in frame.split('\n'))
+        parsed.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return parsed
+
+
+def ask(client, question='What is AI?', **extra):
+    return client.post('/ask_stream', json=dict({'question': question, 'document_id': 'doc'}, **extra), buffered=False)
+
+
+def test_tokens_are_flushed_as_they_are_generated(app, monkeypatch):
+    chat = StreamingChat(['AI', ' is', ' smart.'])
+    use_chat(monkeypatch, chat)
+    with app.test_client() as client:
+        response = ask(client)
+        assert response.mimetype == 'text/event-stream'
+        body = iter(response.response)
+        assert json.loads(next(body).decode().split('data: ')[1]) == {'token': 'AI'}
+        assert chat.sent == ['AI']  # the rest is not generated yet
+        response.close()
+
+
+def test_streamed_answer_is_cached(app, monkeypatch):
+    use_chat(monkeypatch, StreamingChat(['AI', ' is', ' smart.']))
+    with app.test_client() as client:
+        assert events(ask(client)) == [('message', {'token': 'AI'}), ('message', {'token': ' is'}),
+                                       ('message', {'token': ' smart.'}),
+                                       ('done', {'answer': 'AI is smart.', 'cached': False})]
+        use_chat(monkeypatch, StreamingChat([], fail_after=0))
+        assert events(ask(client))[-1] == ('done', {'answer': 'AI is smart.', 'cached': True})
+        assert client.post('/ask', json={'question': 'What is AI?', 'document_id': 'doc'}).get_json() == {'answer': 'AI is smart.'}
+
+
+def test_failure_midway_ends_with_error_event(app, monkeypatch):
+    use_chat(monkeypatch, StreamingChat(['AI', ' is'], fail_after=1))
+    with app.test_client() as client:
+        assert events(ask(client)) == [('message', {'token': 'AI'}), ('error', {'error': main_routes.ANSWER_ERROR_MESSAGE})]
+        # Nothing partial was cached
+        use_chat(monkeypatch, StreamingChat(['Fine.']))
+        assert events(ask(client))[-1] == ('done', {'answer': 'Fine.', 'cached': False})
+
+
+def test_empty_streamed_answer_is_not_cached(app, monkeypatch):
+    use_chat(monkeypatch, StreamingChat([' ', '\n']))
+    with app.test_client() as client:
+        assert events(ask(client))[-1] == ('done', {'answer': '', 'cached': False})
+        use_chat(monkeypatch, StreamingChat(['Fine.']))
+        assert events(ask(client))[-1] == ('done', {'answer': 'Fine.', 'cached': False})
+
+
+def test_validation_errors_are_plain_json(app):
+    with app.test_client() as client:
+        response = ask(client, question='')
+        assert response.status_code == 400 and response.get_json() == {'error': 'No question provided'}
+        response = ask(client, processing_mode='advanced')
+        assert response.status_code == 400 and 'processed with Simple' in response.get_json()['error']
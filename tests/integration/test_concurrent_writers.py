@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from routes import atomic_io
+from routes.chunk_store import ChunkStore
+from routes.main_routes import MainRoutes
+from routes.vector_index import extract_vectors
+
+WORKERS = 4
+DOCUMENTS_PER_WORKER = 6
+
+pytestmark = pytest.mark.skipif(atomic_io.fcntl is None, reason='needs fcntl to lock across worker processes')
+
+
+def upload(data_dir, worker):
+    """One worker process: its own MainRoutes on the shared DATA_DIR, uploading documents in a loop."""
+    try:
+        os.environ['DATA_DIR'] = data_dir
+        routes = MainRoutes(Flask(__name__))
+        rng = np.random.default_rng(worker)
+        for n in range(DOCUMENTS_PER_WORKER):
+            document_id = f'w{worker}-d{n}'
+            texts = [f'{document_id} chunk {i}' for i in range(1 + (worker + n) % 5)]
+            advanced = n % 2 == 1
+            routes.save_embeddings(rng.random((len(texts), 8), dtype='float32'), texts,
+                                   document_id=document_id, advanced=advanced)
+            meta = {'id': document_id, 'processing': 'advanced' if advanced else 'simple', 'chunks': len(texts)}
+            routes.update_processed_documents(lambda documents: documents.update({document_id: meta}))
+            routes.register_file_hash(document_id, meta['processing'], document_id)
+        code = 0
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    # Skip interpreter teardown (job queue threads of the worker's MainRoutes)
+    os._exit(code)
+
+
+def test_parallel_uploads_lose_and_duplicate_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    MainRoutes(Flask(__name__))  # create the empty data files once, like the app at deploy
+
+    # Fresh interpreters: forking the test process (threads, OpenMP state) can crash the children
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=upload, args=(str(tmp_path), w)) for w in range(WORKERS)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=60)
+    assert [process.exitcode for process in workers] == [0] * WORKERS
+
+    routes = MainRoutes(Flask(__name__))
+    documents = routes.processed_documents
+    assert len(documents) == WORKERS * DOCUMENTS_PER_WORKER
+    for name, suffix in (('simple', ''), ('advanced', '_advanced')):
+        partition = routes.vectors[name]
+        expected = {doc_id: meta['chunks'] for doc_id, meta in documents.items() if meta['processing'] == name}
+        total = sum(expected.values())
+
+        # Ids are allocated densely and exactly once across all processes
+        store = ChunkStore(routes.data_dir, suffix)
+        assert store.next_id == total == len(store)
+        _, ids = extract_vectors(partition.index)
+        assert sorted(ids.tolist()) == list(range(total))
+
+        # Every document's ids point at its own texts, and at nothing else
+        assert set(partition.doc_index) == set(expected)
+        for doc_id, chunks in expected.items():
+            texts = [store[int(vid)] for vid in partition.doc_index[doc_id]]
+            assert texts == [f'{doc_id} chunk {i}' for i in range(chunks)]
+            assert all(partition.documents[int(vid)] == doc_id for vid in partition.doc_index[doc_id])
+
+    assert len(routes._load_file_hashes()) == WORKERS * DOCUMENTS_PER_WORKER
+    assert not [name for name in os.listdir(tmp_path) if '.tmp.' in name]
@@ -0,0 +1,147 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from app import FlaskApp
+import routes.main_routes as main_routes
+import routes.vector_index as vector_index
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return FlaskApp().app
+
+
+def routes_of(app):
+    return app.view_functions['delete_document'].__self__
+
+
+def add_document(routes, document_id, texts, seed):
+    vectors = np.random.default_rng(seed).random((len(texts), 8), dtype='float32')
+    routes.save_embeddings(vectors, texts, document_id=document_id)
+    routes.processed_documents[document_id] = {'id': document_id, 'processing': 'simple'}
+    routes.save_processed_documents()
+
+
+def wait_for_job(client, status_url, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(status_url).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"job did not finish: {job}")
+
+
+def test_delete_removes_vectors_metadata_and_hash(app):
+    routes = routes_of(app)
+    add_document(routes, 'keep', ['k1', 'k2'], seed=0)
+    add_document(routes, 'gone', ['g1', 'g2', 'g3'], seed=1)
+    routes.register_file_hash('abc', 'simple', 'gone')
+
+    with app.test_client() as client:
+        response = client.delete('/documents/gone')
+        assert response.status_code == 200
+        assert response.get_json()['vectors_removed'] == 3
+        assert client.delete('/documents/gone').status_code == 404
+        assert [d['id'] for d in client.get('/processed_documents').get_json()] == ['keep']
+
+    assert routes.faiss_index.ntotal == 2
+    assert routes.id_to_text == {0: 'k1', 1: 'k2'}
+    assert 'gone' not in routes.document_id_to_ids
+    assert routes.find_processed_file('abc', 'simple') is None
+    # Ids are never reused after a deletion
+    add_document(routes, 'new', ['n1'], seed=2)
+    assert routes.document_id_to_ids['new'].tolist() == [5]
+
+
+def test_delete_document_whose_id_contains_a_slash(app):
+    routes = routes_of(app)
+    document_id = 'Q1/Q2 Report-simple-2024-05-01'
+    add_document(routes, document_id, ['r1', 'r2'], seed=0)
+    with app.test_client() as client:
+        response = client.delete(f'/documents/{document_id}')
+        assert response.status_code == 200
+        assert response.get_json()['deleted'] == document_id
+        assert client.get('/processed_documents').get_json() == []
+    assert document_id not in routes.document_id_to_ids
+
+
+def test_large_deletion_compacts_in_background(app, monkeypatch):
+    monkeypatch.setattr(main_routes, 'COMPACTION_DEAD_RATIO', 0.5)
+    routes = routes_of(app)
+    add_document(routes, 'keep', ['kept text'], seed=0)
+    add_document(routes, 'gone', ['deleted text ' * 50] * 4, seed=1)
+    blob_before = os.path.getsize(routes.id_to_text.blob_path)
+
+    with app.test_client() as client:
+        body = client.delete('/documents/gone').get_json()
+        assert wait_for_job(client, body['compaction_status_url'])['status'] == 'done'
+
+    worker = FlaskApp().app.view_functions['delete_document'].__self__
+    assert os.path.getsize(worker.id_to_text.blob_path) == len('kept text') < blob_before
+    assert worker.id_to_text == {0: 'kept text'}
+    assert worker.search_document(worker.faiss_index, np.ones(8), worker.document_id_to_ids['keep'], 5) == [0]
+
+
+def test_deleting_the_first_document_then_compact_rebuild_and_convert(app, monkeypatch):
+    monkeypatch.setattr(main_routes, 'COMPACTION_DEAD_RATIO', 0.1)
+    routes = routes_of(app)
+    add_document(routes, 'first', [f"f{i}" for i in range(20)], seed=0)
+    add_document(routes, 'middle', [f"m{i}" for i in range(30)], seed=1)
+    add_document(routes, 'last', [f"l{i}" for i in range(10)], seed=2)
+    assert vector_index.index_kind(routes.faiss_index) == 'flat'
+    vectors, ids = vector_index.extract_vectors(routes.faiss_index)
+    survivors = ids >= 20
+
+    def assert_survivors_intact(index):
+        kept_vectors, kept_ids = vector_index.extract_vectors(index)
+        order = np.argsort(kept_ids)
+        assert kept_ids[order].tolist() == ids[survivors].tolist()
+        assert np.allclose(kept_vectors[order], vectors[survivors], atol=1e-6)
+        for document_id, first_id in (('middle', 20), ('last', 50)):
+            assert routes.search_document(index, vectors[first_id], routes.document_id_to_ids[document_id], 1) == [first_id]
+
+    with app.test_client() as client:
+        body = client.delete('/documents/first').get_json()
+        assert body['vectors_removed'] == 20
+        assert wait_for_job(client, body['compaction_status_url'])['status'] == 'done'
+    routes._refresh_if_stale()
+    assert_survivors_intact(routes.faiss_index)
+
+    routes.rebuild_index(kind='flat')
+    assert_survivors_intact(routes.faiss_index)
+    assert routes.vectors.convert_metric('simple', 'l2') is not None
+    assert vector_index.index_metric(routes.faiss_index) == 'l2'
+    assert_survivors_intact(routes.faiss_index)
+
+
+def test_rebuild_and_convert_directly_after_deleting_the_first_document(app):
+    routes = routes_of(app)
+    add_document(routes, 'first', [f"f{i}" for i in range(5)], seed=0)
+    add_document(routes, 'second', [f"s{i}" for i in range(5)], seed=1)
+    vectors, ids = vector_index.extract_vectors(routes.faiss_index)
+    routes.vectors.delete_document('simple', 'first')
+
+    routes.vectors.convert_metric('simple', 'l2')
+    kept_vectors, kept_ids = vector_index.extract_vectors(routes.faiss_index)
+    assert kept_ids.tolist() == ids[5:].tolist() and np.allclose(kept_vectors, vectors[5:], atol=1e-6)
+    assert not np.isnan(kept_vectors).any()
+    routes.rebuild_index(kind='ivf_flat', nlist=2)
+    assert sorted(vector_index.extract_vectors(routes.faiss_index)[1].tolist()) == ids[5:].tolist()
+    assert routes.search_document(routes.faiss_index, vectors[7], routes.document_id_to_ids['second'], 1) == [7]
+
+
+def test_compaction_drops_vectors_hnsw_could_not_remove(app):
+    routes = routes_of(app)
+    add_document(routes, 'keep', [f"k{i}" for i in range(30)], seed=0)
+    add_document(routes, 'gone', [f"g{i}" for i in range(30)], seed=1)
+    routes.rebuild_index(kind='hnsw')
+    routes.vectors.delete_document('simple', 'gone')
+    assert routes.faiss_index.ntotal == 60
+
+    summary = routes.vectors.compact('simple')
+    assert summary['dead_vectors_dropped'] == 30
+    assert vector_index.index_kind(routes.faiss_index) == 'hnsw' and routes.faiss_index.ntotal == 30
@@ -0,0 +1,163 @@
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from app import FlaskApp
+import routes.main_routes as main_routes
+
+
+class StubOpenAI:
+    """Offline stand-in for the OpenAI client: fixed summaries and constant embeddings."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.complete))
+        self.embeddings = SimpleNamespace(create=self.embed)
+
+    def complete(self, **kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="A summary about AI."))])
+
+    def embed(self, input, model, **kwargs):
+        inputs = input if isinstance(input, list) else [input]
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[0.1] * 8) for i in range(len(inputs))])
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(main_routes, 'client', StubOpenAI())
+    app = FlaskApp().app
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    return app
+
+
+def wait_for_job(client, status_url, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(status_url).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"job did not finish: {job}")
+
+
+def test_upload_returns_job_and_reports_completion(app, monkeypatch):
+    monkeypatch.setattr(main_routes.MainRoutes, 'pdf_to_text', lambda self, path, **kwargs: "AI is a field of computer science.")
+    with app.test_client() as client:
+        resp = client.post('/upload', data={'file': (io.BytesIO(b'%PDF-1.4'), 'notes.pdf')},
+                           content_type='multipart/form-data')
+        assert resp.status_code == 202
+        job = wait_for_job(client, resp.get_json()['status_url'])
+
+        assert job['status'] == 'done' and job['phase'] == 'done' and job['progress'] == 1.0
+        document_id = job['result']['document_id']
+        docs = client.get('/processed_documents').get_json()
+        assert [doc['id'] for doc in docs] == [document_id]
+
+
+def test_failed_ingestion_is_reported_on_the_job(app, monkeypatch):
+    monkeypatch.setattr(main_routes.MainRoutes, 'iter_pdf_pages', lambda self, path, **kwargs: iter(['']))
+    with app.test_client() as client:
+        resp = client.post('/advanced_upload', data={'file': (io.BytesIO(b'%PDF-1.4'), 'empty.pdf')},
+                           content_type='multipart/form-data')
+        job = wait_for_job(client, resp.get_json()['status_url'])
+
+        assert job['status'] == 'failed'
+        assert 'Could not extract text' in job['error']
+        assert client.get('/processed_documents').get_json() == []
+
+
+def test_extraction_error_fails_the_job_instead_of_truncating(app, monkeypatch):
+    def pages(path, reader=None):
+        yield 'Page one about AI.'
+        raise RuntimeError('extraction worker died')
+    monkeypatch.setattr(main_routes, 'iter_page_texts', pages)
+    with app.test_client() as client:
+        resp = client.post('/advanced_upload', data={'file': (io.BytesIO(b'%PDF-1.4'), 'broken.pdf')},
+                           content_type='multipart/form-data')
+        job = wait_for_job(client, resp.get_json()['status_url'])
+
+        assert job['status'] == 'failed' and 'extraction worker died' in job['error']
+        assert client.get('/processed_documents').get_json() == []
+
+
+def test_persistence_failure_fails_the_job_and_publishes_nothing(app, monkeypatch):
+    monkeypatch.setattr(main_routes.MainRoutes, 'pdf_to_text', lambda self, path, **kwargs: "AI is a field of computer science.")
+    routes = app.view_functions['upload'].__self__
+    real_add = routes.vectors.add
+
+    def disk_full(*args, **kwargs):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(routes.vectors, 'add', disk_full)
+    with app.test_client() as client:
+        resp = client.post('/upload', data={'file': (io.BytesIO(b'%PDF-1.4 unsaved'), 'notes.pdf')},
+                           content_type='multipart/form-data')
+        job = wait_for_job(client, resp.get_json()['status_url'])
+        assert job['status'] == 'failed' and 'No space left' in job['error']
+        assert client.get('/processed_documents').get_json() == []
+
+        # The hash was not registered: once the disk is fixed the same bytes are ingested again
+        monkeypatch.setattr(routes.vectors, 'add', real_add)
+        resp = client.post('/upload', data={'file': (io.BytesIO(b'%PDF-1.4 unsaved'), 'notes.pdf')},
+                           content_type='multipart/form-data')
+        assert resp.status_code == 202
+        assert wait_for_job(client, resp.get_json()['status_url'])['status'] == 'done'
+
+
+def test_queued_job_reads_its_own_bytes_after_a_same_name_upload(app, monkeypatch):
+    release, seen = threading.Event(), []
+
+    def read_after_release(self, path, **kwargs):
+        release.wait(10)
+        with open(path, 'rb') as f:
+            seen.append(f.read())
+        return "AI is a field of computer science."
+    monkeypatch.setattr(main_routes.MainRoutes, 'pdf_to_text', read_after_release)
+    with app.test_client() as client:
+        status_urls = [client.post('/upload', data={'file': (io.BytesIO(body), 'notes.pdf')},
+                                   content_type='multipart/form-data').get_json()['status_url']
+                       for body in (b'%PDF-1.4 first', b'%PDF-1.4 second')]
+        release.set()
+        assert [wait_for_job(client, url)['status'] for url in status_urls] == ['done', 'done']
+    assert sorted(seen) == [b'%PDF-1.4 first', b'%PDF-1.4 second']
+
+
+def test_embedding_failure_is_a_server_error_not_a_bad_pdf(app, monkeypatch):
+    monkeypatch.setattr(main_routes, 'INGEST_ASYNC', False)
+    monkeypatch.setattr(main_routes.MainRoutes, 'iter_pdf_pages', lambda self, path, **kwargs: iter(['AI is a field of computer science.']))
+
+    def api_down(**kwargs):
+        raise RuntimeError('embeddings API unavailable')
+    monkeypatch.setattr(main_routes.client.embeddings, 'create', api_down)
+    with app.test_client() as client:
+        resp = client.post('/advanced_upload', data={'file': (io.BytesIO(b'%PDF-1.4'), 'notes.pdf')},
+                           content_type='multipart/form-data')
+        assert resp.status_code == 500
+        assert 'Could not generate embeddings' in resp.get_json()['error']
+        assert client.get('/processed_documents').get_json() == []
+
+
+def test_unknown_job_is_404(app):
+    with app.test_client() as client:
+        assert client.get('/jobs/nope').status_code == 404
+
+
+def test_reupload_of_identical_bytes_skips_all_work(app, monkeypatch):
+    monkeypatch.setattr(main_routes.MainRoutes, 'pdf_to_text', lambda self, path, **kwargs: "AI is a field of computer science.")
+    with app.test_client() as client:
+        resp = client.post('/upload', data={'file': (io.BytesIO(b'%PDF-1.4 same bytes'), 'notes.pdf')},
+                           content_type='multipart/form-data')
+        document_id = wait_for_job(client, resp.get_json()['status_url'])['result']['document_id']
+
+    # A fresh app (restart / another worker) with no way to reach the API
+    main_routes.client.chat.completions.create = lambda **kwargs: pytest.fail('chat API called')
+    main_routes.client.embeddings.create = lambda **kwargs: pytest.fail('embeddings API called')
+    monkeypatch.setattr(main_routes.MainRoutes, 'open_pdf', lambda self, path: pytest.fail('PDF parsed'))
+    restarted = FlaskApp().app
+    restarted.config['UPLOAD_FOLDER'] = app.config['UPLOAD_FOLDER']
+    with restarted.test_client() as client:
+        resp = client.post('/upload', data={'file': (io.BytesIO(b'%PDF-1.4 same bytes'), 'copy.pdf')},
+                           content_type='multipart/form-data')
+        assert resp.status_code == 200
+        assert resp.get_json() == {'message': 'File already processed', 'document_id': document_id}
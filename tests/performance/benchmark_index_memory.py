@@ -0,0 +1,93 @@
+"""
+Memory benchmark: per-worker memory of N processes serving the same FAISS index, read the old way
+(IndexFlat file, faiss.read_index copies every vector into each worker) versus memory-mapped
+(single-list IVF layout loaded by routes.vector_index.read_index, vectors shared through the page cache).
+
+    python tests/performance/benchmark_index_memory.py [--workers 4] [--dim 1536] [--sizes 10000 25000 50000]
+
+Each worker loads the index, runs a few searches that scan every vector, then reports from
+/proc/self/smaps_rollup (Linux): RSS (counts shared pages in full), PSS (shared pages divided among
+the processes mapping them) and USS (private memory). With mmap, USS stays flat as the corpus grows.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import faiss
+import numpy as np
+
+from routes import vector_index
+
+
+def memory_mb():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'uss': private}
+
+
+def worker(path, mapped, dimension, loaded, release, results):
+    baseline = memory_mb()
+    index = vector_index.read_index(path) if mapped else faiss.read_index(path)
+    queries = np.random.default_rng(os.getpid()).random((4, dimension), dtype='float32')
+    index.search(vector_index.prepare_vectors(index, queries), 5,
+                 params=vector_index.search_parameters(index))
+    loaded.wait()  # measure while every worker holds the index
+    after = memory_mb()
+    results.put({key: after[key] - baseline[key] for key in after})
+    release.wait()
+
+
+def measure(path, mapped, dimension, workers):
+    context = multiprocessing.get_context('spawn')
+    loaded, release = context.Barrier(workers + 1), context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(path, mapped, dimension, loaded, release, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    loaded.wait()
+    samples = [results.get(timeout=300) for _ in processes]
+    release.wait()
+    for process in processes:
+        process.join()
+    return {key: sum(sample[key] for sample in samples) / len(samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 25000, 50000])
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, dim {args.dim}; mean per-worker increase after loading the index (MB)")
+    print(f"{'vectors':>8} {'index MB':>9} | {'copy RSS':>9} {'PSS':>7} {'USS':>7} | {'mmap RSS':>9} {'PSS':>7} {'USS':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            vectors = np.random.default_rng(size).random((size, args.dim), dtype='float32')
+            ids = np.arange(size, dtype='int64')
+            legacy_path = os.path.join(tmp, f'flat_{size}.index')
+            mapped_path = os.path.join(tmp, f'mapped_{size}.index')
+            legacy = faiss.IndexIDMap(faiss.IndexFlatIP(args.dim))
+            legacy.add_with_ids(vector_index.prepare_vectors(legacy, vectors), ids)
+            faiss.write_index(legacy, legacy_path)
+            faiss.write_index(vector_index.build_index('flat', vectors, ids, metric='ip'), mapped_path)
+            del legacy, vectors
+
+            copy = measure(legacy_path, False, args.dim, args.workers)
+            mapped = measure(mapped_path, True, args.dim, args.workers)
+            print(f"{size:>8} {os.path.getsize(mapped_path) / 2**20:>9.1f} | {copy['rss']:>9.1f} {copy['pss']:>7.1f} "
+                  f"{copy['uss']:>7.1f} | {mapped['rss']:>9.1f} {mapped['pss']:>7.1f} {mapped['uss']:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark: chunking the 200-page stress-test PDF for advanced upload with the old per-call
+tiktoken lookup, per-chunk decode and per-chunk re-encode (to size embedding batches) versus the
+cached encoding and token-span chunker, which encodes the text exactly once.
+
+    python tests/performance/benchmark_tokenizer.py [--repeat 20] [--chunk-size 3000] [--scale 1]
+
+--scale repeats the extracted text to emulate text-dense pages (the fixture has one line per page).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tiktoken
+from PyPDF2 import PdfReader
+from generate_large_pdf import generate_large_pdf
+from routes.main_routes import get_encoding, get_token_byte_lengths, token_span_offsets
+
+LARGE_PDF_PATH = "tests/sample_files/large_sample.pdf"
+
+
+def legacy_split(text, chunk_size):
+    # Previous implementation: a fresh encoding lookup for every encode/decode call,
+    # then every chunk encoded again to count tokens for embedding batches
+    tokens = tiktoken.encoding_for_model('gpt-3.5-turbo').encode(text)
+    chunks = [tiktoken.encoding_for_model('gpt-3.5-turbo').decode(tokens[i:i + chunk_size])
+              for i in range(0, len(tokens), chunk_size)]
+    token_counts = [len(tiktoken.encoding_for_model('gpt-3.5-turbo').encode(chunk)) for chunk in chunks]
+    return chunks, token_counts
+
+
+def cached_split(text, chunk_size):
+    tokens = get_encoding().encode(text)
+    offsets = token_span_offsets(text, tokens, chunk_size)
+    chunks = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    token_counts = [min(chunk_size, len(tokens) - i * chunk_size) for i in range(len(chunks))]
+    return chunks, token_counts
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=3000)
+    parser.add_argument('--scale', type=int, default=1)
+    args = parser.parse_args()
+
+    path = LARGE_PDF_PATH
+    if not os.path.exists(path):
+        path = os.path.join(tempfile.mkdtemp(), 'large_sample.pdf')
+        generate_large_pdf(path, num_pages=200)
+    reader = PdfReader(path)
+    text = ' '.join(page.extract_text() for page in reader.pages).replace('\n', ' ') * args.scale
+    # Warm both paths (tiktoken's own registry, the byte-length table) so only steady state is timed
+    get_token_byte_lengths()
+    assert legacy_split(text, args.chunk_size) == cached_split(text, args.chunk_size)
+
+    print(f"pages={len(reader.pages)} chars={len(text):,} tokens={len(get_encoding().encode(text)):,}")
+    for chunk_size in (args.chunk_size, 256, 32):
+        legacy = best_of(lambda: legacy_split(text, chunk_size), args.repeat)
+        cached = best_of(lambda: cached_split(text, chunk_size), args.repeat)
+        print(f"chunk_size={chunk_size:5}  legacy={legacy:8.2f}ms  cached+spans={cached:8.2f}ms  "
+              f"speedup={legacy / cached:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/bin/bash
+# Locust /ask comparison of the sync deployment (gunicorn, sync workers) and the async one (uvicorn asgi:app)
+# at 20 and 50 users, same worker count and data. Needs gunicorn, uvicorn, real API keys and at least one
+# processed document in DATA_DIR. Reports: tests/performance/report_{sync,async}_{20,50}_users.html (+ _stats.csv)
+set -e
+
+WORKERS=${WORKERS:-4}
+PORT=${PORT:-5000}
+RUN_TIME=${RUN_TIME:-2m}
+OUT=tests/performance
+
+run_locust() {
+    local mode=$1 users=$2
+    locust -f $OUT/locust_ask.py --headless -u "$users" -r 10 --run-time "$RUN_TIME" \
+        --host=http://127.0.0.1:$PORT --html $OUT/report_${mode}_${users}_users.html --csv $OUT/report_${mode}_${users}_users
+}
+
+serve_and_measure() {
+    local mode=$1
+    shift
+    "$@" &
+    local server=$!
+    sleep 5
+    run_locust "$mode" 20
+    run_locust "$mode" 50
+    kill $server
+    wait $server 2>/dev/null || true
+}
+
+serve_and_measure sync gunicorn -w "$WORKERS" -b 127.0.0.1:$PORT app:app
+serve_and_measure async uvicorn asgi:app --workers "$WORKERS" --host 127.0.0.1 --port $PORT
+
+echo "mode users requests failures median_ms p95_ms rps"
+for report in $OUT/report_{sync,async}_{20,50}_users_stats.csv; do
+    name=$(basename "$report" _users_stats.csv)
+    # Aggregated row: Type,Name,Request Count,Failure Count,Median,Average,Min,Max,Avg size,RPS,...,95%
+    tail -1 "$report" | awk -F, -v name="${name#report_}" '{split(name, n, "_"); print n[1], n[2], $3, $4, $5, $17, $10}'
+done
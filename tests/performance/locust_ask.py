@@ -0,0 +1,28 @@
+"""
+/ask load for comparing the sync (gunicorn app:app) and async (uvicorn asgi:app) deployments; see
+compare_sync_async.sh. Every request asks about a processed document with a question that has not been
+asked before, so each one is a real embedding + chat round trip (no cache hits). Upload a PDF first.
+"""
+import itertools
+import random
+
+from locust import HttpUser, between, task
+
+QUESTIONS = ['What is this document about?', 'Summarise the main findings.', 'What are the key terms defined?']
+_numbers = itertools.count()
+
+
+class AskUser(HttpUser):
+    wait_time = between(1, 2)
+
+    def on_start(self):
+        documents = self.client.get('/processed_documents').json()
+        self.documents = [(doc['id'], doc.get('processing', 'simple')) for doc in documents]
+        if not self.documents:
+            raise RuntimeError('No processed documents: upload a PDF before running the load test')
+
+    @task
+    def ask_question(self):
+        document_id, processing = random.choice(self.documents)
+        question = f"{random.choice(QUESTIONS)} ({next(_numbers)})"
+        self.client.post('/ask', json={'question': question, 'document_id': document_id, 'processing_mode': processing})
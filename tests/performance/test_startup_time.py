@@ -0,0 +1,80 @@
+"""
+Startup regression test: importing app.py and constructing the FlaskApp (what a gunicorn worker does
+before serving /) must stay under STARTUP_BUDGET_MS with a large corpus on disk, because partitions,
+the OpenAI client and PyPDF2 are only loaded on first use.
+
+    STARTUP_BUDGET_MS=1500 python -m pytest -q tests/performance/test_startup_time.py
+"""
+import json
+import os
+import pickle
+import subprocess
+import sys
+
+import faiss
+import numpy as np
+
+from routes.chunk_store import ChunkStore
+from routes.vector_index import new_index
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1500))
+CORPUS_CHUNKS = 200000
+CORPUS_DOCUMENTS = 200
+DIMENSION = 64
+
+# Runs in a fresh interpreter so module imports are part of the measurement
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed_ms = (time.perf_counter() - started) * 1000
+routes = app.app.view_functions['ask'].__self__
+report = {
+    'elapsed_ms': elapsed_ms,
+    'phases': app.app.config['STARTUP_TIMINGS'],
+    'loaded_partitions': [partition.name for partition in routes.vectors if partition.loaded],
+    'documents': len(routes.processed_documents),
+    'heavy_modules': [name for name in ('openai', 'promptlayer', 'PyPDF2') if name in sys.modules],
+}
+report['first_use_ntotal'] = routes.vectors['simple'].index.ntotal
+print('STARTUP ' + json.dumps(report))
+"""
+
+
+def build_corpus(data_dir):
+    chunks_per_document = CORPUS_CHUNKS // CORPUS_DOCUMENTS
+    store = ChunkStore(data_dir)
+    doc_index = {}
+    for n in range(CORPUS_DOCUMENTS):
+        document_id = f'doc-{n}'
+        ids = store.append([f'{document_id} chunk {i} ' * 8 for i in range(chunks_per_document)], document_id)
+        doc_index[document_id] = ids
+    with open(os.path.join(data_dir, 'document_id_to_ids.pkl'), 'wb') as f:
+        pickle.dump(doc_index, f)
+
+    index = new_index(DIMENSION)
+    vectors = np.random.default_rng(0).random((CORPUS_CHUNKS, DIMENSION), dtype='float32')
+    index.add_with_ids(vectors, np.arange(CORPUS_CHUNKS, dtype='int64'))
+    faiss.write_index(index, os.path.join(data_dir, 'faiss_index.index'))
+
+    documents = {f'doc-{n}': {'id': f'doc-{n}', 'processing': 'simple'} for n in range(CORPUS_DOCUMENTS)}
+    with open(os.path.join(data_dir, 'processed_documents.json'), 'w') as f:
+        json.dump(documents, f)
+
+
+def test_startup_stays_under_budget_with_large_corpus(tmp_path):
+    build_corpus(str(tmp_path))
+    env = dict(os.environ, DATA_DIR=str(tmp_path), PROMPTLAYER_API_KEY='x', OPENAI_API_KEY='x')
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.split('STARTUP ', 1)[1])
+    print(f"startup {report['elapsed_ms']:.0f} ms: {report['phases']}")
+
+    assert report['elapsed_ms'] < STARTUP_BUDGET_MS, report['phases']
+    assert report['documents'] == CORPUS_DOCUMENTS
+    # Nothing heavy happens before the first request that needs it...
+    assert report['loaded_partitions'] == []
+    assert report['heavy_modules'] == []
+    # ...and the corpus is all there when it does
+    assert report['first_use_ntotal'] == CORPUS_CHUNKS
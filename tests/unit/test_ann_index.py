@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from routes.main_routes import MainRoutes
+from routes.vector_index import build_index, extract_vectors, index_kind, recall_at_k
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    routes = MainRoutes(Flask(__name__))
+    rng = np.random.default_rng(0)
+    routes.save_embeddings(rng.random((600, 16), dtype='float32'), [f"a{i}" for i in range(600)], document_id='a')
+    routes.save_embeddings(rng.random((400, 16), dtype='float32'), [f"b{i}" for i in range(400)], document_id='b')
+    return routes
+
+
+@pytest.mark.parametrize('kind', ['ivf_flat', 'ivf_pq', 'hnsw'])
+def test_rebuild_preserves_ids_and_document_search(routes, kind):
+    flat_vectors, flat_ids = extract_vectors(routes.faiss_index)
+    routes.rebuild_index(kind=kind, nlist=8, pq_m=4)
+    assert index_kind(routes.faiss_index) == kind
+    assert sorted(extract_vectors(routes.faiss_index)[1].tolist()) == flat_ids.tolist()
+
+    query = flat_vectors[700]
+    hits = routes.search_document(routes.faiss_index, query, routes.document_id_to_ids['b'], top_k=5)
+    assert len(hits) == 5 and all(600 <= h < 1000 for h in hits)
+    if kind != 'ivf_pq':
+        assert hits[0] == 700
+
+    # Other workers load the promoted index, and new uploads are added to it
+    worker = MainRoutes(Flask(__name__))
+    assert index_kind(worker.faiss_index) == kind
+    worker.save_embeddings(np.ones((1, 16), dtype='float32'), ['c0'], document_id='c')
+    assert worker.faiss_index.ntotal == 1001
+    assert worker.search_document(worker.faiss_index, np.ones(16), [1000], top_k=5) == [1000]
+
+
+def test_recall_report(routes):
+    vectors, ids = extract_vectors(routes.faiss_index)
+    exact = build_index('flat', vectors, ids)
+    assert recall_at_k(exact, exact, vectors[:20], k=5)['recall'] == 1.0
+    report = recall_at_k(exact, build_index('ivf_flat', vectors, ids, nlist=8), vectors[:20], k=5)
+    assert 0.5 <= report['recall'] <= 1.0
+
+
+def test_upload_during_rebuild_waits_and_is_kept(routes):
+    uploads = []
+
+    def accept(vectors, ids, candidate):
+        # An upload from another thread while the candidate is evaluated must wait for the install
+        uploads.append(threading.Thread(target=routes.save_embeddings,
+                                        args=(np.ones((1, 16), dtype='float32'), ['c0']), kwargs={'document_id': 'c'}))
+        uploads[0].start()
+        uploads[0].join(timeout=0.2)
+        assert uploads[0].is_alive() and len(ids) == 1000
+        return True
+
+    routes.rebuild_index(kind='ivf_flat', nlist=8, accept=accept)
+    uploads[0].join(timeout=10)
+    assert index_kind(routes.faiss_index) == 'ivf_flat' and routes.faiss_index.ntotal == 1001
+    assert routes.document_id_to_ids['c'].tolist() == [1000]
+    assert index_kind(MainRoutes(Flask(__name__)).faiss_index) == 'ivf_flat'
+    assert routes.rebuild_index(kind='hnsw', accept=lambda *args: False) is None
+    assert index_kind(routes.faiss_index) == 'ivf_flat'
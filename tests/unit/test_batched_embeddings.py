@@ -0,0 +1,59 @@
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.main_routes as main_routes
+from routes.main_routes import MainRoutes
+
+
+class StubEmbeddingsClient:
+    """Stands in for the OpenAI client: records each embeddings call and echoes input lengths."""
+
+    def __init__(self):
+        self.calls = []
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, input, model, **kwargs):
+        self.calls.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0, 0.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    stub = StubEmbeddingsClient()
+    monkeypatch.setattr(main_routes, 'client', stub)
+    return stub
+
+
+def test_get_embeddings_batches_by_count(routes, stub_client):
+    texts = [f"chunk {i}" for i in range(7)]
+    matrix = routes.get_embeddings(texts, batch_size=3)
+    assert [len(call) for call in stub_client.calls] == [3, 3, 1]
+    assert matrix.shape == (7, 3)
+    assert matrix.dtype == np.float32
+    assert matrix[:, 0].tolist() == [float(len(t)) for t in texts]
+
+
+def test_get_embeddings_batches_by_token_budget(routes, stub_client):
+    texts = ["word " * 40] * 4
+    routes.get_embeddings(texts, batch_size=100, max_batch_tokens=90)
+    assert [len(call) for call in stub_client.calls] == [2, 2]
+
+
+def test_advanced_processing_embeds_in_one_call(routes, stub_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(routes, 'iter_pdf_pages', lambda path, **kwargs: iter(["token " * 3500, "token " * 3500]))
+    doc = tmp_path / 'doc.pdf'
+    doc.write_bytes(b'%PDF')
+    routes.summarize_document(str(doc), is_pdf=True, advanced=True, document_id='doc')
+    assert len(stub_client.calls) == 1
+    assert routes.faiss_index_advanced.ntotal == len(stub_client.calls[0]) == 3
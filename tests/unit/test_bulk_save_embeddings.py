@@ -0,0 +1,100 @@
+
+import os
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.main_routes as main_routes
+import routes.vector_index as vector_index
+import routes.vector_store as vector_store
+from routes.chunk_store import ChunkStore
+from routes.main_routes import MainRoutes
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+def test_save_embeddings_persists_once_per_document(routes, monkeypatch):
+    commits = []
+    real_write_many = vector_store.atomic_write_many
+    monkeypatch.setattr(vector_store, 'atomic_write_many', lambda items: commits.append(items) or real_write_many(items))
+
+    matrix = np.random.rand(50, 8).astype('float32')
+    routes.save_embeddings(matrix, [f"chunk {i}" for i in range(50)], document_id='doc', advanced=True)
+
+    assert len(commits) == 1
+    reloaded = main_routes.faiss.read_index(routes._p('faiss_index_advanced.index'))
+    assert reloaded.ntotal == 50
+    assert ChunkStore(routes.data_dir, '_advanced')[49] == 'chunk 49'
+
+
+def test_save_embeddings_appends_after_existing_ids(routes):
+    routes.save_embeddings(np.ones((2, 4), dtype='float32'), ['a', 'b'], document_id='first')
+    routes.save_embeddings(np.ones((3, 4), dtype='float32'), ['c', 'd', 'e'], document_id='second')
+    assert routes.id_to_document_id == {0: 'first', 1: 'first', 2: 'second', 3: 'second', 4: 'second'}
+    assert routes.faiss_index.ntotal == 5
+
+
+def test_failed_commit_leaves_disk_and_memory_untouched(routes, monkeypatch):
+    routes.save_embeddings(np.ones((2, 4), dtype='float32'), ['a', 'b'], document_id='first')
+    index_path = routes._p('faiss_index.index')
+    before = open(index_path, 'rb').read()
+
+    def crash(index):
+        raise IOError("disk full")
+    monkeypatch.setattr(main_routes.faiss, 'serialize_index', crash)
+    with pytest.raises(IOError, match='disk full'):
+        routes.save_embeddings(np.ones((3, 4), dtype='float32'), ['c', 'd', 'e'], document_id='second')
+
+    assert open(index_path, 'rb').read() == before
+    assert ChunkStore(routes.data_dir) == {0: 'a', 1: 'b'}
+    assert routes.faiss_index.ntotal == 2
+    assert routes.id_to_text == {0: 'a', 1: 'b'}
+    assert routes.id_to_document_id == {0: 'first', 1: 'first'}
+    assert not [name for name in os.listdir(routes.data_dir) if '.tmp.' in name]
+
+
+def test_document_index_tracks_saved_chunks(routes, tmp_path, monkeypatch):
+    routes.save_embeddings(np.ones((2, 4), dtype='float32'), ['a', 'b'], document_id='first')
+    routes.save_embeddings(np.ones((1, 4), dtype='float32'), ['c'], document_id='second')
+    routes.save_embeddings(np.ones((1, 4), dtype='float32'), ['d'], document_id='first')
+    assert routes.get_document_chunks('first', 'simple') == [(0, 'a'), (1, 'b'), (3, 'd')]
+
+    # Another worker loads the persisted index instead of rebuilding it
+    monkeypatch.setattr(vector_store, 'build_document_index', lambda mapping: mapping and pytest.fail('rebuilt index') or {})
+    worker = MainRoutes(Flask(__name__))
+    assert worker.document_id_to_ids['first'].tolist() == [0, 1, 3]
+    assert worker.get_document_chunks('second', 'simple') == [(2, 'c')]
+
+
+def test_document_index_rebuilt_for_legacy_data(routes):
+    routes.save_embeddings(np.ones((2, 4), dtype='float32'), ['a', 'b'], document_id='first')
+    os.remove(routes._p('document_id_to_ids.pkl'))
+    worker = MainRoutes(Flask(__name__))
+    assert worker.document_id_to_ids['first'].tolist() == [0, 1]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_searches_never_see_an_index_being_modified(routes, monkeypatch, mmap):
+    monkeypatch.setattr(vector_index, 'FAISS_MMAP', mmap)
+    routes.save_embeddings(np.eye(4, dtype='float32')[:2], ['a', 'b'], document_id='first')
+    live = {'index': routes.faiss_index, 'ntotal': 2, 'documents': ['first']}
+    real_write = vector_store.atomic_write_many
+
+    def commit(staged):
+        # Until the files are committed, searches use the untouched index and document index
+        assert routes.faiss_index is live['index'] and live['index'].ntotal == live['ntotal']
+        assert sorted(routes.document_id_to_ids) == live['documents']
+        real_write(staged)
+    monkeypatch.setattr(vector_store, 'atomic_write_many', commit)
+
+    routes.save_embeddings(np.eye(4, dtype='float32')[2:], ['c', 'd'], document_id='second')
+    assert routes.faiss_index.ntotal == 4 and live['index'].ntotal == 2
+    live.update(index=routes.faiss_index, ntotal=4, documents=['first', 'second'])
+    routes.vectors.delete_document('simple', 'first')
+    assert routes.faiss_index.ntotal == 2 and live['index'].ntotal == 4
+    assert routes.search_document(routes.faiss_index, np.eye(4)[3], routes.document_id_to_ids['second'], 1) == [3]
@@ -0,0 +1,72 @@
+import pickle
+
+import numpy as np
+from flask import Flask
+
+from routes.chunk_store import MISSING, ChunkStore
+from routes.main_routes import MainRoutes
+
+
+def test_append_and_lookup(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    assert store.append(['alpha', 'βeta'], 'doc-1').tolist() == [0, 1]
+    assert store.append(['gamma'], 'doc-2').tolist() == [2]
+    assert store[1] == 'βeta'
+    assert bytes(store.view(2)) == b'gamma'
+    assert store.document_of(2) == 'doc-2'
+    assert store.next_id == 3 and len(store) == 3
+
+
+def test_other_worker_sees_appends_after_refresh(tmp_path):
+    writer, reader = ChunkStore(str(tmp_path)), ChunkStore(str(tmp_path))
+    writer.append(['a'], 'doc')
+    assert 0 not in reader
+    reader.refresh()
+    assert reader[0] == 'a' and reader.document_of(0) == 'doc'
+
+
+def test_discard_keeps_ids_allocated(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.append(['a', 'b'], 'doc')
+    store.discard([1])
+    assert store == {0: 'a'}
+    assert store.records['doc'][1] == MISSING
+    assert store.append(['c'], 'doc').tolist() == [2]
+
+
+def test_torn_trailing_record_is_ignored_and_repaired(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.append(['a'], 'doc')
+    with open(store.idx_path, 'ab') as f:
+        f.write(b'\x00' * 5)
+    store.refresh()
+    assert store.next_id == 1
+    assert store.append(['b'], 'doc').tolist() == [1]
+    assert ChunkStore(str(tmp_path)) == {0: 'a', 1: 'b'}
+
+
+def test_legacy_pickles_are_imported_once(tmp_path, monkeypatch):
+    with open(tmp_path / 'id_to_text_advanced.pkl', 'wb') as f:
+        pickle.dump({0: 'first', 2: 'third'}, f)
+    with open(tmp_path / 'id_to_document_id_advanced.pkl', 'wb') as f:
+        pickle.dump({0: 'doc', 2: 'doc'}, f)
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+
+    routes = MainRoutes(Flask(__name__))
+    assert routes.id_to_text_advanced == {0: 'first', 2: 'third'}
+    assert routes.document_id_to_ids_advanced['doc'].tolist() == [0, 2]
+
+    routes.save_embeddings(np.ones((1, 4), dtype='float32'), ['fourth'], document_id='doc', advanced=True)
+    assert MainRoutes(Flask(__name__)).get_document_chunks('doc', 'advanced') == [(0, 'first'), (2, 'third'), (3, 'fourth')]
+
+
+def test_compact_keeps_ids_and_old_readers_valid(tmp_path):
+    store, reader = ChunkStore(str(tmp_path)), None
+    store.append(['dead' * 100, 'alive'], 'doc')
+    reader = ChunkStore(str(tmp_path))
+    store.discard([0])
+    assert store.compact() == 400
+    assert store == {1: 'alive'} and store.next_id == 2 and store.generation == 1
+    assert reader[1] == 'alive'  # still mapped to the previous generation
+    reader.refresh()
+    assert reader.blob_path == store.blob_path and reader == {1: 'alive'}
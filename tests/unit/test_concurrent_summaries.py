@@ -0,0 +1,69 @@
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import routes.main_routes as main_routes
+from routes.main_routes import MainRoutes
+
+
+class StubChatClient:
+    """Stands in for the OpenAI client: each completion sleeps briefly and tracks how many overlap."""
+
+    def __init__(self, reply_words=10):
+        self.reply_words = reply_words
+        self.prompts = []
+        self.timeouts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, temperature, timeout=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.prompts.append(messages[0]['content'])
+            self.timeouts.append(timeout)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        first_word = messages[0]['content'].split()[4]
+        reply = f"[{first_word}] " + "summary " * self.reply_words
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+def test_map_phase_is_concurrent_bounded_and_ordered(routes, monkeypatch):
+    stub = StubChatClient()
+    monkeypatch.setattr(main_routes, 'client', stub)
+    monkeypatch.setattr(main_routes, 'SUMMARY_CONCURRENCY', 3)
+    monkeypatch.setattr(main_routes, 'SUMMARY_TIMEOUT', 7)
+    chunks = [f"chunk{i} " + "text " * 20 for i in range(8)]
+
+    summaries = routes.summarize_chunks(chunks)
+
+    assert [summary.split()[0] for summary in summaries] == [f"[chunk{i}]" for i in range(8)]
+    assert stub.max_in_flight == 3
+    assert set(stub.timeouts) == {7}
+
+
+def test_reduce_is_hierarchical_when_summaries_overflow(routes, monkeypatch):
+    stub = StubChatClient(reply_words=150)
+    monkeypatch.setattr(main_routes, 'client', stub)
+    monkeypatch.setattr(main_routes, 'SUMMARY_REDUCE_MAX_TOKENS', 500)
+    content = "word " * 17000
+
+    routes.summarize_large_content(content)
+
+    # 6 map calls, then the ~900-token combined text is reduced in 2 parts, then the final call
+    assert len(stub.prompts) == 6 + 2 + 1
+    assert len(routes.encode_text(stub.prompts[-1])) <= 500 + 20
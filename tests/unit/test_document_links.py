@@ -0,0 +1,83 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import routes.document_links as document_links
+from routes.document_links import PatternMatcher, backfill_partition, document_patterns
+from routes.vector_store import VectorStore
+
+
+def test_matcher_finds_every_pattern_in_one_pass(monkeypatch):
+    monkeypatch.setattr(document_links, 'ahocorasick', None)
+    patterns = ['he', 'she', 'his', 'hers', 'Intro', 'Introduction', 'ion']
+    matcher = PatternMatcher(patterns)
+    assert matcher.engine == 'python'
+    assert matcher.find('ushers') == {'she', 'he', 'hers'}
+    assert matcher.find('An Introduction') == {'Intro', 'Introduction', 'ion'}
+
+    rng = random.Random(0)
+    for _ in range(200):
+        text = ''.join(rng.choice('hersiontI') for _ in range(40))
+        assert matcher.find(text) == {pattern for pattern in patterns if pattern in text}
+
+
+def legacy_store(tmp_path, texts):
+    """A partition whose chunks were written before they carried a document_id."""
+    vectors = VectorStore(str(tmp_path))
+    vectors.add('simple', np.ones((len(texts), 4), dtype='float32'), texts)
+    return vectors
+
+
+DOCUMENTS = [
+    {'id': 'Alpha Report-simple-2024', 'title': 'Alpha Report', 'filename': 'alpha.pdf', 'processing': 'simple'},
+    {'id': 'Beta Notes-simple-2024', 'title': 'Beta Notes', 'filename': 'beta.pdf', 'processing': 'simple'},
+    {'id': 'Alpha Report-simple-2025', 'title': 'Alpha Report', 'filename': 'alpha2.pdf', 'processing': 'simple'},
+]
+
+
+def test_backfill_links_strongest_unique_match_and_reports_ambiguous(tmp_path):
+    vectors = legacy_store(tmp_path, [
+        'page 1 of Beta Notes, see also alpha.pdf',   # title beats filename
+        'from beta.pdf',                               # filename only
+        'Alpha Report, page 3',                        # same title for two documents
+        'nothing to see here',
+    ])
+    report = tmp_path / 'ambiguous.jsonl'
+    progress = backfill_partition(vectors, 'simple', DOCUMENTS, str(tmp_path / 'state.json'), report_path=str(report))
+
+    assert progress == dict(progress, linked=2, ambiguous=1, unmatched=1, done=True, next_id=4)
+    assert vectors['simple'].documents == {0: 'Beta Notes-simple-2024', 1: 'Beta Notes-simple-2024'}
+    assert vectors['simple'].doc_index['Beta Notes-simple-2024'].tolist() == [0, 1]
+    entry = json.loads(report.read_text())
+    assert entry == {'vector_id': 2, 'kind': 'title', 'partition': 'simple',
+                     'candidates': ['Alpha Report-simple-2024', 'Alpha Report-simple-2025']}
+
+
+def test_backfill_resumes_after_interruption(tmp_path, monkeypatch):
+    vectors = legacy_store(tmp_path, [f'Beta Notes part {i}' for i in range(10)])
+    state = str(tmp_path / 'state.json')
+    real_assign = VectorStore.assign_documents
+    committed = []
+
+    def crash_on_second_batch(self, name, assignments):
+        if committed:
+            raise IOError('killed')
+        committed.append(sorted(assignments))
+        return real_assign(self, name, assignments)
+    monkeypatch.setattr(VectorStore, 'assign_documents', crash_on_second_batch)
+    with pytest.raises(IOError):
+        backfill_partition(vectors, 'simple', DOCUMENTS, state, batch_size=4)
+    assert json.load(open(state))['simple']['next_id'] == 4
+
+    monkeypatch.setattr(VectorStore, 'assign_documents', lambda self, name, assignments: committed.append(sorted(assignments))
+                        or real_assign(self, name, assignments))
+    progress = backfill_partition(VectorStore(str(tmp_path)), 'simple', DOCUMENTS, state, batch_size=4)
+    assert committed == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert progress['linked'] == 10 and progress['done']
+
+
+def test_short_patterns_are_ignored():
+    patterns = document_patterns([{'id': 'a-simple-x', 'title': 'AI', 'filename': 'x.pdf'}], min_length=3)
+    assert patterns == {}
@@ -0,0 +1,36 @@
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.vector_index as vector_index
+from routes.main_routes import MainRoutes
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+def test_search_document_returns_top_k_within_document(routes, monkeypatch):
+    # Euclidean geometry: the target chunks differ only in magnitude
+    monkeypatch.setattr(vector_index, 'FAISS_METRIC', 'l2')
+    rng = np.random.default_rng(0)
+    # A large "other" document sitting right on top of the query, and a small target document
+    query = np.zeros(8, dtype='float32')
+    other = rng.normal(0, 0.01, (500, 8)).astype('float32')
+    target = (np.arange(1, 7)[:, None] * np.ones((6, 8))).astype('float32')
+    routes.save_embeddings(other, [f"other {i}" for i in range(500)], document_id='other')
+    routes.save_embeddings(target, [f"target {i}" for i in range(6)], document_id='target')
+
+    chunk_ids = routes.document_id_to_ids['target']
+    hits = routes.search_document(routes.faiss_index, query, chunk_ids, top_k=5)
+    assert hits == chunk_ids[:5].tolist()
+
+
+def test_search_document_caps_k_at_document_size(routes):
+    routes.save_embeddings(np.eye(4, dtype='float32'), list('abcd'), document_id='doc')
+    routes.save_embeddings(np.eye(4, dtype='float32'), list('efgh'), document_id='small')
+    hits = routes.search_document(routes.faiss_index, np.ones(4, dtype='float32'), [4, 5], top_k=5)
+    assert sorted(hits) == [4, 5]
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.vector_index as vector_index
+from routes.main_routes import MainRoutes
+from routes.vector_index import extract_vectors, index_kind, index_metric
+
+
+@pytest.fixture
+def make_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return lambda: MainRoutes(Flask(__name__))
+
+
+def test_inner_product_ranks_by_cosine_not_magnitude(make_worker):
+    routes = make_worker()
+    assert index_metric(routes.faiss_index or vector_index.new_index(2)) == 'ip'
+    # Same direction as the query but 10x longer vs. a near neighbour in Euclidean terms
+    routes.save_embeddings(np.array([[10.0, 0.0], [0.6, 0.8]], dtype='float32'), ['same direction', 'close'], document_id='doc')
+    assert routes.search_document(routes.faiss_index, np.array([1.0, 0.1]), [0, 1], top_k=1) == [0]
+    assert np.allclose(np.linalg.norm(extract_vectors(routes.faiss_index)[0], axis=1), 1.0)
+
+
+def test_migrate_l2_index_keeps_ids_and_kind(make_worker, monkeypatch):
+    monkeypatch.setattr(vector_index, 'FAISS_METRIC', 'l2')
+    routes = make_worker()
+    rng = np.random.default_rng(0)
+    routes.save_embeddings(rng.random((300, 8), dtype='float32'), [str(i) for i in range(300)], document_id='doc')
+    routes.rebuild_index(kind='ivf_flat', nlist=4)
+    assert index_metric(routes.faiss_index) == 'l2'
+
+    assert routes.vectors.convert_metric('simple', 'ip') is not None
+    assert routes.vectors.convert_metric('simple', 'ip') is None
+    assert routes.vectors.convert_metric('advanced', 'ip') is None
+    worker = make_worker()
+    assert (index_kind(worker.faiss_index), index_metric(worker.faiss_index)) == ('ivf_flat', 'ip')
+    assert sorted(extract_vectors(worker.faiss_index)[1].tolist()) == list(range(300))
+    query = extract_vectors(worker.faiss_index)[0][0]
+    assert len(worker.search_document(worker.faiss_index, query, worker.document_id_to_ids['doc'], top_k=5)) == 5
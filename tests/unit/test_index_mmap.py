@@ -0,0 +1,41 @@
+import faiss
+import numpy as np
+
+import routes.vector_index as vector_index
+from routes.vector_index import build_index, index_kind, is_mapped, prepare_vectors, search_parameters
+from routes.vector_store import VectorStore
+
+
+def test_exact_layout_matches_index_flat():
+    rng = np.random.default_rng(0)
+    vectors, queries = rng.random((500, 16), dtype='float32'), rng.random((10, 16), dtype='float32')
+    ids = np.arange(500, dtype='int64')
+    exact = faiss.IndexIDMap(faiss.IndexFlatIP(16))
+    exact.add_with_ids(prepare_vectors(exact, vectors), ids)
+    index = build_index('flat', vectors, ids)
+
+    assert index_kind(index) == 'flat'
+    expected = exact.search(prepare_vectors(exact, queries), 5)[1]
+    assert (index.search(prepare_vectors(index, queries), 5, params=search_parameters(index))[1] == expected).all()
+
+
+def test_workers_map_the_index_and_writers_copy_it(tmp_path):
+    writer = VectorStore(str(tmp_path))
+    writer.add('simple', np.eye(4, dtype='float32'), ['a', 'b', 'c', 'd'], document_id='doc')
+    assert is_mapped(writer['simple'].index)
+
+    reader = VectorStore(str(tmp_path))
+    assert is_mapped(reader['simple'].index) and reader['simple'].index.ntotal == 4
+
+    # Adding to (or deleting from) a mapped index goes through a private copy, then maps the new file
+    reader.add('simple', np.ones((1, 4), dtype='float32'), ['e'], document_id='other')
+    reader.delete_document('simple', 'doc')
+    assert is_mapped(reader['simple'].index) and reader['simple'].index.ntotal == 1
+    assert VectorStore(str(tmp_path))['simple'].index.ntotal == 1
+
+
+def test_mmap_can_be_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, 'FAISS_MMAP', False)
+    store = VectorStore(str(tmp_path))
+    store.add('simple', np.eye(4, dtype='float32'), ['a', 'b', 'c', 'd'])
+    assert not is_mapped(VectorStore(str(tmp_path))['simple'].index)
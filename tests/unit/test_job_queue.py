@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import routes.jobs as jobs
+from routes.jobs import JobQueue
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_jobs_of_dead_workers_are_reported_failed(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    release = threading.Event()
+    live = queue.submit('simple', lambda progress: release.wait(10) and {'ok': True})
+    orphan = queue.submit('simple', lambda progress: {'ok': True})
+    time.sleep(0.2)
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET status = 'running', pid = ? WHERE id = ?", (dead_pid(), orphan))
+
+    job = queue.get(orphan)
+    assert job['status'] == 'failed' and 'exited before it finished' in job['error']
+    assert queue.get(live)['status'] == 'running'
+    release.set()
+    queue.executor.shutdown(wait=True)
+    assert queue.get(live)['status'] == 'done'
+
+
+def test_startup_and_deadline_fail_unfinished_jobs(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    with queue._connect() as conn:
+        conn.execute("INSERT INTO jobs (id, status, pid, created) VALUES ('crashed', 'queued', ?, ?)", (dead_pid(), time.time()))
+        conn.execute("INSERT INTO jobs (id, status, pid, created) VALUES ('slow', 'running', ?, ?)", (os.getpid(), time.time() - 60))
+
+    JobQueue(str(tmp_path / 'jobs.db'))  # a restarted worker sweeps jobs left by dead ones
+    with queue._connect() as conn:
+        assert conn.execute("SELECT status FROM jobs WHERE id = 'crashed'").fetchone() == ('failed',)
+    assert queue.get('slow')['status'] == 'running'
+    monkeypatch.setattr(jobs, 'INGEST_JOB_TIMEOUT', 30)
+    assert 'did not finish within 30 seconds' in queue.get('slow')['error']
@@ -0,0 +1,54 @@
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.main_routes as main_routes
+from routes.main_routes import MainRoutes
+
+
+@pytest.fixture
+def make_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return lambda: MainRoutes(Flask(__name__))
+
+
+def count_index_reads(monkeypatch):
+    calls = []
+    real_read_index = main_routes.faiss.read_index
+    monkeypatch.setattr(main_routes.faiss, 'read_index', lambda *a: calls.append(a) or real_read_index(*a))
+    return calls
+
+
+def test_refresh_reloads_nothing_when_unchanged(make_worker, monkeypatch):
+    writer = make_worker()
+    writer.save_embedding(np.ones(8, dtype='float32'), 'chunk', document_id='doc')
+    reader = make_worker()
+
+    reads = count_index_reads(monkeypatch)
+    reader._refresh_if_stale()
+    reader._refresh_if_stale()
+    assert reads == []
+
+
+def test_refresh_reloads_only_changed_partition(make_worker, monkeypatch):
+    writer = make_worker()
+    reader = make_worker()
+    writer.save_embedding(np.ones(8, dtype='float32'), 'chunk', advanced=True, document_id='doc')
+
+    reads = count_index_reads(monkeypatch)
+    reader._refresh_if_stale()
+    assert [a[0].endswith('faiss_index_advanced.index') for a in reads] == [True]
+    assert reader.faiss_index_advanced.ntotal == 1
+    assert reader.id_to_document_id_advanced == {0: 'doc'}
+
+
+def test_writer_does_not_reload_its_own_write(make_worker, monkeypatch):
+    writer = make_worker()
+    writer.processed_documents['doc'] = {'id': 'doc', 'processing': 'simple'}
+    writer.save_processed_documents()
+    writer.save_embedding(np.ones(8, dtype='float32'), 'chunk', document_id='doc')
+
+    reads = count_index_reads(monkeypatch)
+    writer._refresh_if_stale()
+    assert reads == []
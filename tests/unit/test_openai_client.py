@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import openai
+import pytest
+
+import routes.openai_client as openai_client
+
+COMPLETION = {'id': 'x', 'object': 'chat.completion', 'created': 0, 'model': 'm', 'choices': [
+    {'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'Hello.'}}]}
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """Local stand-in for the API: answers each request with the next scripted (status, headers, delay)."""
+
+    daemon_threads = True
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = self.in_flight = self.peak = 0
+        self.counter_lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+
+    def next_reply(self):
+        with self.counter_lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return self.script.pop(0) if len(self.script) > 1 else self.script[0]
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        status, headers, delay = self.server.next_reply()
+        time.sleep(delay)
+        body = json.dumps(COMPLETION if status == 200 else {'error': {'message': f'status {status}'}}).encode()
+        try:
+            self.send_response(status)
+            for name, value in dict({'Content-Type': 'application/json', 'Content-Length': str(len(body))}, **headers).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client gave up (timeout test)
+        finally:
+            with self.server.counter_lock:
+                self.server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setattr(openai_client, 'OPENAI_BACKOFF_BASE', 0.01)
+    servers = []
+
+    def start(*script):
+        server = FakeOpenAI(script)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        api = openai.OpenAI(api_key='test', base_url=f'http://127.0.0.1:{server.server_port}/v1', max_retries=0)
+        return server, api
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def answer(api, **kwargs):
+    response = openai_client.call('answer', api.chat.completions.create, model='m',
+                                  messages=[{'role': 'user', 'content': 'Hi'}], **kwargs)
+    return response.choices[0].message.content
+
+
+def test_rate_limits_and_server_errors_are_retried(serve):
+    server, api = serve((429, {'Retry-After': '0'}, 0), (503, {}, 0), (200, {}, 0))
+    assert answer(api) == 'Hello.'
+    assert server.requests == 3
+
+
+def test_retries_are_bounded_and_client_errors_are_final(serve, monkeypatch):
+    monkeypatch.setattr(openai_client, 'OPENAI_MAX_RETRIES', 2)
+    server, api = serve((500, {}, 0))
+    with pytest.raises(openai.InternalServerError):
+        answer(api)
+    assert server.requests == 3
+
+    server, api = serve((400, {}, 0))
+    with pytest.raises(openai.BadRequestError):
+        answer(api)
+    assert server.requests == 1
+
+
+def test_operation_timeout_bounds_a_slow_call(serve):
+    server, api = serve((200, {}, 2))
+    started = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        answer(api, timeout=0.2)
+    assert time.monotonic() - started < 1.5 and server.requests == 1
+
+
+def test_backoff_is_jittered_and_honours_retry_after():
+    request = httpx.Request('POST', 'http://api/v1/chat/completions')
+    limited = openai.RateLimitError('slow down', response=httpx.Response(429, headers={'Retry-After': '3'}, request=request), body=None)
+    delays = {openai_client.retry_delay(limited, 0) for _ in range(20)}
+    assert delays == {3.0}
+    busy = openai.InternalServerError('busy', response=httpx.Response(503, request=request), body=None)
+    delays = [openai_client.retry_delay(busy, 3) for _ in range(50)]
+    assert all(0 <= delay <= openai_client.OPENAI_BACKOFF_BASE * 8 for delay in delays) and len(set(delays)) > 1
+    assert openai_client.retry_delay(busy, openai_client.OPENAI_MAX_RETRIES) is None
+
+
+def test_concurrency_is_capped_per_api(serve, monkeypatch):
+    monkeypatch.setitem(openai_client._semaphores, 'chat', threading.BoundedSemaphore(2))
+    server, api = serve((200, {}, 0.2))
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        assert list(executor.map(lambda _: answer(api), range(6))) == ['Hello.'] * 6
+    assert server.peak == 2
@@ -0,0 +1,54 @@
+
+import pytest
+from flask import Flask
+from fpdf import FPDF
+
+import routes.main_routes as main_routes
+import routes.pdf_extract as pdf_extract
+from routes.main_routes import MainRoutes
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    pdf = FPDF()
+    for i in range(12):
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+        pdf.cell(200, 10, txt=f"Lecture {i + 1}: neural networks and backpropagation.", ln=True)
+    path = str(tmp_path / 'lectures.pdf')
+    pdf.output(path)
+    return path
+
+
+def test_parallel_extraction_matches_serial_order(pdf_path, monkeypatch):
+    serial = list(pdf_extract.iter_page_texts(pdf_path))
+    monkeypatch.setattr(pdf_extract, 'PDF_PARALLEL_MIN_PAGES', 2)
+    monkeypatch.setattr(pdf_extract, 'PDF_EXTRACT_PROCESSES', 2)
+    monkeypatch.setattr(pdf_extract, 'PDF_PAGES_PER_TASK', 5)
+    parallel = list(pdf_extract.iter_page_texts(pdf_path))
+    assert parallel == serial
+    # Workers must not be forked from the (threaded) app process
+    assert pdf_extract._pool_context().get_start_method() in ('forkserver', 'spawn')
+    assert [text.split(':')[0] for text in serial] == [f"Lecture {i + 1}" for i in range(12)]
+
+
+def test_streamed_chunks_cover_the_whole_text(routes, pdf_path):
+    pages = list(routes.iter_pdf_pages(pdf_path))
+    chunks = list(routes.iter_text_chunks(iter(pages), chunk_size=25))
+    assert ''.join(chunk for chunk, _ in chunks) == ' '.join(pages)
+    assert all(0 < n_tokens <= 25 for _, n_tokens in chunks)
+    assert len(chunks) >= len(' '.join(pages)) // 200
+
+
+def test_reader_is_parsed_once_per_upload(routes, pdf_path, monkeypatch):
+    reader = routes.open_pdf(pdf_path)
+    monkeypatch.setattr(main_routes, 'PdfReader', lambda path: pytest.fail('PDF parsed again'))
+    monkeypatch.setattr(pdf_extract, 'PdfReader', lambda path: pytest.fail('PDF parsed again'))
+    assert routes.extract_title(pdf_path, 'lectures.pdf', reader=reader).startswith('Lecture 1')
+    assert 'Lecture 12' in routes.pdf_to_text(pdf_path, reader=reader)
@@ -0,0 +1,71 @@
+
+import sqlite3
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import routes.cache as cache_module
+from routes.cache import AnswerCache, EmbeddingCache
+from routes.main_routes import MainRoutes
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+def test_repeated_question_embeds_once(routes, monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes, 'get_embedding', lambda text: calls.append(text) or np.ones(4, dtype='float32'))
+    for question in ["What is AI?", "what is   ai?", " WHAT IS AI? "]:
+        assert routes.get_query_embedding(question).tolist() == [1.0] * 4
+    assert calls == ["What is AI?"]
+    assert routes.embedding_cache.stats()['hits'] == 2
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put('a', 'm', [1.0])
+    cache.put('b', 'm', [2.0])
+    cache.get('a', 'm')
+    cache.put('c', 'm', [3.0])
+    assert cache.get('b', 'm') is None
+    assert cache.get('a', 'm').tolist() == [1.0]
+    assert cache.stats()['entries'] == 2
+
+
+def test_shared_tier_serves_other_workers(tmp_path):
+    db_path = str(tmp_path / 'query_cache.db')
+    EmbeddingCache(db_path=db_path).put('What is AI?', 'm', np.arange(3, dtype='float32'))
+    other_worker = EmbeddingCache(db_path=db_path)
+    assert other_worker.get('what is ai?', 'm').tolist() == [0.0, 1.0, 2.0]
+    assert other_worker.get('what is ai?', 'other-model') is None
+    stats = other_worker.stats()
+    assert (stats['disk_hits'], stats['misses']) == (1, 1)
+
+
+def test_shared_tier_drops_expired_and_least_recently_used_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, 'SQLITE_TIER_PURGE_INTERVAL', 0)
+    db_path = str(tmp_path / 'query_cache.db')
+    # A file written before the tier was bounded: no last_used column, one row
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('CREATE TABLE embeddings (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+        conn.execute("INSERT INTO embeddings VALUES ('legacy', x'0000803f', NULL)")
+    embeddings = EmbeddingCache(db_path=db_path, max_disk_entries=3)
+    for i, question in enumerate(['a', 'b', 'c']):
+        embeddings.put(question, 'm', [float(i)])
+    assert EmbeddingCache(db_path=db_path).get('a', 'm').tolist() == [0.0]  # disk hit refreshes 'a'
+    embeddings.put('d', 'm', [3.0])
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM embeddings').fetchone() == (3,)
+        assert conn.execute("SELECT COUNT(*) FROM embeddings WHERE key = 'legacy'").fetchone() == (0,)
+    other_worker = EmbeddingCache(db_path=db_path)
+    assert other_worker.get('b', 'm') is None
+    assert [other_worker.get(q, 'm').tolist() for q in 'acd'] == [[0.0], [2.0], [3.0]]
+
+    AnswerCache(db_path=db_path, ttl=-1).put('old', 'Already expired.')
+    AnswerCache(db_path=db_path, ttl=60).put('new', 'Fresh answer.')
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT key FROM answers').fetchall() == [('new',)]
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import routes.openai_client as openai_client
+import routes.rate_limit as rate_limit
+from routes.main_routes import CHAT_MAX_TOKENS, MainRoutes
+from routes.rate_limit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_buckets_limit_requests_and_tokens_and_refill(tmp_path):
+    clock = Clock()
+    limiter = RateLimiter(str(tmp_path / 'rate.json'), {'chat': (60, 6000)}, interactive_reserve=0, clock=clock)
+    assert [limiter.try_take('chat', 100) for _ in range(60)] == [0] * 60
+    assert limiter.try_take('chat', 100) == pytest.approx(1.0)  # 60/min: one request back per second
+    clock.now += 1
+    assert limiter.try_take('chat', 100) == 0
+
+    clock.now += 60
+    assert limiter.try_take('chat', 5000) == 0
+    assert limiter.try_take('chat', 1500) == pytest.approx(5.0)  # 500 tokens short at 100 tokens/s
+    assert limiter.try_take('embeddings', 10 ** 9) == 0  # no limits configured for this API
+
+
+def test_background_calls_leave_the_reserve_to_interactive_ones(tmp_path):
+    clock = Clock()
+    limiter = RateLimiter(str(tmp_path / 'rate.json'), {'chat': (10, 0)}, interactive_reserve=0.2, clock=clock)
+    assert [limiter.try_take('chat', priority='background') for _ in range(8)] == [0] * 8
+    assert limiter.try_take('chat', priority='background') > 0
+    assert [limiter.try_take('chat', priority='interactive') for _ in range(2)] == [0, 0]
+    assert limiter.try_take('chat', priority='interactive') > 0
+
+
+def take_all(path, results):
+    limiter = RateLimiter(path, {'embeddings': (100, 0)}, interactive_reserve=0, clock=lambda: 1000.0)
+    results.put(sum(limiter.try_take('embeddings') == 0 for _ in range(100)))
+    results.close()
+    results.join_thread()  # flush before skipping interpreter teardown
+    os._exit(0)
+
+
+@pytest.mark.skipif(rate_limit.fcntl is None, reason='needs fcntl to lock across processes')
+def test_worker_processes_share_one_budget(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [context.Process(target=take_all, args=(str(tmp_path / 'rate.json'), results)) for _ in range(4)]
+    for process in workers:
+        process.start()
+    granted = [results.get(timeout=30) for _ in workers]
+    for process in workers:
+        process.join(timeout=30)
+    assert sum(granted) == 100
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.taken = []
+
+    def acquire(self, api, tokens=0, priority='background'):
+        self.taken.append((api, tokens, priority))
+        return 0.0
+
+
+def test_routes_count_tokens_and_prioritise_questions(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    routes = MainRoutes(Flask(__name__))
+    assert openai_client.rate_limiter is routes.rate_limiter
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(openai_client, 'rate_limiter', limiter)
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='Done.'))])
+    embedding = SimpleNamespace(data=[SimpleNamespace(index=0, embedding=[0.5] * 4)])
+    monkeypatch.setattr('routes.main_routes.client', SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: completion)),
+        embeddings=SimpleNamespace(create=lambda **kwargs: embedding)))
+
+    prompt = 'Summarize this text about artificial intelligence.'
+    routes.generate_summary(prompt)
+    routes.get_embedding(prompt)
+    routes.get_query_embedding('What is AI?')
+    routes.generate_answer_from_prompt(prompt)
+    summary_tokens = len(routes.encode_text(f"Summarize the following text:\n\n{prompt}\n\nSummary:"))
+    assert limiter.taken == [
+        ('chat', summary_tokens + CHAT_MAX_TOKENS, 'background'),
+        ('embeddings', len(routes.encode_text(prompt)), 'background'),
+        ('embeddings', len(routes.encode_text('What is AI?')), 'interactive'),
+        ('chat', len(routes.encode_text(prompt)) + CHAT_MAX_TOKENS, 'interactive'),
+    ]
+
+
+def test_async_acquire_keeps_the_file_lock_off_the_event_loop(tmp_path, monkeypatch):
+    limiter = RateLimiter(str(tmp_path / 'rate.json'), {'chat': (60, 0)})
+    threads = []
+    real_take = limiter.try_take
+    monkeypatch.setattr(limiter, 'try_take', lambda *args: threads.append(threading.get_ident()) or real_take(*args))
+    assert asyncio.run(limiter.acquire_async('chat', priority='interactive')) == 0
+    assert threads and threading.get_ident() not in threads
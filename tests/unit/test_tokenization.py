@@ -0,0 +1,34 @@
+
+import pytest
+from flask import Flask
+
+import routes.main_routes as main_routes
+from routes.main_routes import MainRoutes, get_encoding
+
+
+@pytest.fixture
+def routes(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    return MainRoutes(Flask(__name__))
+
+
+def test_encoding_is_built_once(routes, monkeypatch):
+    get_encoding()
+    monkeypatch.setattr(main_routes.tiktoken, 'encoding_for_model', lambda model: pytest.fail('rebuilt encoding'))
+    assert routes.decode_tokens(routes.encode_text("cached encoding")) == "cached encoding"
+
+
+@pytest.mark.parametrize('text', [
+    "The quick brown fox jumps over the lazy dog. " * 300,
+    "Ünïcödé text with 日本語 and emoji 🎉🎉 mixed in. " * 200,
+])
+def test_token_span_chunks_match_decoded_chunks(routes, text):
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    chunks = routes.split_text_into_chunks(text, chunk_size=97)
+
+    assert ''.join(chunks) == text
+    assert len(chunks) == -(-len(tokens) // 97)
+    decoded = [encoding.decode(tokens[i:i + 97]) for i in range(0, len(tokens), 97)]
+    # Identical wherever a token boundary does not split a multi-byte character
+    assert [a for a, b in zip(chunks, decoded) if a != b and '�' not in b] == []
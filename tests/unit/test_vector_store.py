@@ -0,0 +1,58 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from routes.vector_index import build_index, extract_vectors, remove_ids
+from routes.vector_store import VectorStore
+
+
+def test_named_partitions_share_one_api(tmp_path):
+    changed = []
+    store = VectorStore(str(tmp_path), partitions=('simple', 'advanced', 'research'), on_change=changed.append)
+    store.load()
+    store.add('research', np.eye(3, dtype='float32'), ['a', 'b', 'c'], document_id='paper')
+    store.add('simple', np.eye(3, dtype='float32')[:1], ['x'], document_id='note')
+
+    assert changed == ['research', 'simple']
+    assert os.path.exists(tmp_path / 'faiss_index_research.index')
+    assert store['research'].chunks == {0: 'a', 1: 'b', 2: 'c'}
+    assert store['research'].doc_index['paper'].tolist() == [0, 1, 2]
+    assert store['simple'].index.ntotal == 1
+    assert store.partition_for('unknown mode').name == 'simple'
+
+    other = VectorStore(str(tmp_path), partitions=('simple', 'research'))
+    other.load(['research'])
+    assert other['research'].index.ntotal == 3 and not other['simple'].loaded
+
+
+def test_reload_remaps_chunks_in_place(tmp_path):
+    writer, reader = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))
+    writer.load()
+    reader.load()
+    chunks = reader['advanced'].chunks
+    writer.add('advanced', np.ones((2, 4), dtype='float32'), ['a', 'b'], document_id='doc')
+    reader.load(['advanced'])
+    assert reader['advanced'].chunks is chunks and chunks == {0: 'a', 1: 'b'}
+    assert reader['advanced'].documents == {0: 'doc', 1: 'doc'}
+
+
+@pytest.mark.parametrize('kind', ['flat', 'ivf_flat', 'ivf_pq'])
+def test_removing_early_ids_keeps_ivf_labels_and_extraction_consistent(kind):
+    rng = np.random.default_rng(0)
+    vectors, ids = rng.random((600, 16), dtype='float32'), np.arange(100, 700, dtype='int64')
+    index = build_index(kind, vectors, ids, nlist=4, pq_m=4, metric='l2')
+    stored, _ = extract_vectors(index)
+    dropped = np.array([100, 101, 350, 699], dtype='int64')
+    assert remove_ids(index, dropped) == 4
+
+    kept = ~np.isin(ids, dropped)
+    extracted, extracted_ids = extract_vectors(index)
+    assert extracted_ids.tolist() == ids[kept].tolist()
+    assert np.allclose(extracted, stored[kept])
+    # Search still maps each vector to its own id, and extraction left the live index removable
+    if kind != 'ivf_pq':
+        assert index.search(vectors[kept][:50], 1)[1][:, 0].tolist() == ids[kept][:50].tolist()
+    assert faiss.extract_index_ivf(index.index).direct_map.type == faiss.DirectMap.NoMap
+    assert remove_ids(index, ids[kept][:1]) == 1